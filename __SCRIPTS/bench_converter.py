@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Converter benchmark over recorded HTML fixtures
+
+The fixtures are site-like pages rendered from the Markdown corpus by
+html_fixtures.py and recorded under bench_fixtures/ the first time they are
+needed, so later runs (and later commits) convert exactly the same bytes even
+after the corpus is regenerated:
+
+    small   sculthorp
+    medium  report500
+    large   wickland, silver_birch (all 12 volumes in one page)
+
+Each phase of html_to_markdown is timed separately (best and median of
+--repeat runs) and its peak traced memory measured in one more run under
+tracemalloc:
+
+    tokenize  bare html.parser pass over the page, for reference
+    stream    StreamingConverter: tree building, round trip and node walk
+    split     split_lines()
+    classify  classify_lines()
+    toc       analyze_headings()
+    render    render_lines()
+    cleanup   finish_markdown()
+    total     html_to_markdown() end to end
+
+Results are written as JSON to bench_results/converter-<commit>.json (or
+--output); --compare prints the change against an earlier results file.
+
+    python __SCRIPTS/bench_converter.py --repeat 5 --compare bench_results/converter-f1c0b6a.json
+"""
+
+import argparse
+import hashlib
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from pathlib import Path
+
+from heading_analysis import analyze_headings
+from html_fixtures import REPO_ROOT, markdown_to_html
+from line_classifier import classify_lines
+from markdown_converter import (StreamingConverter, finish_markdown, html_to_markdown,
+                                render_lines, split_lines)
+
+FIXTURE_DIR = REPO_ROOT / "bench_fixtures"
+RESULTS_DIR = REPO_ROOT / "bench_results"
+
+# name -> (size class, Markdown files the page is rendered from)
+FIXTURES = {
+    'sculthorp': ('small', ["sculthorp_volumes/sculthorp.md"]),
+    'report500': ('medium', ["report500_volumes/report500.md"]),
+    'wickland': ('large', ["wickland_volumes/wickland.md"]),
+    'silver_birch': ('large', [f"silver_birch_volumes/volume{n:02d}.md" for n in range(1, 13)]),
+}
+
+PHASES = ['tokenize', 'stream', 'split', 'classify', 'toc', 'render', 'cleanup', 'total']
+
+
+def load_fixture(name, refresh=False):
+    """HTML of a fixture, recording it from the corpus if not yet on disk"""
+    path = FIXTURE_DIR / f"{name}.html"
+    if refresh or not path.exists():
+        _, sources = FIXTURES[name]
+        markdown_text = '\n\n'.join((REPO_ROOT / source).read_text(encoding='utf-8')
+                                    for source in sources)
+        FIXTURE_DIR.mkdir(exist_ok=True)
+        path.write_text(markdown_to_html(markdown_text, name), encoding='utf-8')
+        print(f"Recorded {path.relative_to(REPO_ROOT)}")
+    return path.read_text(encoding='utf-8')
+
+
+def tokenize(html):
+    parser = HTMLParser(convert_charrefs=False)
+    parser.feed(html)
+    parser.close()
+
+
+def stream(html):
+    converter = StreamingConverter()
+    converter.feed(html)
+    converter.close()
+    return converter.text() or ''
+
+
+def phase_calls(html):
+    """phase -> zero-argument callable running just that phase on html
+
+    The inputs of each phase are computed up front, so a phase's time and
+    memory do not include the phases before it.
+    """
+    text = stream(html)
+    stripped_lines = split_lines(text)
+    kinds = classify_lines(stripped_lines)
+    analysis = analyze_headings(stripped_lines, kinds)
+    markdown_lines = render_lines(stripped_lines, kinds, analysis)
+    return {
+        'tokenize': lambda: tokenize(html),
+        'stream': lambda: stream(html),
+        'split': lambda: split_lines(text),
+        'classify': lambda: classify_lines(stripped_lines),
+        'toc': lambda: analyze_headings(stripped_lines, kinds),
+        'render': lambda: render_lines(stripped_lines, kinds, analysis),
+        'cleanup': lambda: finish_markdown(markdown_lines),
+        'total': lambda: html_to_markdown(html),
+    }
+
+
+def measure(call, repeat):
+    """Best and median seconds over repeat runs, then the traced peak"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'best_s': min(times), 'median_s': statistics.median(times), 'peak_bytes': peak}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_fixture(name, html, repeat):
+    output = html_to_markdown(html)
+    stripped_lines = split_lines(stream(html))
+    return {
+        'size_class': FIXTURES[name][0],
+        'html_bytes': len(html.encode('utf-8')),
+        'html_sha256': hashlib.sha256(html.encode('utf-8')).hexdigest(),
+        'markdown_bytes': len(output.encode('utf-8')),
+        'lines': len(stripped_lines),
+        'phases': {phase: measure(call, repeat) for phase, call in phase_calls(html).items()},
+    }
+
+
+def print_results(results):
+    print(f"{'fixture':<14} {'phase':<9} {'best ms':>9} {'median ms':>10} {'peak MB':>8}")
+    for name, fixture in results['fixtures'].items():
+        for phase, m in fixture['phases'].items():
+            print(f"{name:<14} {phase:<9} {m['best_s'] * 1000:9.2f} {m['median_s'] * 1000:10.2f} "
+                  f"{m['peak_bytes'] / 2**20:8.2f}")
+
+
+def print_comparison(old, new):
+    """Best-time and peak-memory ratios of new against old, per phase"""
+    print(f"\nAgainst {old.get('commit')} ({old.get('timestamp')}):")
+    print(f"{'fixture':<14} {'phase':<9} {'time':>8} {'memory':>8}")
+    for name, fixture in new['fixtures'].items():
+        old_fixture = old['fixtures'].get(name)
+        if old_fixture is None:
+            continue
+        if old_fixture['html_sha256'] != fixture['html_sha256']:
+            print(f"{name:<14} fixture differs, not compared")
+            continue
+        for phase, m in fixture['phases'].items():
+            before = old_fixture['phases'].get(phase)
+            if before is None:
+                continue
+            time_ratio = m['best_s'] / before['best_s'] if before['best_s'] else float('nan')
+            memory_ratio = (m['peak_bytes'] / before['peak_bytes']
+                            if before['peak_bytes'] else float('nan'))
+            flag = "  <- slower" if time_ratio > 1.10 else ""
+            print(f"{name:<14} {phase:<9} {time_ratio:7.2f}x {memory_ratio:7.2f}x{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark html_to_markdown phase by phase")
+    parser.add_argument('--fixtures', nargs='+', choices=sorted(FIXTURES), default=list(FIXTURES))
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per phase")
+    parser.add_argument('--refresh', action='store_true',
+                        help="re-record the fixtures from the current corpus")
+    parser.add_argument('--output', type=Path,
+                        help="results file (default bench_results/converter-<commit>.json)")
+    parser.add_argument('--compare', type=Path, help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'fixtures': {},
+    }
+    for name in args.fixtures:
+        html = load_fixture(name, refresh=args.refresh)
+        results['fixtures'][name] = run_fixture(name, html, args.repeat)
+    print_results(results)
+
+    output = args.output or RESULTS_DIR / f"converter-{commit or 'unknown'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
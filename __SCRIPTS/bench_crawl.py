@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark the crawl engine against a local stand-in server
+
+Every page of the catalog (catalog.py) is pointed at a local server that
+sleeps --latency seconds per request, then fetched once sequentially and
+once per --per-host setting through the crawl engine. Each page is converted with html_to_markdown, nothing is written.
+--fail-first makes every page answer 503 that many times before succeeding,
+which the shared HTTP client retries transparently.
+
+    python __SCRIPTS/bench_crawl.py --latency 0.2 --per-host 1 2 4 8
+"""
+
+import argparse
+import contextlib
+import html
+import io
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import catalog
+from crawl_engine import run_crawl
+from http_client import configure_client, fetch_html
+from markdown_converter import html_to_markdown
+from standin_server import StandInServer
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def sample_page(markdown_file):
+    """Build a site-like page from one of the generated Markdown files"""
+    parts = ['<html><head><meta charset="utf-8"></head><body><div id="content">']
+    for line in markdown_file.read_text(encoding='utf-8').split('\n'):
+        if line.startswith('#'):
+            text = html.escape(line.lstrip('#').strip())
+            parts.append(f'<font color="#0064ff" size="4">{text}</font><br>')
+        else:
+            parts.append(f'{html.escape(line)}<br>')
+    parts.append('</div></body></html>')
+    return '\n'.join(parts)
+
+
+def all_jobs(base_url):
+    """Every catalog's jobs, re-pointed at the stand-in server"""
+    return [job._replace(url=base_url + urlsplit(job.url).path) for job in catalog.build_jobs()]
+
+
+def convert(job, html_text):
+    return bool(html_to_markdown(html_text))
+
+
+def run_sequential(jobs):
+    for job in jobs:
+        convert(job, fetch_html(job.url))
+    return len(jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the crawl engine")
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help="seconds the stand-in server sleeps per request")
+    parser.add_argument('--per-host', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="per-host concurrency settings to measure")
+    parser.add_argument('--sample', default="sculthorp_volumes/sculthorp.md",
+                        help="Markdown file used to build the served page")
+    parser.add_argument('--fail-first', type=int, default=0,
+                        help="503 responses each page returns before succeeding")
+    args = parser.parse_args()
+
+    page = sample_page(REPO_ROOT / args.sample)
+    with StandInServer({}, default_page=page, latency=args.latency,
+                       fail_first=args.fail_first) as server:
+        jobs = all_jobs(server.base_url)
+        print(f"{len(jobs)} pages, {len(page.encode('utf-8')) / 1024:.0f} KB each, "
+              f"{args.latency * 1000:.0f} ms injected latency")
+
+        runs = [("sequential", run_sequential)]
+        for per_host in args.per_host:
+            runs.append((f"crawl per_host={per_host}",
+                         lambda jobs, n=per_host: run_crawl(jobs, convert, per_host=n)))
+
+        baseline = None
+        for name, run in runs:
+            # Fresh pool (and fresh 503 budget) per run so results are comparable
+            client = configure_client(pool_size=max(args.per_host), backoff=0.05)
+            server.reset_failures()
+            requests_before = server.request_count
+            connections_before = server.connection_count
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                pages = run(jobs)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{name:<22} {pages:>3} pages  {elapsed:7.2f} s  "
+                  f"{pages / elapsed:6.1f} pages/s  x{baseline / elapsed:.2f}  "
+                  f"{server.request_count - requests_before} requests over "
+                  f"{server.connection_count - connections_before} connections")
+            print(f"{'':<22} {client.summary()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Check and time link discovery against a local mirror of the site
+
+html_fixtures.site_mirror() is served by a stand-in server with --latency
+seconds per request, and site_crawler.py crawls it from the site index once
+per --per-host setting. Every run must find exactly the catalog's pages
+plus the mirror's one extra title, fetching each page once; --max-pages and
+--max-depth runs show the limits holding.
+
+    python __SCRIPTS/bench_discovery.py --latency 0.05 --per-host 1 4
+"""
+
+import argparse
+import contextlib
+import io
+import time
+from urllib.parse import urlsplit
+
+import catalog
+from html_fixtures import site_mirror
+from http_client import configure_client, fetch_html
+from site_crawler import discover_jobs, normalize_url
+from standin_server import StandInServer
+
+
+def crawl(server, base_url, per_host, max_depth, max_pages):
+    """Discover with the crawl engine's output silenced; (pages, jobs, seconds, requests)"""
+    before = server.request_count
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pages, jobs = discover_jobs(fetch_html, base_url, max_depth=max_depth,
+                                    max_pages=max_pages, per_host=per_host)
+    return pages, jobs, time.perf_counter() - start, server.request_count - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time link discovery")
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="seconds the stand-in server sleeps per request")
+    parser.add_argument('--per-host', type=int, nargs='+', default=[1, 4],
+                        help="per-host concurrency settings to measure")
+    args = parser.parse_args()
+
+    pages = site_mirror()
+    configure_client(pool_size=max(args.per_host))
+    with StandInServer(pages, latency=args.latency) as server:
+        base_url = server.base_url + urlsplit(catalog.SITE_URL).path
+        expected = {normalize_url(job.url): job.output_file
+                    for job in catalog.build_jobs(base_url=base_url)}
+        print(f"Mirror of {len(pages)} pages, {len(expected)} in the catalog, "
+              f"{args.latency * 1000:.0f} ms injected latency")
+
+        ok = True
+        for per_host in args.per_host:
+            found, jobs, elapsed, requests = crawl(server, base_url, per_host, 3, 500)
+            outputs = {job.url: job.output_file for job in jobs}
+            missing = set(expected) - set(outputs)
+            wrong = [url for url in expected if url in outputs and outputs[url] != expected[url]]
+            extra = sorted(str(outputs[url]) for url in set(outputs) - set(expected))
+            print(f"per_host={per_host}: {len(found)} pages in {elapsed:.2f} s "
+                  f"({requests} requests), {len(jobs)} book pages, "
+                  f"new: {', '.join(extra) or 'none'}")
+            if missing or wrong or len(extra) != 1 or requests != len(found):
+                ok = False
+                print(f"    missing {len(missing)}, misplaced {len(wrong)}, "
+                      f"{requests - len(found)} requests that found no page")
+
+        for max_depth, max_pages in [(0, 500), (3, 10)]:
+            found, jobs, elapsed, requests = crawl(server, base_url, max(args.per_host),
+                                                   max_depth, max_pages)
+            depth = max(page.depth for page in found)
+            print(f"max_depth={max_depth} max_pages={max_pages}: {len(found)} pages "
+                  f"({requests} requests), deepest {depth}, {len(jobs)} book pages")
+            if depth > max_depth or requests > max_pages:
+                ok = False
+
+    print("Discovery matches the catalog" if ok else "DISCOVERY MISMATCH")
+
+
+if __name__ == "__main__":
+    main()
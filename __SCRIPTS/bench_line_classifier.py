@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Micro-benchmark of the heading rules in format_markdown()
+
+Runs the line checks of both format_markdown() passes over every line of the
+corpus (the node-walk text of each page built by html_fixtures.py):
+
+- legacy: per line, startswith('#') or re.match() of the numbered-heading
+  pattern in the TOC pass, then startswith() / re.sub() / re.match() / the
+  節 test again in the formatting pass;
+- classifier: line_classifier.classify_lines() once, then a branch on the
+  kind code and heading_text() in the formatting pass.
+
+Both must agree on every line (heading or not, and the heading text and level
+the formatting pass would produce).
+
+    python __SCRIPTS/bench_line_classifier.py --repeat 5
+"""
+
+import argparse
+import re
+import time
+
+from html_fixtures import corpus_pages
+from line_classifier import (CHAPTER, MD_CHAPTER, MD_HEADING, MD_SECTION, SECTION,
+                             classify_lines, heading_text, is_heading)
+from markdown_converter import StreamingConverter
+
+
+def corpus_lines():
+    """Stripped node-walk lines of every page in the corpus"""
+    lines = []
+    for _, html in corpus_pages():
+        converter = StreamingConverter()
+        converter.feed(html)
+        converter.close()
+        lines.extend(line.strip() for line in (converter.text() or '').split('\n'))
+    return lines
+
+
+def legacy_rules(stripped_lines):
+    """(is_heading, rendered heading) per line, the way the old passes did it"""
+    flags = [line.startswith('#') or re.match(r'^第[０-９一二三四五六七八九十]+[部章巻節]', line) is not None
+             for line in stripped_lines]
+    rendered = []
+    for line in stripped_lines:
+        if not line:
+            rendered.append(None)
+        elif line.startswith('#'):
+            text = re.sub(r'^#+\s*', '', line)
+            if re.match(r'^第[０-９一二三四五六七八九十]+[部章巻]', text):
+                rendered.append(f"# {text}")
+            elif re.match(r'^第[０-９一二三四五六七八九十]+節', text):
+                rendered.append(f"## {text}")
+            else:
+                rendered.append(line)
+        elif re.match(r'^第[０-９一二三四五六七八九十]+[部章巻節]', line):
+            rendered.append(f"## {line}" if '節' in line else f"# {line}")
+        else:
+            rendered.append(None)
+    return flags, rendered
+
+
+def classifier_rules(stripped_lines):
+    """(is_heading, rendered heading) per line from the kind codes"""
+    kinds = classify_lines(stripped_lines)
+    flags = [is_heading(kind) for kind in kinds]
+    rendered = []
+    for line, kind in zip(stripped_lines, kinds):
+        if kind == MD_CHAPTER:
+            rendered.append(f"# {heading_text(line)}")
+        elif kind == MD_SECTION:
+            rendered.append(f"## {heading_text(line)}")
+        elif kind == MD_HEADING:
+            rendered.append(line)
+        elif kind == SECTION:
+            rendered.append(f"## {line}")
+        elif kind == CHAPTER:
+            rendered.append(f"# {line}")
+        else:
+            rendered.append(None)
+    return flags, rendered
+
+
+def best_time(rules, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = rules(lines)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the line classifier on the corpus")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="runs per implementation; the best is reported")
+    args = parser.parse_args()
+
+    lines = corpus_lines()
+    expected, legacy_time = best_time(legacy_rules, lines, args.repeat)
+    actual, classifier_time = best_time(classifier_rules, lines, args.repeat)
+    if actual != expected:
+        for i, (a, b) in enumerate(zip(zip(*expected), zip(*actual))):
+            if a != b:
+                raise SystemExit(f"Mismatch on line {i} {lines[i]!r}: {a} vs {b}")
+
+    print(f"{len(lines):,} lines, {sum(expected[0]):,} headings")
+    print(f"legacy      {legacy_time:7.3f} s  {len(lines) / legacy_time:>12,.0f} lines/s")
+    print(f"classifier  {classifier_time:7.3f} s  {len(lines) / classifier_time:>12,.0f} lines/s")
+    print(f"speedup     x{legacy_time / classifier_time:.2f}")
+
+
+if __name__ == "__main__":
+    main()
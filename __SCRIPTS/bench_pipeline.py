@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Scaling benchmark for the fetch / convert / write pipeline
+
+Rebuilds every page of the three catalogs once per --workers setting.
+Pages come from memory (html_fixtures.py renders each page's Markdown back
+into site-like HTML), so the run measures conversion and writing only. The
+Markdown is written to a temporary directory with a fresh manifest, so every
+run converts every page.
+
+    python __SCRIPTS/bench_pipeline.py --workers 1 2 4 8
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+from pathlib import Path
+
+from bench_crawl import all_jobs
+from build_manifest import BuildManifest
+from build_pipeline import BuildPipeline
+from html_fixtures import REPO_ROOT, markdown_to_html
+
+
+def fixture_pages(jobs):
+    """url -> HTML for every job whose Markdown file exists in the corpus"""
+    pages = {}
+    for job in jobs:
+        markdown_file = REPO_ROOT / job.output_file
+        if markdown_file.exists():
+            pages[job.url] = markdown_to_html(markdown_file.read_text(encoding='utf-8'),
+                                              job.title)
+    return pages
+
+
+def rebuild(jobs, pages, workers, output_root):
+    """One full rebuild into output_root; returns the finished pipeline"""
+    jobs = [job._replace(output_file=output_root / job.output_file) for job in jobs]
+    for job in jobs:
+        job.output_file.parent.mkdir(parents=True, exist_ok=True)
+    manifest = BuildManifest(output_root / "manifest.json", force=True)
+    pipeline = BuildPipeline(manifest, lambda job, status: True, workers=workers)
+    with contextlib.redirect_stdout(io.StringIO()):
+        pipeline.run(jobs, fetch=pages.__getitem__)
+    return pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the conversion pipeline")
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, 2, os.cpu_count() or 1}),
+                        help="converter process counts to try")
+    args = parser.parse_args()
+
+    jobs = all_jobs("http://fixture")
+    pages = fixture_pages(jobs)
+    jobs = [job for job in jobs if job.url in pages]
+    print(f"{len(jobs)} pages, {sum(len(p.encode('utf-8')) for p in pages.values()) / 2**20:.1f} MB "
+          f"of HTML, {os.cpu_count()} CPUs")
+
+    baseline = None
+    print(f"{'workers':>7} {'total s':>8} {'convert s':>10} {'pages/s':>8} {'speedup':>8}")
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            pipeline = rebuild(jobs, pages, workers, Path(tmp))
+        convert = pipeline.stages['convert']
+        if convert.pages != len(jobs):
+            raise SystemExit(f"Only {convert.pages} of {len(jobs)} pages converted")
+        baseline = baseline or pipeline.elapsed
+        print(f"{workers:>7} {pipeline.elapsed:>8.2f} {convert.wall:>10.2f} "
+              f"{convert.pages / convert.wall:>8.1f} {baseline / pipeline.elapsed:>7.2f}x")
+    print()
+    print(pipeline.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compare fixed and adaptive per-host concurrency against a throttling host
+
+A local stand-in server plays the source site in four moods:
+
+- healthy: every request is answered after --latency seconds;
+- throttling: more than --capacity requests at once are refused with 429
+  and Retry-After;
+- slowing: each response takes --latency plus --load-latency per other
+  request in flight;
+- crawl-delay: robots.txt asks for --crawl-delay seconds between requests.
+
+Each is crawled with --per-host fixed threads and no scheduler, then with
+the politeness scheduler (politeness.py) capped at the same number. The
+adaptive runs should climb to the cap on the healthy host, settle near the
+throttling host's capacity with few 429s, back off as the slowing host
+queues, and keep the crawl-delay between requests.
+
+    python __SCRIPTS/bench_politeness.py --pages 60 --per-host 8
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+from crawl_engine import CrawlJob, run_crawl
+from http_client import configure_client, fetch_html
+from politeness import PolitenessScheduler
+from standin_server import StandInServer
+
+PAGE = '<html><body><div id="content">page<br></div></body></html>'
+
+
+def crawl(server, pages, per_host, scheduler):
+    """(seconds, pages fetched, client) of one crawl of every page"""
+    client = configure_client(pool_size=per_host, backoff=0.05, retries=5, scheduler=scheduler)
+    jobs = [CrawlJob(f"{server.base_url}/page{n:03d}.html", f"page {n}", None)
+            for n in range(pages)]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fetched = run_crawl(jobs, lambda job, html: True, per_host=per_host, fetch=fetch_html,
+                            on_error=lambda job, error: None)
+    return time.perf_counter() - start, fetched, client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fixed and adaptive concurrency")
+    parser.add_argument('--pages', type=int, default=60)
+    parser.add_argument('--per-host', type=int, default=8,
+                        help="fixed concurrency, and the adaptive runs' ceiling")
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="seconds per response when the host is idle")
+    parser.add_argument('--capacity', type=int, default=3,
+                        help="requests the throttling host serves at once")
+    parser.add_argument('--load-latency', type=float, default=0.05,
+                        help="seconds the slowing host adds per request in flight")
+    parser.add_argument('--crawl-delay', type=float, default=0.05,
+                        help="Crawl-delay served in robots.txt")
+    args = parser.parse_args()
+
+    moods = [
+        ("healthy", {}),
+        ("throttling", dict(max_concurrent=args.capacity, retry_after=1)),
+        ("slowing", dict(load_latency=args.load_latency)),
+        ("crawl-delay", dict(robots_txt=f"User-agent: *\nCrawl-delay: {args.crawl_delay}\n")),
+    ]
+    print(f"{args.pages} pages, {args.latency * 1000:.0f} ms latency, "
+          f"per_host={args.per_host}")
+    for mood, options in moods:
+        for adaptive in (False, True):
+            scheduler = PolitenessScheduler(max_concurrency=args.per_host) if adaptive else None
+            with StandInServer({}, default_page=PAGE, latency=args.latency, **options) as server:
+                elapsed, fetched, client = crawl(server, args.pages, args.per_host, scheduler)
+                name = f"{mood} {'adaptive' if adaptive else 'fixed'}"
+                print(f"{name:<22} {fetched:>3} pages  {elapsed:6.2f} s  "
+                      f"{fetched / elapsed:6.1f} pages/s  {server.request_count} requests, "
+                      f"{server.throttled_count} throttled, peak {server.peak_in_flight} in flight")
+                if scheduler:
+                    print(f"{'':<22} {scheduler.summary()}")
+                client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark converting pages while they download against after
+
+Every corpus page (html_fixtures.py) is served by a local stand-in server
+that trickles each body out at --bandwidth bytes per second, and the whole
+catalog is built twice through the pipeline into a fresh cache and output
+directory: once fetching whole bodies and converting them in the converter
+processes, once with streaming_fetch converting each page in chunks as it
+arrives. Both builds must write identical Markdown. The largest page is
+then fetched and converted alone both ways under tracemalloc to compare
+peak memory.
+
+    python __SCRIPTS/bench_streaming.py --bandwidth 1000000 --per-host 4
+"""
+
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from bench_crawl import all_jobs
+from bench_pipeline import fixture_pages
+from build_manifest import BuildManifest
+from build_pipeline import BuildPipeline
+from html_cache import HtmlCache
+from http_client import configure_client
+from markdown_converter import html_to_markdown_timed
+from standin_server import StandInServer
+from streaming_fetch import streamed_fetch
+
+MODES = ("whole", "stream")
+
+
+def page_fetch(mode, cache):
+    return streamed_fetch(cache) if mode == "stream" else cache.fetch_html
+
+
+def build(mode, jobs, root, workers, per_host):
+    """Build every job into root; returns (seconds, pipeline, url -> Markdown)"""
+    jobs = [job._replace(output_file=root / job.output_file) for job in jobs]
+    for job in jobs:
+        job.output_file.parent.mkdir(parents=True, exist_ok=True)
+    cache = HtmlCache(root / "html_cache")
+    pipeline = BuildPipeline(BuildManifest(root / "manifest.json", force=True),
+                             lambda job, status: True, workers=workers, name=mode)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        pipeline.run(jobs, fetch=page_fetch(mode, cache), per_host=per_host)
+    elapsed = time.perf_counter() - start
+    return elapsed, pipeline, {job.url: job.output_file.read_text(encoding='utf-8')
+                               for job in jobs}
+
+
+def peak_memory(mode, url, root):
+    """Peak traced bytes of fetching and converting url into a fresh cache"""
+    cache = HtmlCache(root / f"peak_{mode}")
+    fetch = page_fetch(mode, cache)
+    tracemalloc.start()
+    page = fetch(url)
+    if mode == "whole":
+        html_to_markdown_timed(page)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streamed download and conversion")
+    parser.add_argument('--bandwidth', type=int, default=1000000,
+                        help="bytes per second the stand-in server sends each body at")
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="seconds before each response starts")
+    parser.add_argument('--per-host', type=int, default=4,
+                        help="concurrent requests")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="converter processes of the whole-body build")
+    args = parser.parse_args()
+
+    jobs = all_jobs("http://fixture")
+    pages = fixture_pages(jobs)
+    jobs = [job for job in jobs if job.url in pages]
+    served = {urlsplit(url).path: html for url, html in pages.items()}
+    largest = max(jobs, key=lambda job: len(pages[job.url]))
+    total = sum(len(html.encode('utf-8')) for html in pages.values())
+    print(f"{len(jobs)} pages, {total / 2**20:.1f} MB of HTML at "
+          f"{args.bandwidth / 2**20:.2f} MB/s per request, {args.per_host} at a time")
+
+    configure_client(pool_size=args.per_host)
+    results = {}
+    with StandInServer(served, latency=args.latency, bandwidth=args.bandwidth) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        jobs = [job._replace(url=server.base_url + urlsplit(job.url).path) for job in jobs]
+        largest_url = server.base_url + urlsplit(largest.url).path
+        for mode in MODES:
+            elapsed, pipeline, outputs = build(mode, jobs, Path(tmp) / mode, args.workers,
+                                               args.per_host)
+            peak = peak_memory(mode, largest_url, Path(tmp))
+            results[mode] = (elapsed, pipeline, outputs, peak)
+
+    print(f"{'mode':<8} {'total s':>8} {'fetch wall s':>12} {'peak MB':>8}  (largest page, "
+          f"{len(pages[largest.url].encode('utf-8')) / 2**20:.2f} MB)")
+    for mode in MODES:
+        elapsed, pipeline, outputs, peak = results[mode]
+        print(f"{mode:<8} {elapsed:>8.2f} {pipeline.stages['fetch'].wall:>12.2f} "
+              f"{peak / 2**20:>8.2f}")
+    whole, stream = results["whole"], results["stream"]
+    print(f"Streaming: x{whole[0] / stream[0]:.2f} faster, peak memory "
+          f"x{whole[3] / stream[3]:.1f} lower")
+    print()
+    print(stream[1].summary())
+    if whole[2] != stream[2]:
+        differing = [url for url in whole[2] if whole[2][url] != stream[2][url]]
+        raise SystemExit(f"{len(differing)} pages differ between the builds, "
+                         f"e.g. {differing[0]}")
+    print("Both builds wrote identical Markdown")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Scaling benchmark for table-of-contents detection
+
+Builds synthetic converted documents of 10k to 1M lines (a TOC block, then
+chapters and sections with body text) and times the old per-heading forward
+scan against heading_analysis.analyze_headings(). Both must agree on every
+document.
+
+    python __SCRIPTS/bench_toc.py --sizes 10000 100000 1000000 --heading-every 8
+"""
+
+import argparse
+import random
+import re
+import time
+
+from heading_analysis import analyze_headings
+
+KANJI_NUMBERS = "一二三四五六七八九十"
+
+
+def synthetic_lines(line_count, heading_every, seed=0):
+    """Converted-text lines: a TOC, then headings every ~heading_every lines"""
+    rng = random.Random(seed)
+    lines = ["Start content", "## 目次", ""]
+    for n in range(1, 11):
+        lines.append(f"第{KANJI_NUMBERS[(n - 1) % 10]}章 見出し{n}")
+    chapter = 0
+    while len(lines) < line_count:
+        chapter += 1
+        number = KANJI_NUMBERS[chapter % 10]
+        lines.append(f"# 第{number}章 本文{chapter}" if chapter % 2 else f"第{number}節 小見出し")
+        lines.append("")
+        for _ in range(rng.randint(1, 2 * heading_every)):
+            lines.append("本文" * rng.randint(5, 60) if rng.random() < 0.8 else "")
+    return lines[:line_count]
+
+
+def legacy_toc_scan(lines):
+    """The original first pass: scan forward from every heading"""
+    heading_indices = []
+    content_lengths = []
+    for i, line in enumerate(lines):
+        line_stripped = line.strip()
+        if line_stripped.startswith('#') or re.match(r'^第[０-９一二三四五六七八九十]+[部章巻節]', line_stripped):
+            heading_indices.append(i)
+            content_len = 0
+            for j in range(i + 1, len(lines)):
+                next_line = lines[j].strip()
+                if not next_line:
+                    continue
+                if next_line.startswith('#') or re.match(r'^第[０-９一二三四五六七八九十]+[部章巻節]', next_line):
+                    break
+                content_len += len(next_line)
+            content_lengths.append(content_len)
+
+    toc_start = None
+    toc_end = None
+    if len(heading_indices) >= 3:
+        consecutive_count = 0
+        for i in range(len(heading_indices) - 1):
+            if content_lengths[i] < 50:
+                consecutive_count += 1
+                if consecutive_count >= 3 and toc_start is None:
+                    toc_start = heading_indices[i - 2]
+            else:
+                if consecutive_count >= 3 and toc_end is None:
+                    toc_end = heading_indices[i]
+                consecutive_count = 0
+        if toc_start is not None and toc_end is None:
+            for i in range(len(heading_indices)):
+                if heading_indices[i] > toc_start and content_lengths[i] > 100:
+                    toc_end = heading_indices[i]
+                    break
+    return list(zip(heading_indices, content_lengths)), toc_start, toc_end
+
+
+def sweep(lines):
+    analysis = analyze_headings([line.strip() for line in lines])
+    return ([tuple(h) for h in analysis.headings], analysis.toc_start, analysis.toc_end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TOC detection")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help="document sizes in lines")
+    parser.add_argument('--heading-every', type=int, default=8,
+                        help="average body lines per heading (smaller = denser)")
+    args = parser.parse_args()
+
+    print(f"{'lines':>9} {'headings':>9} {'legacy s':>9} {'sweep s':>9} {'speedup':>8} "
+          f"{'sweep lines/s':>14}")
+    for size in args.sizes:
+        lines = synthetic_lines(size, args.heading_every)
+        start = time.perf_counter()
+        expected = legacy_toc_scan(lines)
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = sweep(lines)
+        sweep_time = time.perf_counter() - start
+        if actual != expected:
+            raise SystemExit(f"Mismatch on {size} lines: TOC {expected[1:]} vs {actual[1:]}")
+        print(f"{size:>9} {len(actual[0]):>9} {legacy_time:>9.3f} {sweep_time:>9.3f} "
+              f"{legacy_time / sweep_time:>7.2f}x {size / sweep_time:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
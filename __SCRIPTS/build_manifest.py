@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Incremental rebuild manifest for the generated Markdown files
+
+For each output file (e.g. silver_birch_volumes/volume01.md) the manifest
+records the sha256 of the HTML it was built from, the converter version and
+the sha256 of the Markdown written. build_pipeline.py asks is_current()
+before converting a page, so one whose HTML and converter are unchanged,
+and whose output is still on disk as recorded, is not converted again;
+save() does not rewrite output that converts to the same bytes. Every
+written file gets its section offset index (section_store.py) alongside.
+Output is staged in a temporary file and renamed into place, so a crash
+never leaves a half-written file.
+
+Several processes may build into one tree at once (crawl_workers.py):
+each record is merged into the manifest on disk under a file lock rather
+than overwriting it with one process's view.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; concurrent processes are then unsafe
+    fcntl = None
+
+from section_store import index_path, write_index
+
+DEFAULT_MANIFEST = Path(".build_manifest.json")
+
+# Page build results (build_pipeline.py)
+SKIPPED = "skipped"      # inputs unchanged, conversion not run
+UNCHANGED = "unchanged"  # converted, but identical to the file on disk
+WRITTEN = "written"      # file created or its contents changed
+EMPTY = "empty"          # converter found no content; nothing written
+
+
+def sha256_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def sha256_file(path):
+    """sha256 of a file's bytes, or None if it does not exist"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Output written to tmp_file beside output_file but not yet put in place:
+# the sha256 and size in bytes of its content
+StagedOutput = namedtuple("StagedOutput", ["output_file", "tmp_file", "sha256", "size"])
+
+
+def stage_lines(output_file, lines):
+    """Stream lines (joined by newlines) into a temporary file next to output_file
+
+    The lines are hashed as they are written and the file is fsynced. Any
+    process can stage a file; commit_staged() puts it in place.
+    """
+    output_file = Path(output_file)
+    tmp_file = output_file.with_name(f"{output_file.name}.tmp{os.getpid()}")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_file, 'wb') as f:
+            separator = b''
+            for line in lines:
+                data = separator + line.encode('utf-8')
+                separator = b'\n'
+                digest.update(data)
+                f.write(data)
+                size += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        tmp_file.unlink(missing_ok=True)
+        raise
+    return StagedOutput(output_file, tmp_file, digest.hexdigest(), size)
+
+
+def commit_staged(staged):
+    """Rename a staged file over its output_file; returns whether it was written
+
+    A staged file with no bytes, or with exactly the bytes output_file
+    already holds, is discarded instead. Readers see the old file or the
+    new one, never a partial write.
+    """
+    try:
+        if staged.size == 0 or sha256_file(staged.output_file) == staged.sha256:
+            staged.tmp_file.unlink()
+            return False
+        os.replace(staged.tmp_file, staged.output_file)
+    except BaseException:
+        staged.tmp_file.unlink(missing_ok=True)
+        raise
+    _fsync_dir(staged.output_file.parent)
+    return True
+
+
+def discard_staged(staged):
+    staged.tmp_file.unlink(missing_ok=True)
+
+
+def write_lines_atomic(output_file, lines):
+    """Stream lines (joined by newlines) into output_file atomically
+
+    stage_lines() then commit_staged(). Returns (written, sha256 of the
+    content, size in bytes).
+    """
+    staged = stage_lines(output_file, lines)
+    return commit_staged(staged), staged.sha256, staged.size
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Exclusive lock on path + '.lock', held across processes"""
+    lock_file = Path(path).with_name(f"{Path(path).name}.lock")
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_file, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def merge_json_file(path, changes):
+    """Apply changes (key -> value) to the JSON object in path atomically
+
+    Other processes' keys are kept: the file is re-read under file_lock()
+    and written back with write-then-rename. Returns the merged object.
+    """
+    path = Path(path)
+    with file_lock(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                merged = json.load(f)
+        except FileNotFoundError:
+            merged = {}
+        merged.update(changes)
+        tmp_file = path.with_name(f"{path.name}.tmp{os.getpid()}")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(merged, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_file, path)
+    return merged
+
+
+class BuildManifest:
+    """JSON manifest of html hash / converter version / output hash per file"""
+
+    def __init__(self, path=DEFAULT_MANIFEST, force=False):
+        self.path = Path(path)
+        self.force = force
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = {}
+
+    @staticmethod
+    def key(output_file):
+        return Path(output_file).as_posix()
+
+    def is_current(self, output_file, html_sha256, converter_version):
+        """True if output_file was built from this HTML by this converter
+        and is still on disk unmodified"""
+        if self.force:
+            return False
+        with self._lock:
+            entry = self.entries.get(self.key(output_file))
+        return (entry is not None
+                and entry['html_sha256'] == html_sha256
+                and entry['converter_version'] == converter_version
+                and sha256_file(output_file) == entry['output_sha256'])
+
+    def record(self, output_file, html_sha256, converter_version, output_sha256):
+        entry = {
+            'html_sha256': html_sha256,
+            'converter_version': converter_version,
+            'output_sha256': output_sha256,
+        }
+        with self._lock:
+            self.entries = merge_json_file(self.path, {self.key(output_file): entry})
+
+    def save(self, output_file, html_sha256, converter_version, markdown_content):
+        """Write converted Markdown (and its section index) for output_file
+        and record it
+
+        markdown_content is the Markdown text, an iterable of its lines,
+        which is streamed to disk, or a StagedOutput of output_file already
+        written by stage_lines(). Returns UNCHANGED, WRITTEN or EMPTY.
+        """
+        if isinstance(markdown_content, StagedOutput):
+            staged = markdown_content
+        else:
+            if isinstance(markdown_content, str):
+                markdown_content = (markdown_content,)
+            staged = stage_lines(output_file, markdown_content)
+        written = commit_staged(staged)
+        if staged.size == 0:
+            return EMPTY
+        if written or not index_path(output_file).exists():
+            write_index(output_file)
+        self.record(output_file, html_sha256, converter_version, staged.sha256)
+        return WRITTEN if written else UNCHANGED
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Fetch -> convert -> write pipeline used by the scrape scripts
+
+Fetching stays on the asyncio crawl engine (threads, per-host limits). Each
+fetched page goes on a queue; pages whose HTML and converter are unchanged
+are skipped there, the rest are converted by a ProcessPoolExecutor, so
+conversion runs on every core instead of the event loop thread. The
+converter processes stream each page's Markdown lines into a temporary
+file beside its output as they are produced, so the output is never
+joined into one string or sent back to this process. A single writer
+thread renames the file into place, unless it is unchanged, and records
+it in the build manifest. Every stage counts its pages, bytes and time for the summary,
+and each page's stages are recorded in a run_metrics.RunMetrics.
+
+A fetch may also return a streaming_fetch.StreamedPage, already converted
+while it downloaded; those skip the converter processes, their fetch time
+includes the conversion, and their Markdown is written from the text.
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from build_manifest import (SKIPPED, WRITTEN, StagedOutput, discard_staged, sha256_text,
+                            stage_lines)
+from crawl_engine import DEFAULT_PER_HOST, crawl, print_error
+from http_client import fetch_html
+from parser_backends import DEFAULT_BACKEND, backend_version, get_backend, html_to_markdown_timed
+from run_metrics import RunMetrics
+from streaming_fetch import StreamedPage
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+# Marks the end of the convert queue
+_DONE = None
+
+
+def convert_page(html, output_file, backend=DEFAULT_BACKEND, normalize=()):
+    """Conversion run in the worker processes: (StagedOutput, phase metrics)
+
+    The Markdown is staged beside output_file (build_manifest.stage_lines)
+    line by line as the cleanups produce it.
+    """
+    def write(lines):
+        staged = stage_lines(output_file, lines)
+        return staged, staged.size
+    return html_to_markdown_timed(html, backend, normalize, write=write)
+
+
+def _utf8_size(text):
+    return len(text.encode('utf-8')) if text else 0
+
+
+def _output_size(markdown_content):
+    if isinstance(markdown_content, StagedOutput):
+        return markdown_content.size
+    return _utf8_size(markdown_content)
+
+
+def _discard(markdown_content):
+    """Remove the staged file of a page that will not be written"""
+    if isinstance(markdown_content, StagedOutput):
+        discard_staged(markdown_content)
+
+
+def _output_sha256(markdown_content):
+    if isinstance(markdown_content, StagedOutput):
+        return markdown_content.sha256
+    return sha256_text(markdown_content)
+
+
+class StageStats:
+    """Pages, bytes in/out and time spent in one pipeline stage
+
+    busy is the summed time of the stage's work items; wall runs from the
+    first item's start to the last item's end, so pages / wall is the
+    stage's throughput with all its workers together.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.pages = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.busy = 0.0
+        self.first_start = None
+        self.last_end = None
+        self._lock = threading.Lock()
+
+    def add(self, start, end, bytes_in=0, bytes_out=0):
+        with self._lock:
+            self.pages += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.busy += end - start
+            if self.first_start is None or start < self.first_start:
+                self.first_start = start
+            if self.last_end is None or end > self.last_end:
+                self.last_end = end
+
+    @property
+    def wall(self):
+        if self.first_start is None:
+            return 0.0
+        return self.last_end - self.first_start
+
+    def summary(self):
+        """One-line summary of the stage"""
+        if not self.pages:
+            return f"{self.name:<8} no pages"
+        wall = self.wall or 1e-9
+        return (f"{self.name:<8} {self.pages:>3} pages  "
+                f"{self.bytes_in / 2**20:7.2f} MB in  {self.bytes_out / 2**20:7.2f} MB out  "
+                f"busy {self.busy:6.2f} s  wall {wall:6.2f} s  "
+                f"{self.pages / wall:6.1f} pages/s  {self.bytes_in / 2**20 / wall:6.2f} MB/s")
+
+
+class BuildPipeline:
+    """Fetch pages, convert them in worker processes and write them out
+
+    on_status(job, status) is called from the event loop with the
+    build_manifest status of every page (SKIPPED, UNCHANGED, WRITTEN or
+    EMPTY) and returns whether the page counts as built. Pages are parsed
+    with the named parser_backends backend, their lines normalized with
+    the markdown_converter.LINE_RULES named in normalize, unless convert
+    is given: a picklable convert(html, output_file) run in the worker
+    processes that returns (markdown, metrics) like convert_page(), the
+    markdown as text or as a build_manifest.StagedOutput.
+    on_converted(job, markdown_sha256), if given, is called from the event
+    loop with every page converted, before it is queued for writing.
+    """
+
+    def __init__(self, manifest, on_status, workers=DEFAULT_WORKERS, backend=DEFAULT_BACKEND,
+                 convert=None, converter_version=None, on_error=print_error, name="build",
+                 on_converted=None, normalize=()):
+        self.manifest = manifest
+        self.on_status = on_status
+        self.on_converted = on_converted
+        self.workers = max(1, workers)
+        # Resolved here so a missing backend is reported once, not per worker
+        self.backend = get_backend(backend).name
+        self.normalize = tuple(normalize)
+        self.convert = convert or functools.partial(convert_page, backend=self.backend,
+                                                    normalize=self.normalize)
+        self.converter_version = converter_version or backend_version(self.backend,
+                                                                      self.normalize)
+        self.on_error = on_error
+        self.stages = {stage: StageStats(stage) for stage in ('fetch', 'convert', 'write')}
+        self.metrics = RunMetrics(name)
+        self.skipped = 0
+        self.streamed = 0
+        self.elapsed = 0.0
+
+    def _timed_fetch(self, fetch):
+        def timed_fetch(url):
+            start = time.perf_counter()
+            html = fetch(url)
+            end = time.perf_counter()
+            size = html.html_bytes if isinstance(html, StreamedPage) else _utf8_size(html)
+            self.stages['fetch'].add(start, end, bytes_in=size)
+            self.metrics.pages[url].add_stage('fetch', end - start, bytes_out=size)
+            return html
+        return timed_fetch
+
+    def _write(self, job, html_sha256, markdown_content):
+        # Runs on the writer thread
+        start = time.perf_counter()
+        status = self.manifest.save(job.output_file, html_sha256, self.converter_version,
+                                    markdown_content)
+        end = time.perf_counter()
+        size = _output_size(markdown_content)
+        self.stages['write'].add(start, end, bytes_in=size)
+        self.metrics.page(job).add_stage('write', end - start, bytes_in=size,
+                                         bytes_out=size if status == WRITTEN else 0)
+        return status
+
+    def _error(self, job, stage, error):
+        self.metrics.record_error(job, stage, error)
+        self.on_error(job, error)
+
+    def _fetch_error(self, job, error):
+        self._error(job, 'fetch', error)
+
+    def _finish(self, job, status):
+        self.metrics.page(job).status = status
+        try:
+            return bool(self.on_status(job, status))
+        except Exception as e:
+            self._error(job, 'write', e)
+            return False
+
+    def _is_current(self, job, html):
+        """(html_sha256, whether job's output is current); hashes the page and
+        re-reads the output, so it runs off the event loop"""
+        if isinstance(html, StreamedPage):
+            html_sha256 = html.html_sha256
+        else:
+            html_sha256 = sha256_text(html)
+        return html_sha256, self.manifest.is_current(job.output_file, html_sha256,
+                                                     self.converter_version)
+
+    async def _converter(self, convert_queue, write_queue, processes):
+        """Take fetched pages off the queue until the end marker"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await convert_queue.get()
+            if item is _DONE:
+                return
+            job, html = item
+            streamed = isinstance(html, StreamedPage)
+            try:
+                html_sha256, current = await loop.run_in_executor(None, self._is_current,
+                                                                  job, html)
+            except Exception as e:
+                self._error(job, 'parse_walk', e)
+                continue
+            if current:
+                self.skipped += 1
+                await write_queue.put((job, None, None))
+                continue
+            if streamed:
+                # Converted in the fetch thread as it downloaded
+                self.streamed += 1
+                markdown_content, page_metrics = html.markdown, html.metrics
+            else:
+                start = time.perf_counter()
+                try:
+                    markdown_content, page_metrics = await loop.run_in_executor(
+                        processes, self.convert, html, job.output_file)
+                except Exception as e:
+                    self._error(job, 'parse_walk', e)
+                    continue
+                self.stages['convert'].add(start, time.perf_counter(), bytes_in=_utf8_size(html),
+                                           bytes_out=_output_size(markdown_content))
+            page = self.metrics.page(job)
+            for stage, values in page_metrics['phases'].items():
+                page.add_stage(stage, **values)
+            page.lines = page_metrics['lines']
+            page.headings = page_metrics['headings']
+            if self.on_converted is not None:
+                try:
+                    self.on_converted(job, _output_sha256(markdown_content))
+                except Exception as e:
+                    _discard(markdown_content)
+                    self._error(job, 'write', e)
+                    continue
+            await write_queue.put((job, html_sha256, markdown_content))
+
+    async def _writer(self, write_queue, writer_thread):
+        """Persist converted pages one at a time; returns the pages built"""
+        loop = asyncio.get_running_loop()
+        built = 0
+        while True:
+            item = await write_queue.get()
+            if item is _DONE:
+                return built
+            job, html_sha256, markdown_content = item
+            if html_sha256 is None:
+                status = SKIPPED
+            else:
+                try:
+                    status = await loop.run_in_executor(writer_thread, self._write, job,
+                                                        html_sha256, markdown_content)
+                except Exception as e:
+                    _discard(markdown_content)
+                    self._error(job, 'write', e)
+                    continue
+            if self._finish(job, status):
+                built += 1
+
+    def _registered(self, jobs):
+        for job in jobs:
+            self.metrics.page(job)
+            yield job
+
+    async def run_async(self, jobs, fetch=fetch_html, per_host=DEFAULT_PER_HOST):
+        """Build all jobs; returns the number of pages on_status accepted
+
+        jobs may be a lazy iterable (see crawl_engine.crawl); its pages are
+        registered in the metrics as they are handed out.
+        """
+        if isinstance(jobs, (list, tuple)):
+            for job in jobs:
+                self.metrics.page(job)
+            # A run of a few pages starts no more processes than it has pages
+            workers = max(1, min(self.workers, len(jobs)))
+        else:
+            jobs = self._registered(jobs)
+            workers = self.workers
+        started = time.perf_counter()
+        convert_queue = asyncio.Queue()
+        write_queue = asyncio.Queue()
+
+        def enqueue(job, html):
+            convert_queue.put_nowait((job, html))
+            return True
+
+        # Spawned rather than forked: the fetch threads are already running
+        # when the first worker starts
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as processes, \
+                ThreadPoolExecutor(max_workers=1) as writer_thread:
+            converters = [asyncio.ensure_future(self._converter(convert_queue, write_queue, processes))
+                          for _ in range(workers)]
+            writer = asyncio.ensure_future(self._writer(write_queue, writer_thread))
+            await crawl(jobs, enqueue, per_host=per_host, fetch=self._timed_fetch(fetch),
+                        on_error=self._fetch_error)
+            for _ in converters:
+                convert_queue.put_nowait(_DONE)
+            await asyncio.gather(*converters)
+            write_queue.put_nowait(_DONE)
+            built = await writer
+        self.elapsed = time.perf_counter() - started
+        self.metrics.finish()
+        return built
+
+    def run(self, jobs, fetch=fetch_html, per_host=DEFAULT_PER_HOST):
+        """Synchronous entry point for run_async()"""
+        return asyncio.run(self.run_async(jobs, fetch=fetch, per_host=per_host))
+
+    def summary(self):
+        """Per-stage throughput of the last run"""
+        lines = [f"Pipeline: {self.workers} {self.backend} converter processes, "
+                 f"{self.skipped} pages skipped, "
+                 f"{self.streamed} converted while downloading, "
+                 f"{self.elapsed:.2f} s total"]
+        lines.extend(stage.summary() for stage in self.stages.values())
+        lines.append(self.metrics.summary())
+        return '\n'.join(lines)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Every book scraped from the site, in one declarative list
+
+A book's Markdown goes to <name>_volumes/, one file per page. Page URLs are
+SITE_URL + the book's path + the page's filename, so the whole catalog can
+be pointed at a mirror by swapping SITE_URL for another base URL.
+"""
+
+from collections import namedtuple
+from pathlib import Path
+
+from crawl_engine import CrawlJob
+
+SITE_URL = "https://www.asahi-net.or.jp/~lv2k-sgw/spir/search/"
+
+# name: output directory prefix and --book key; path: relative to SITE_URL
+Book = namedtuple("Book", ["name", "title", "path", "pages"])
+# output_name: Markdown file name without .md, and --page key
+Page = namedtuple("Page", ["filename", "title", "output_name"])
+
+CATALOG = [
+    Book("silver_birch", "シルバーバーチの霊訓", "big3/silver/", [
+        Page(f"volume{n:02d}.html", f"volume {n}", f"volume{n:02d}") for n in range(1, 13)
+    ]),
+    Book("allan_kardec", "アラン・カルデック", "big3/allan/", [
+        Page("soul.html", "霊の書", "soul"),
+        Page("psychic.html", "霊媒の書", "psychic"),
+        Page("dialog.html", "霊との対話-天国と地獄", "dialog"),
+        Page("heavenHell2.html", "天国と地獄Ⅱ", "heaven_hell_2"),
+    ]),
+    Book("stainton_moses", "ステイントン・モーゼス", "big3/", [
+        Page("staintonU.html", "霊訓(完訳・上)", "stainton_upper"),
+        Page("staintonL.html", "霊訓(完訳・下)", "stainton_lower"),
+    ]),
+    Book("owen", "オーエン(ベールの彼方の生活)", "owen/", [
+        Page("owen1.html", "第1巻 天界の低地", "owen_volume01"),
+        Page("owen2.html", "第2巻 天界の高地", "owen_volume02"),
+        Page("owen3.html", "第3巻 天界の政庁", "owen_volume03"),
+        Page("owen4.html", "第4巻 天界の大軍", "owen_volume04"),
+    ]),
+    Book("report500", "500に及ぶあの世からの現地報告", "", [
+        Page("report500.html", "500に及ぶあの世からの現地報告", "report500"),
+    ]),
+    Book("word", "ワード(死後の世界)", "word/", [
+        Page("wordcoment.html", "Ｊ・Ｓ・Ｍ・ワード[解説]", "word_commentary"),
+        Page("worduncle.html", "叔父さんの住む霊界", "word_uncle"),
+        Page("wordtour.html", "陸軍士官の地獄巡り", "word_tour"),
+    ]),
+    Book("tester", "M・H・テスター", "tester/", [
+        Page("evidence.html", "私は霊力の証を見た", "tester_evidence"),
+        Page("behind.html", "背後霊の不思議", "tester_behind"),
+    ]),
+    Book("wickland", "ウィックランド(迷える霊との対話)", "", [
+        Page("wickland.html", "ウィックランド(迷える霊との対話)", "wickland"),
+    ]),
+    Book("sculthorp", "スカルソープ(私の霊界紀行)", "", [
+        Page("sculthorp.html", "スカルソープ(私の霊界紀行)", "sculthorp"),
+    ]),
+    Book("cummins", "ジェラルディン・カミンズ", "cummins/", [
+        Page("avenue.html", "永遠の大道", "cummins_avenue"),
+        Page("boy.html", "イエスの少年時代", "cummins_boy"),
+        Page("majority.html", "イエスの成年時代", "cummins_majority"),
+        Page("pupils.html", "イエスの弟子達", "cummins_pupils"),
+    ]),
+]
+
+BOOKS = {book.name: book for book in CATALOG}
+
+
+def output_dir(book):
+    return Path(f"{book.name}_volumes")
+
+
+def page_url(book, page, base_url=SITE_URL):
+    return f"{base_url}{book.path}{page.filename}"
+
+
+def select(books=None, pages=None):
+    """(book, page) pairs of the named books (default all), narrowed to the
+    named pages if any; a page is named by its output name or filename
+
+    Raises ValueError for names that match nothing.
+    """
+    names = books or [book.name for book in CATALOG]
+    unknown = [name for name in names if name not in BOOKS]
+    if unknown:
+        raise ValueError(f"Unknown book {', '.join(unknown)}; choose from {', '.join(BOOKS)}")
+    wanted = set(pages or ())
+    selected = []
+    for name in names:
+        book = BOOKS[name]
+        for page in book.pages:
+            if not wanted or page.output_name in wanted or page.filename in wanted:
+                selected.append((book, page))
+    found = {key for _, page in selected for key in (page.output_name, page.filename)}
+    missing = wanted - found
+    if missing:
+        raise ValueError(f"No page {', '.join(sorted(missing))} in "
+                         f"{', '.join(names) if books else 'the catalog'}")
+    return selected
+
+
+def build_jobs(books=None, pages=None, base_url=SITE_URL):
+    """CrawlJobs of the selected pages"""
+    return [CrawlJob(page_url(book, page, base_url), page.title,
+                     output_dir(book) / f"{page.output_name}.md")
+            for book, page in select(books, pages)]
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Check that a failing page does not take the build pipeline down with it
+
+A few corpus pages (html_fixtures.py) are built into a temporary directory
+while the manifest check of one page and the on_converted hook of another
+raise, as a broken manifest entry or a journal write error would. Both
+pages must be reported as errors, every other page written, and no staged
+*.md.tmp<pid> file left behind; any failure makes the script exit non-zero.
+
+    python __SCRIPTS/check_pipeline.py
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+from bench_crawl import all_jobs
+from bench_pipeline import fixture_pages
+from build_manifest import WRITTEN, BuildManifest
+from build_pipeline import BuildPipeline
+
+
+class FailingPipeline(BuildPipeline):
+    """BuildPipeline whose manifest check raises for the page at fail_check_url"""
+
+    def __init__(self, *args, fail_check_url=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_check_url = fail_check_url
+
+    def _is_current(self, job, html):
+        if job.url == self.fail_check_url:
+            raise OSError(f"cannot read {job.output_file}")
+        return super()._is_current(job, html)
+
+
+def check(pages, jobs, root):
+    """Problems found building jobs into root; an empty list if none"""
+    jobs = [job._replace(output_file=root / job.output_file) for job in jobs]
+    for job in jobs:
+        job.output_file.parent.mkdir(parents=True, exist_ok=True)
+    fail_check, fail_hook = jobs[0], jobs[1]
+    statuses = {}
+
+    def on_status(job, status):
+        statuses[job.url] = status
+        return True
+
+    def on_converted(job, markdown_sha256):
+        if job.url == fail_hook.url:
+            raise OSError("journal is locked")
+
+    pipeline = FailingPipeline(BuildManifest(root / "manifest.json", force=True), on_status,
+                               workers=1, on_converted=on_converted,
+                               on_error=lambda job, error: None,
+                               fail_check_url=fail_check.url)
+    with contextlib.redirect_stdout(io.StringIO()):
+        pipeline.run(jobs, fetch=pages.__getitem__)
+
+    problems = []
+    for job, stage in ((fail_check, 'parse_walk'), (fail_hook, 'write')):
+        page = pipeline.metrics.page(job)
+        if page.status != 'error' or page.error_stage != stage:
+            problems.append(f"{job.url}: expected an error in {stage}, "
+                            f"got {page.status} ({page.error_stage})")
+        if job.output_file.exists():
+            problems.append(f"{job.url}: failed page was written")
+    for job in jobs[2:]:
+        if statuses.get(job.url) != WRITTEN or not job.output_file.exists():
+            problems.append(f"{job.url}: not written ({statuses.get(job.url)})")
+    problems.extend(f"left behind: {path}" for path in root.rglob("*.md.tmp*"))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check page error handling of the pipeline")
+    parser.add_argument('--pages', type=int, default=6,
+                        help="corpus pages to build (at least 3)")
+    args = parser.parse_args()
+
+    jobs = all_jobs("http://fixture")
+    pages = fixture_pages(jobs)
+    jobs = [job for job in jobs if job.url in pages][:max(3, args.pages)]
+    with tempfile.TemporaryDirectory() as tmp:
+        problems = check(pages, jobs, Path(tmp))
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(f"{len(problems)} problems")
+    print(f"{len(jobs)} pages built, 2 failing: pipeline kept going and cleaned up")
+
+
+if __name__ == "__main__":
+    main()
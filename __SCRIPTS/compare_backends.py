@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Parity and speed of every parser backend against the reference converter
+
+Every page in the catalog (rendered from the corpus by html_fixtures.py) is
+converted by reference_converter.html_to_markdown and by each installed
+backend in parser_backends.py; any page whose Markdown differs is reported
+and makes the script exit non-zero. --fuzz adds random tag-soup pages from
+compare_converters.py, where only html.parser is expected to agree; their
+mismatches are counted but do not fail the run.
+
+    python __SCRIPTS/compare_backends.py --fuzz 500
+"""
+
+import argparse
+import random
+import sys
+import time
+
+import reference_converter
+from compare_converters import random_page, report_mismatch
+from html_fixtures import corpus_pages
+from parser_backends import BACKENDS, is_available, html_to_markdown
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare parser backends with the reference converter")
+    parser.add_argument('--backends', nargs='+', choices=sorted(BACKENDS), default=list(BACKENDS))
+    parser.add_argument('--fuzz', type=int, default=0,
+                        help="random malformed pages to compare as well (informational)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    backends = []
+    for name in args.backends:
+        if is_available(name):
+            backends.append(name)
+        else:
+            print(f"{name}: not installed, skipped")
+
+    pages = list(corpus_pages(seed=args.seed))
+    expected = {name: reference_converter.html_to_markdown(html) for name, html in pages}
+    total_bytes = sum(len(html.encode('utf-8')) for _, html in pages)
+
+    failed = False
+    rows = []
+    for backend in backends:
+        elapsed = 0.0
+        mismatches = 0
+        for name, html in pages:
+            start = time.perf_counter()
+            actual = html_to_markdown(html, backend)
+            elapsed += time.perf_counter() - start
+            if actual != expected[name]:
+                mismatches += 1
+                report_mismatch(f"{backend} {name}", html, expected[name], actual)
+        failed = failed or mismatches > 0
+
+        fuzz_mismatches = 0
+        rng = random.Random(args.seed)
+        for _ in range(args.fuzz):
+            html = random_page(rng)
+            if html_to_markdown(html, backend) != reference_converter.html_to_markdown(html):
+                fuzz_mismatches += 1
+        rows.append((backend, elapsed, mismatches, fuzz_mismatches))
+
+    print(f"\n{len(pages)} catalog pages, {total_bytes / 2**20:.1f} MB of HTML")
+    print(f"{'backend':<12} {'seconds':>8} {'MB/s':>7} {'pages/s':>8} {'catalog diffs':>14} "
+          f"{'fuzz diffs':>11}")
+    for backend, elapsed, mismatches, fuzz_mismatches in rows:
+        fuzz = f"{fuzz_mismatches}/{args.fuzz}" if args.fuzz else "-"
+        print(f"{backend:<12} {elapsed:8.2f} {total_bytes / 2**20 / elapsed:7.2f} "
+              f"{len(pages) / elapsed:8.1f} {mismatches:>14} {fuzz:>11}")
+
+    if failed:
+        sys.exit(1)
+    print("All backends match the reference on the catalog")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Check the streaming converter against the reference converter
+
+Every page built from the corpus (html_fixtures.py) and a batch of random
+tag-soup pages are converted by both reference_converter.html_to_markdown and
+markdown_converter.html_to_markdown; any difference is reported and makes the
+script exit non-zero. For the corpus pages it also reports time and peak
+traced memory of each converter. Every page is also fed to
+streaming_fetch.convert_chunks in random-sized byte chunks, as it would
+arrive over the network, which must not change its Markdown either.
+
+    python __SCRIPTS/compare_converters.py --fuzz 2000
+"""
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+import markdown_converter
+import reference_converter
+from html_fixtures import corpus_pages
+from streaming_fetch import convert_chunks
+
+# Building blocks for random pages: markup the site uses plus the malformed
+# and unusual constructs html.parser and BeautifulSoup treat specially
+FUZZ_TOKENS = [
+    'text', '本文です。', '第一章 霊とは', '第３節 死後', '第十部', '  ', '\n', '\t \n ',
+    '　全角　', 'Start content', '#見出し', '## 既存', '#第二章 霊界', '## 第３節',
+    '# #第一巻', '#\u3000第五部', 'a&amp;b', '&lt;br&gt;', '&nbsp;',
+    '&copy2023', '&unknown;', '&#12354;', '&#x3042;', '&#150;', '&#0;', '&#xD800;',
+    '&#12a;', '&#', '&', '<', '>',
+    '<br>', '<br/>', '<br />', '<BR>', '</br>', '<br clear="all">', '<br clear>',
+    '<!-- c -->', '<!---->', '<!-- a <br> b -->', '<!bogus>', '<!DOCTYPE x>',
+    '<![CDATA[ cd<br>ata ]]>', '<![if !IE]>', '<![endif]>', '<?php echo 1 ?>',
+    '<p>', '</p>', '<div>', '</div>', '<span>', '</span>', '<i>', '</i>',
+    '<b>', '</b>', '<strong>', '</strong>', '<center>', '</center>',
+    '<font color="#0064FF" size="4">', '<font color="#0066ff" size="2">',
+    '<font color="#0000ff">', '<font color="red" size="5">', '<FONT COLOR=#0064ff SIZE=3>',
+    '<font color="#0064ff" color="red">', '</font>',
+    '<h1>', '</h1>', '<h3>', '</h3>', '<h6>', '</h6>', '<h2/>',
+    '<pre>', '</pre>', '<textarea>', '</textarea>', '<ruby>', '<rt>', '</rt>', '</ruby>',
+    '<script>var a = 1 < 2; <!-- x --> <br></script>', '<style>p {}</style>',
+    '<template>', '</template>', '<img src="a.png">', '<hr/>', '<a name="x"/>',
+    '<table><tr><td>', '</td></tr></table>', '<div id="content">', '<div id=content>',
+]
+
+
+def random_page(rng, length=60):
+    """A random, often malformed, page with a div#content somewhere in it"""
+    tokens = [rng.choice(FUZZ_TOKENS) for _ in range(length)]
+    if rng.random() < 0.9:
+        tokens.insert(rng.randrange(len(tokens) // 2 + 1), '<div id="content">')
+    return ''.join(tokens)
+
+
+def deep_page(depth):
+    """A heading nested depth elements deep inside div#content"""
+    return ('<div id="content">' + '<span>x<i>' * depth
+            + '<font color="#0064ff" size="4">第一章 深い</font>' + '</i></span>' * depth + '</div>')
+
+
+def random_chunks(data, rng, max_size):
+    """data cut at random points into pieces of 1 to max_size bytes"""
+    start = 0
+    while start < len(data):
+        size = rng.randint(1, max_size)
+        yield data[start:start + size]
+        start += size
+
+
+def chunked_markdown(html, rng):
+    """The Markdown of html fed to the converter in random-sized chunks"""
+    max_size = rng.choice([1, 16, 4096])
+    return convert_chunks(random_chunks(html.encode('utf-8'), rng, max_size),
+                          lambda: html).markdown
+
+
+def measure(convert, html):
+    """(output, seconds, peak traced bytes) of one conversion
+
+    Timed and traced in separate runs, since tracemalloc slows allocation
+    heavy code (the reference converter) far more than the rest.
+    """
+    start = time.perf_counter()
+    output = convert(html)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    convert(html)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return output, elapsed, peak
+
+
+def report_mismatch(name, html, expected, actual):
+    print(f"MISMATCH {name}")
+    if len(html) < 2000:
+        print(f"  html:      {html!r}")
+    for i, (a, b) in enumerate(zip(expected, actual)):
+        if a != b:
+            print(f"  first difference at char {i}")
+            print(f"  reference: {expected[max(0, i - 60):i + 60]!r}")
+            print(f"  streaming: {actual[max(0, i - 60):i + 60]!r}")
+            break
+    else:
+        print(f"  lengths differ: reference {len(expected)}, streaming {len(actual)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the streaming and reference converters")
+    parser.add_argument('--fuzz', type=int, default=500,
+                        help="number of random pages to compare")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--depth', type=int, default=20000,
+                        help="nesting depth of the page only the streaming converter can handle")
+    args = parser.parse_args()
+
+    mismatches = 0
+    chunk_rng = random.Random(args.seed)
+    totals = {'reference': [0.0, 0], 'streaming': [0.0, 0]}
+    print(f"{'page':<40} {'ref ms':>8} {'new ms':>8} {'ref peak':>10} {'new peak':>10}")
+    for name, html in corpus_pages(seed=args.seed):
+        expected, ref_time, ref_peak = measure(reference_converter.html_to_markdown, html)
+        actual, new_time, new_peak = measure(markdown_converter.html_to_markdown, html)
+        totals['reference'][0] += ref_time
+        totals['reference'][1] = max(totals['reference'][1], ref_peak)
+        totals['streaming'][0] += new_time
+        totals['streaming'][1] = max(totals['streaming'][1], new_peak)
+        print(f"{name:<40} {ref_time * 1000:8.1f} {new_time * 1000:8.1f} "
+              f"{ref_peak / 2**20:8.1f}MB {new_peak / 2**20:8.1f}MB")
+        if expected != actual:
+            mismatches += 1
+            report_mismatch(name, html, expected, actual)
+        chunked = chunked_markdown(html, chunk_rng)
+        if chunked != actual:
+            mismatches += 1
+            report_mismatch(f"{name} (chunked)", html, actual, chunked)
+
+    ref_total, ref_peak = totals['reference']
+    new_total, new_peak = totals['streaming']
+    print(f"\nCorpus: reference {ref_total:.2f} s, streaming {new_total:.2f} s "
+          f"(x{ref_total / new_total:.2f}); peak {ref_peak / 2**20:.1f} MB -> "
+          f"{new_peak / 2**20:.1f} MB")
+
+    rng = random.Random(args.seed)
+    for i in range(args.fuzz):
+        html = random_page(rng)
+        expected = reference_converter.html_to_markdown(html)
+        actual = markdown_converter.html_to_markdown(html)
+        if expected != actual:
+            mismatches += 1
+            report_mismatch(f"fuzz #{i}", html, expected, actual)
+        chunked = chunked_markdown(html, chunk_rng)
+        if chunked != actual:
+            mismatches += 1
+            report_mismatch(f"fuzz #{i} (chunked)", html, actual, chunked)
+    print(f"Fuzz: {args.fuzz} random pages compared, whole and in chunks")
+
+    # Within the recursion limit both must agree; far beyond it only the
+    # streaming converter can run at all
+    html = deep_page(200)
+    if reference_converter.html_to_markdown(html) != markdown_converter.html_to_markdown(html):
+        mismatches += 1
+        print("MISMATCH deep page (200 levels)")
+    if '# 第一章 深い' not in markdown_converter.html_to_markdown(deep_page(args.depth)):
+        mismatches += 1
+        print(f"MISMATCH deep page ({args.depth} levels): heading lost")
+    print(f"Deep nesting: 200 levels compared, {args.depth} levels converted")
+
+    if mismatches:
+        print(f"{mismatches} mismatches")
+        sys.exit(1)
+    print("All outputs identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compressed random-access archive of the whole Markdown corpus
+
+Every *_volumes/*.md file is cut at its "#" headings into frames (the text
+before the first heading is a frame of its own), and each frame is
+compressed independently with a dictionary trained on the corpus, so one
+section can be read back by decompressing one frame. The books share a lot
+of vocabulary, which is what the dictionary captures; without it small
+frames compress noticeably worse than whole files.
+
+Codecs:
+
+    zstd  zstandard with a trained dictionary, if the zstandard module is
+          installed
+    zlib  deflate with a preset dictionary (at most 32 KB) of the corpus's
+          most frequent character 4-grams; always available
+
+Layout: header, dictionary, frames, then a fixed-size frame index (file,
+heading level/unit/number, offset and length in the original file and in
+the archive) and JSON metadata (codec, files with their size and sha256).
+
+    python __SCRIPTS/corpus_archive.py pack --codec zlib
+    python __SCRIPTS/corpus_archive.py stats
+    python __SCRIPTS/corpus_archive.py extract wickland_volumes/wickland.md 第１５章
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+from collections import Counter, namedtuple
+from pathlib import Path
+
+from section_store import corpus_files, parse_label, scan_headings
+
+DEFAULT_ARCHIVE = Path("corpus.mdar")
+CODECS = ['zstd', 'zlib']
+
+MAGIC = b"MDARCH01"
+# magic, codec name, dictionary offset and size, index offset, frame count,
+# meta offset and size
+HEADER = struct.Struct("<8s8sQIQIQI")
+# file id, heading level, heading unit, heading number, offset and length in
+# the Markdown file, offset and length of the compressed frame
+FRAME = struct.Struct("<IBBIQIQI")
+
+ZLIB_DICT_SIZE = 32 * 1024   # deflate's window; a larger dictionary is not used
+ZSTD_DICT_SIZE = 112 * 1024
+DEFAULT_LEVELS = {'zlib': 9, 'zstd': 19}
+
+Frame = namedtuple("Frame", ["index", "file_id", "level", "unit", "number", "raw_offset",
+                             "raw_length", "data_offset", "data_length"])
+
+
+def is_available(codec):
+    return codec == 'zlib' or importlib.util.find_spec('zstandard') is not None
+
+
+def default_codec():
+    return next(codec for codec in CODECS if is_available(codec))
+
+
+def split_frames(data):
+    """(level, unit, number, offset, length) of each frame of Markdown bytes
+
+    A frame runs from one heading to the next heading of any level.
+    """
+    headings = scan_headings(data)
+    frames = []
+    if not headings or headings[0][3] > 0:
+        end = headings[0][3] if headings else len(data)
+        if end:
+            frames.append((0, 0, 0, 0, end))
+    for i, (level, unit, number, offset, _) in enumerate(headings):
+        end = headings[i + 1][3] if i + 1 < len(headings) else len(data)
+        frames.append((level, unit, number, offset, end - offset))
+    return frames
+
+
+# -- dictionaries -----------------------------------------------------------
+
+def train_zlib_dictionary(samples, size=ZLIB_DICT_SIZE, sample_chars=3000, min_count=4):
+    """Preset deflate dictionary of the samples' most frequent 4-grams
+
+    Deflate finds matches at short distances more cheaply, so the most
+    valuable strings go last.
+    """
+    counts = Counter()
+    for sample in samples:
+        text = sample[:sample_chars * 3].decode('utf-8', errors='ignore')
+        counts.update(text[i:i + 4] for i in range(len(text) - 3))
+    chosen = []
+    total = 0
+    for gram, count in sorted(counts.items(), key=lambda item: -item[1] * len(item[0])):
+        if count < min_count:
+            break
+        data = gram.encode('utf-8')
+        if total + len(data) > size:
+            break
+        chosen.append(gram)
+        total += len(data)
+    return ''.join(reversed(chosen)).encode('utf-8')
+
+
+def train_dictionary(codec, samples):
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.train_dictionary(ZSTD_DICT_SIZE, samples).as_bytes()
+    return train_zlib_dictionary(samples)
+
+
+# -- compression ------------------------------------------------------------
+
+def compressor(codec, dictionary, level=None):
+    """compress(bytes) -> bytes for one frame"""
+    level = level or DEFAULT_LEVELS[codec]
+    if codec == 'zstd':
+        import zstandard
+        cctx = zstandard.ZstdCompressor(
+            level=level, write_checksum=True,
+            dict_data=zstandard.ZstdCompressionDict(dictionary) if dictionary else None)
+        return cctx.compress
+
+    def compress(data):
+        if dictionary:
+            cobj = zlib.compressobj(level, zdict=dictionary)
+        else:
+            cobj = zlib.compressobj(level)
+        return cobj.compress(data) + cobj.flush()
+    return compress
+
+
+def decompressor(codec, dictionary):
+    """decompress(bytes) -> bytes for one frame"""
+    if codec == 'zstd':
+        import zstandard
+        dctx = zstandard.ZstdDecompressor(
+            dict_data=zstandard.ZstdCompressionDict(dictionary) if dictionary else None)
+        return dctx.decompress
+
+    def decompress(data):
+        dobj = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return dobj.decompress(data) + dobj.flush()
+    return decompress
+
+
+def pack(output=DEFAULT_ARCHIVE, root=".", codec=None, level=None, use_dictionary=True):
+    """Write the archive; returns (raw bytes, archive bytes, seconds)"""
+    codec = codec or default_codec()
+    if not is_available(codec):
+        raise SystemExit(f"Codec {codec} needs the zstandard module")
+    root = Path(root)
+    start = time.perf_counter()
+    files = []
+    plan = []   # (file id, frame record, frame bytes)
+    for file_id, path in enumerate(corpus_files(root)):
+        data = path.read_bytes()
+        files.append({'path': path.relative_to(root).as_posix(), 'size': len(data),
+                      'sha256': hashlib.sha256(data).hexdigest()})
+        for record in split_frames(data):
+            _, _, _, offset, length = record
+            plan.append((file_id, record, data[offset:offset + length]))
+    if not plan:
+        raise SystemExit(f"No *_volumes/*.md files under {root}")
+    dictionary = train_dictionary(codec, [frame for _, _, frame in plan]) if use_dictionary else b''
+    compress = compressor(codec, dictionary, level)
+
+    output = Path(output)
+    tmp_file = output.with_name(f"{output.name}.tmp{os.getpid()}")
+    index = bytearray()
+    with open(tmp_file, 'wb') as f:
+        f.write(b'\0' * HEADER.size)
+        dictionary_offset = f.tell()
+        f.write(dictionary)
+        for file_id, record, frame in plan:
+            compressed = compress(frame)
+            index += FRAME.pack(file_id, *record, f.tell(), len(compressed))
+            f.write(compressed)
+        index_offset = f.tell()
+        f.write(index)
+        meta_offset = f.tell()
+        meta = json.dumps({'codec': codec, 'level': level or DEFAULT_LEVELS[codec],
+                           'files': files}, ensure_ascii=False).encode('utf-8')
+        f.write(meta)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, codec.encode('ascii'), dictionary_offset, len(dictionary),
+                            index_offset, len(plan), meta_offset, len(meta)))
+    os.replace(tmp_file, output)
+    raw_size = sum(entry['size'] for entry in files)
+    return raw_size, output.stat().st_size, time.perf_counter() - start
+
+
+# -- reading ----------------------------------------------------------------
+
+class CorpusArchive:
+    """Random access to the frames of a packed archive through mmap"""
+
+    def __init__(self, path=DEFAULT_ARCHIVE):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, codec, dictionary_offset, dictionary_size, index_offset, frame_count, meta_offset,
+         meta_size) = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a corpus archive")
+        self.codec = codec.rstrip(b'\0').decode('ascii')
+        if not is_available(self.codec):
+            raise RuntimeError(f"{self.path} is {self.codec}-compressed; install zstandard")
+        self.meta = json.loads(self._map[meta_offset:meta_offset + meta_size].decode('utf-8'))
+        self.files = [entry['path'] for entry in self.meta['files']]
+        self.dictionary_size = dictionary_size
+        self._decompress = decompressor(
+            self.codec, self._map[dictionary_offset:dictionary_offset + dictionary_size])
+        self.frames = [Frame(i, *FRAME.unpack_from(self._map, index_offset + i * FRAME.size))
+                       for i in range(frame_count)]
+        self._file_frames = {}
+        for frame in self.frames:
+            self._file_frames.setdefault(frame.file_id, []).append(frame)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def raw_size(self):
+        return sum(entry['size'] for entry in self.meta['files'])
+
+    def read_frame(self, frame):
+        return self._decompress(self._map[frame.data_offset:frame.data_offset + frame.data_length])
+
+    def file_frames(self, path):
+        try:
+            return self._file_frames[self.files.index(Path(path).as_posix())]
+        except ValueError:
+            raise KeyError(f"{path} is not in {self.path}") from None
+
+    def read_file(self, path):
+        """Bytes of one Markdown file, checked against its recorded sha256"""
+        data = b''.join(self.read_frame(frame) for frame in self.file_frames(path))
+        expected = self.meta['files'][self.files.index(Path(path).as_posix())]['sha256']
+        if hashlib.sha256(data).hexdigest() != expected:
+            raise ValueError(f"{path}: checksum mismatch in {self.path}")
+        return data
+
+    def find(self, path, label):
+        """Frames of the section numbered like label ("第三章"): its own frame
+        and those of the headings nested under it; None if there is none"""
+        parsed = parse_label(label)
+        if parsed is None:
+            return None
+        frames = self.file_frames(path)
+        for i, frame in enumerate(frames):
+            if frame.level and (frame.unit, frame.number) == parsed:
+                end = i + 1
+                while end < len(frames) and frames[end].level > frame.level:
+                    end += 1
+                return frames[i:end]
+        return None
+
+    def read_section(self, path, label):
+        frames = self.find(path, label)
+        if frames is None:
+            return None
+        return b''.join(self.read_frame(frame) for frame in frames).decode('utf-8')
+
+
+def print_stats(archive, samples=200, seed=0):
+    archive_size = archive.path.stat().st_size
+    raw_size = archive.raw_size
+    print(f"{archive.path}: {len(archive.files)} files, {len(archive.frames)} frames, "
+          f"{archive.codec} with a {archive.dictionary_size / 1024:.0f} KB dictionary")
+    print(f"{raw_size / 2**20:.2f} MB -> {archive_size / 2**20:.2f} MB, "
+          f"ratio {raw_size / archive_size:.2f}")
+
+    start = time.perf_counter()
+    for frame in archive.frames:
+        archive.read_frame(frame)
+    elapsed = time.perf_counter() - start
+    print(f"Full decode: {elapsed:.3f} s, {raw_size / 2**20 / elapsed:.1f} MB/s")
+
+    rng = random.Random(seed)
+    picks = [rng.choice(archive.frames) for _ in range(samples)]
+    start = time.perf_counter()
+    for frame in picks:
+        archive.read_frame(frame)
+    elapsed = time.perf_counter() - start
+    print(f"Random access: {samples} frames, {elapsed / samples * 1e6:.0f} us per frame "
+          f"(mean frame {sum(f.raw_length for f in picks) / samples / 1024:.1f} KB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack and read the compressed corpus archive")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    pack_parser = subparsers.add_parser('pack', help="pack every *_volumes/*.md")
+    pack_parser.add_argument('--root', type=Path, default=Path("."))
+    pack_parser.add_argument('--archive', type=Path, default=DEFAULT_ARCHIVE)
+    pack_parser.add_argument('--codec', choices=CODECS,
+                             help="default: zstd if installed, else zlib")
+    pack_parser.add_argument('--level', type=int)
+    pack_parser.add_argument('--no-dictionary', action='store_true')
+    stats_parser = subparsers.add_parser('stats', help="compression ratio and decode speed")
+    stats_parser.add_argument('--archive', type=Path, default=DEFAULT_ARCHIVE)
+    stats_parser.add_argument('--samples', type=int, default=200, help="random frames to read")
+    extract_parser = subparsers.add_parser('extract', help="print a file or one of its sections")
+    extract_parser.add_argument('file')
+    extract_parser.add_argument('label', nargs='?', help='numbered heading, e.g. 第三章')
+    extract_parser.add_argument('--archive', type=Path, default=DEFAULT_ARCHIVE)
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        raw_size, archive_size, elapsed = pack(args.archive, args.root, args.codec, args.level,
+                                               not args.no_dictionary)
+        print(f"Packed {raw_size / 2**20:.2f} MB into {args.archive} "
+              f"({archive_size / 2**20:.2f} MB, ratio {raw_size / archive_size:.2f}) "
+              f"in {elapsed:.1f} s")
+        return
+
+    with CorpusArchive(args.archive) as archive:
+        if args.command == 'stats':
+            print_stats(archive, args.samples)
+        elif args.label:
+            text = archive.read_section(args.file, args.label)
+            if text is None:
+                sys.exit(f"No section {args.label} in {args.file}")
+            print(text)
+        else:
+            sys.stdout.buffer.write(archive.read_file(args.file))
+
+
+if __name__ == "__main__":
+    main()
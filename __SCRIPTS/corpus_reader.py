@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Lazy, memory-mapped reading of the generated Markdown corpus
+
+Each *_volumes/*.md file is mapped with mmap rather than read into memory,
+and its lines, paragraphs (runs of lines between blank lines) and sections
+(from the section_store.py offset index) are yielded as Passage objects
+holding a memoryview slice of the mapping. Nothing is copied or decoded
+until text() or bytes() is called, and only the pages a caller touches are
+paged in, so walking the whole catalog keeps one file mapped at a time and
+holds no more than the passage being looked at.
+
+A Passage's view is only valid while its file is open: call text() or
+bytes() on anything kept past the iteration.
+
+    python __SCRIPTS/corpus_reader.py --unit sections
+"""
+
+import argparse
+import mmap
+import time
+import tracemalloc
+from pathlib import Path
+
+from section_store import SectionStore, corpus_files
+
+
+class Passage:
+    """A slice of a mapped Markdown file, decoded on request"""
+
+    __slots__ = ('path', 'offset', 'view')
+
+    def __init__(self, path, offset, view):
+        self.path = path
+        self.offset = offset
+        self.view = view
+
+    def __len__(self):
+        return len(self.view)
+
+    def bytes(self):
+        return self.view.tobytes()
+
+    def text(self):
+        return str(self.view, 'utf-8')
+
+    def __repr__(self):
+        return f"Passage({self.path}, offset={self.offset}, {len(self.view)} bytes)"
+
+
+class CorpusFile:
+    """One Markdown file mapped read-only"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        size = self.path.stat().st_size
+        # mmap cannot map an empty file
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self._view = memoryview(self._map)
+
+    def close(self):
+        self._view.release()
+        if self._map:
+            try:
+                self._map.close()
+            except BufferError:
+                # A caller still holds a Passage view; the mapping goes
+                # away with the last reference instead
+                pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _passage(self, start, end):
+        return Passage(self.path, start, self._view[start:end])
+
+    def lines(self):
+        """(1-based line number, Passage) of every line, newline excluded"""
+        data = self._map
+        end = len(data)
+        start = 0
+        line_number = 1
+        while start < end:
+            newline = data.find(b'\n', start)
+            if newline < 0:
+                newline = end
+            yield line_number, self._passage(start, newline)
+            start = newline + 1
+            line_number += 1
+
+    def paragraphs(self):
+        """Passages of consecutive non-blank lines; headings count as paragraphs"""
+        data = self._map
+        end = len(data)
+        start = 0
+        while start < end:
+            while start < end and data[start] == 0x0a:
+                start += 1
+            if start >= end:
+                break
+            stop = data.find(b'\n\n', start)
+            if stop < 0:
+                stop = end
+            yield self._passage(start, stop)
+            start = stop
+
+    def sections(self, level=None):
+        """(Section, Passage) of every section, or those at one heading level"""
+        with SectionStore(self.path) as store:
+            sections = store.sections
+        for section in sections:
+            if level is None or section.level == level:
+                yield section, self._passage(section.offset, section.offset + section.length)
+
+
+def iter_corpus(root=".", unit='paragraphs'):
+    """Passages of every corpus file, one mapped file at a time
+
+    unit is 'lines', 'paragraphs' or 'sections'; lines come as (line number,
+    Passage) and sections as (Section, Passage) pairs.
+    """
+    for path in corpus_files(root):
+        with CorpusFile(path) as corpus_file:
+            yield from getattr(corpus_file, unit)()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk the corpus through memory-mapped files")
+    parser.add_argument('--root', type=Path, default=Path("."))
+    parser.add_argument('--unit', choices=['lines', 'paragraphs', 'sections'], default='paragraphs')
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = 0
+    total = 0
+    largest = None
+    for item in iter_corpus(args.root, args.unit):
+        passage = item if args.unit == 'paragraphs' else item[1]
+        # Decode every passage, as a consumer would
+        size = len(passage.text().encode('utf-8'))
+        count += 1
+        total += size
+        if largest is None or size > largest[0]:
+            largest = (size, passage.path, passage.offset)
+        del passage, item
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"{count:,} {args.unit}, {total / 2**20:.1f} MB decoded in {elapsed:.2f} s")
+    if largest:
+        print(f"Largest: {largest[0] / 1024:.0f} KB at {largest[1]}:{largest[2]}")
+    print(f"Peak traced memory: {peak / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
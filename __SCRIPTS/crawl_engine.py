@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Shared asyncio fetch engine used by the scrape scripts"""
+
+import asyncio
+import traceback
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from http_client import fetch_html
+
+# Pages are fetched from a single personal site, so keep this modest
+DEFAULT_PER_HOST = 4
+
+# One page to fetch: where it comes from and where its Markdown goes
+CrawlJob = namedtuple("CrawlJob", ["url", "title", "output_file"])
+
+
+def print_error(job, error):
+    """Default error handler: report the failure and keep crawling"""
+    print(f"Error scraping {job.title}: {error}")
+    traceback.print_exception(type(error), error, error.__traceback__)
+
+
+async def _fetch_job(job, semaphores, executor, fetch):
+    """Fetch one job while holding its host's semaphore"""
+    host = urlsplit(job.url).netloc
+    async with semaphores[host]:
+        print(f"Scraping {job.title} from {job.url}...")
+        loop = asyncio.get_running_loop()
+        try:
+            html = await loop.run_in_executor(executor, fetch, job.url)
+        except Exception as e:
+            return job, None, e
+    return job, html, None
+
+
+async def crawl(jobs, on_page, per_host=DEFAULT_PER_HOST, fetch=fetch_html,
+                on_error=print_error):
+    """Fetch all jobs concurrently and hand each page to on_page as it arrives
+
+    Blocking fetches run in a thread pool; at most per_host requests are in
+    flight against any one host. on_page(job, html) runs on the event loop
+    thread in completion order, so the converter never sees two pages at
+    once. Returns the number of pages that on_page accepted.
+
+    jobs may also be a lazy iterable, such as the claims handed out by
+    crawl_journal.py: it is advanced only when a fetch slot frees up, and
+    then gets per_host slots in all.
+    """
+    if isinstance(jobs, (list, tuple)):
+        if not jobs:
+            return 0
+        hosts = {urlsplit(job.url).netloc for job in jobs}
+        max_workers = max(1, min(len(jobs), per_host * len(hosts)))
+    else:
+        max_workers = max(1, per_host)
+
+    semaphores = defaultdict(lambda: asyncio.Semaphore(per_host))
+    pending = iter(jobs)
+
+    async def worker(executor):
+        # Every worker pulls from the same iterator; next() never awaits,
+        # so no two workers see the same job
+        succeeded = 0
+        for job in pending:
+            job, html, error = await _fetch_job(job, semaphores, executor, fetch)
+            if error is not None:
+                on_error(job, error)
+                continue
+            try:
+                if on_page(job, html):
+                    succeeded += 1
+            except Exception as e:
+                on_error(job, e)
+        return succeeded
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        counts = await asyncio.gather(*(worker(executor) for _ in range(max_workers)))
+    return sum(counts)
+
+
+def run_crawl(jobs, on_page, per_host=DEFAULT_PER_HOST, fetch=fetch_html,
+              on_error=print_error):
+    """Synchronous entry point for crawl()"""
+    return asyncio.run(crawl(jobs, on_page, per_host=per_host, fetch=fetch,
+                             on_error=on_error))
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Crash-safe journal of a scrape run's pages, shared by concurrent runs
+
+Every page of a run is a row in an SQLite database (WAL mode) that moves
+through QUEUED -> FETCHED -> CONVERTED -> WRITTEN. FETCHED records the
+html_cache object the page was fetched into, so a restarted run converts
+that exact body again without asking the server; a page that died after
+CONVERTED is converted again from it (the build manifest turns a write
+that had already happened into a no-op). Pages are handed out one at a
+time by claim(), which marks the row with the run's owner id inside an
+IMMEDIATE transaction, so runs sharing the journal claim disjoint pages.
+A run that claims pages registers in the workers table and heartbeats
+every HEARTBEAT_SECONDS from a background thread. Claims are dropped when
+their run ends, when its process is gone (same machine) or when its
+heartbeat is HEARTBEAT_TIMEOUT seconds old (any machine).
+
+WAL needs shared memory, so it only works while every process is on one
+machine. For runs on several hosts sharing a filesystem, open the journal
+with shared=True: it then uses the rollback journal and file locks, which
+need a filesystem with working POSIX locks (NFSv4, for instance).
+
+Once every page of a selection is WRITTEN, enqueueing it again starts a
+fresh pass. scrape.py keeps its journal in .crawl_journal.sqlite:
+
+    python __SCRIPTS/crawl_journal.py status
+    python __SCRIPTS/crawl_journal.py reset
+"""
+
+import argparse
+import contextlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from crawl_engine import CrawlJob
+
+DEFAULT_JOURNAL = Path(".crawl_journal.sqlite")
+HEARTBEAT_SECONDS = 5.0
+# A run whose heartbeat is this old is taken for dead and its claims freed
+HEARTBEAT_TIMEOUT = 30.0
+
+QUEUED = "queued"
+FETCHED = "fetched"
+CONVERTED = "converted"
+WRITTEN = "written"
+STATES = (QUEUED, FETCHED, CONVERTED, WRITTEN)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    output_file TEXT NOT NULL,
+    state TEXT NOT NULL,
+    html_object TEXT,
+    markdown_sha256 TEXT,
+    status TEXT,
+    owner TEXT,
+    worker TEXT,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_owner ON pages (owner);
+CREATE TABLE IF NOT EXISTS workers (
+    owner TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    finished_at REAL,
+    pages INTEGER NOT NULL DEFAULT 0,
+    report TEXT
+);
+"""
+
+
+def make_owner():
+    """host:pid:nonce, so a dead run on this machine can be recognized"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def owner_is_dead(owner):
+    """True if owner ran on this machine and its process is gone"""
+    host, _, rest = owner.partition(':')
+    pid = rest.partition(':')[0]
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+class CrawlJournal:
+    """One run's handle on the journal database
+
+    Safe to use from the fetch threads and the event loop at once: every
+    statement goes through one connection under a lock. Until enqueue()
+    names a selection, claim() hands out any unfinished page, which is how
+    crawl_workers.py workers join a queue their coordinator filled.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL, owner=None, shared=False,
+                 heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        self.path = Path(path)
+        self.owner = owner or make_owner()
+        self.heartbeat_timeout = heartbeat_timeout
+        self.resumed = 0
+        self.selected = False
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._stop = threading.Event()
+        self._db = sqlite3.connect(str(self.path), timeout=60, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(f"PRAGMA journal_mode={'DELETE' if shared else 'WAL'}")
+        self._db.execute(f"PRAGMA synchronous={'FULL' if shared else 'NORMAL'}")
+        self._db.executescript(SCHEMA)
+        columns = {row['name'] for row in self._db.execute("PRAGMA table_info(pages)")}
+        if 'worker' not in columns:
+            # Journals written before runs were tracked as workers
+            self._db.execute("ALTER TABLE pages ADD COLUMN worker TEXT")
+        self._db.execute("CREATE TEMP TABLE IF NOT EXISTS selection (url TEXT PRIMARY KEY)")
+
+    def close(self):
+        if self._heartbeat is not None:
+            self._stop.set()
+            self._heartbeat.join()
+            self._heartbeat = None
+            self.finish()
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        self.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so two runs never both
+        # read a page as unclaimed
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def enqueue(self, jobs):
+        """Make jobs this run's selection; True if that starts a fresh pass"""
+        self.selected = True
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("DELETE FROM selection")
+            db.executemany("INSERT OR IGNORE INTO selection (url) VALUES (?)",
+                           [(job.url,) for job in jobs])
+            unfinished = db.execute("SELECT COUNT(*) FROM pages JOIN selection USING (url) "
+                                    "WHERE state != ?", (WRITTEN,)).fetchone()[0]
+            db.executemany("INSERT INTO pages (url, title, output_file, state, updated_at) "
+                           "VALUES (?, ?, ?, ?, ?) ON CONFLICT (url) DO UPDATE SET "
+                           "title = excluded.title, output_file = excluded.output_file",
+                           [(job.url, job.title, str(job.output_file), QUEUED, now)
+                            for job in jobs])
+            if unfinished:
+                return False
+            db.execute("UPDATE pages SET state = ?, html_object = NULL, markdown_sha256 = NULL, "
+                       "status = NULL, attempts = 0, error = NULL, updated_at = ? "
+                       "WHERE url IN (SELECT url FROM selection)", (QUEUED, now))
+            return True
+
+    def _pages(self):
+        """FROM clause of the pages this run works on"""
+        return "pages JOIN selection USING (url)" if self.selected else "pages"
+
+    def start_heartbeat(self):
+        """Register this run in the workers table and keep it marked alive"""
+        if self._heartbeat is not None:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO workers (owner, started_at, heartbeat_at) "
+                             "VALUES (?, ?, ?)", (self.owner, now, now))
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            with self._lock:
+                self._db.execute("UPDATE workers SET heartbeat_at = ? WHERE owner = ?",
+                                 (time.time(), self.owner))
+
+    def finish(self, report=None):
+        """Record that this run is done, and where its metrics report is"""
+        with self._lock:
+            self._db.execute("UPDATE workers SET finished_at = ?, report = COALESCE(?, report), "
+                             "pages = (SELECT COUNT(*) FROM pages WHERE status IS NOT NULL "
+                             "AND worker = ?) WHERE owner = ?",
+                             (time.time(), None if report is None else str(report),
+                              self.owner, self.owner))
+
+    def workers(self, since=0.0):
+        """workers rows of the runs that heartbeat at or after since"""
+        with self._lock:
+            return self._db.execute("SELECT * FROM workers WHERE heartbeat_at >= ? "
+                                    "ORDER BY started_at", (since,)).fetchall()
+
+    def _reap(self, db, now):
+        """Drop the claims of runs that have died or gone quiet"""
+        stale = now - self.heartbeat_timeout
+        owners = [row[0] for row in db.execute(
+            "SELECT DISTINCT pages.owner, workers.heartbeat_at FROM pages "
+            "LEFT JOIN workers ON workers.owner = pages.owner "
+            "WHERE pages.owner IS NOT NULL AND pages.owner != ? "
+            "AND (workers.owner IS NULL OR workers.heartbeat_at < ? "
+            "OR workers.finished_at IS NOT NULL)", (self.owner, stale))]
+        owners += [row[0] for row in db.execute(
+            "SELECT DISTINCT owner FROM pages WHERE owner IS NOT NULL AND owner != ?",
+            (self.owner,)) if owner_is_dead(row[0])]
+        for owner in set(owners):
+            db.execute("UPDATE pages SET owner = NULL WHERE owner = ?", (owner,))
+
+    def claim(self):
+        """The next unfinished, unclaimed page of the selection, now ours, or None"""
+        self.start_heartbeat()
+        now = time.time()
+        with self._transaction() as db:
+            self._reap(db, now)
+            row = db.execute(f"SELECT url, title, output_file FROM {self._pages()} "
+                             "WHERE state != ? AND owner IS NULL ORDER BY pages.rowid LIMIT 1",
+                             (WRITTEN,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE pages SET owner = ?, worker = ?, claimed_at = ?, error = NULL, "
+                       "attempts = attempts + 1 WHERE url = ?",
+                       (self.owner, self.owner, now, row['url']))
+        return CrawlJob(row['url'], row['title'], Path(row['output_file']))
+
+    def claimed_jobs(self):
+        """Claim pages one by one as the caller asks for them"""
+        while True:
+            job = self.claim()
+            if job is None:
+                return
+            yield job
+
+    def wait_for_work(self, poll=HEARTBEAT_SECONDS):
+        """Wait while other live runs hold the only unfinished pages
+
+        Returns True as soon as a page can be claimed again (its run died),
+        False once no other run is still working on any. A page that failed
+        stays claimed by its run until release(), but is not waited for.
+        """
+        while True:
+            with self._transaction() as db:
+                self._reap(db, time.time())
+                claimable, held = db.execute(
+                    f"SELECT COALESCE(SUM(owner IS NULL), 0), "
+                    f"COALESCE(SUM(owner IS NOT NULL AND owner != ? AND error IS NULL), 0) "
+                    f"FROM {self._pages()} WHERE state != ?", (self.owner, WRITTEN)).fetchone()
+            if claimable:
+                return True
+            if not held:
+                return False
+            time.sleep(poll)
+
+    def entry(self, url):
+        with self._lock:
+            return self._db.execute("SELECT * FROM pages WHERE url = ?", (url,)).fetchone()
+
+    def mark(self, url, state, **fields):
+        """Move one of our pages to state, refreshing its claim
+
+        Returns False if the page is no longer ours (our heartbeat lapsed
+        and another run took it over).
+        """
+        now = time.time()
+        fields.update(state=state, updated_at=now, claimed_at=now, error=None)
+        if state == WRITTEN:
+            fields['owner'] = None
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            cursor = self._db.execute(f"UPDATE pages SET {columns} WHERE url = ? AND owner = ?",
+                                      (*fields.values(), url, self.owner))
+        return cursor.rowcount == 1
+
+    def fail(self, url, error):
+        """Record an error; the page stays ours until release()"""
+        with self._lock:
+            self._db.execute("UPDATE pages SET error = ?, updated_at = ? WHERE url = ? AND owner = ?",
+                             (f"{type(error).__name__}: {error}", time.time(), url, self.owner))
+
+    def release(self):
+        """Give up our unfinished claims; returns how many there were"""
+        with self._lock:
+            cursor = self._db.execute("UPDATE pages SET owner = NULL WHERE owner = ?",
+                                      (self.owner,))
+        return cursor.rowcount
+
+    def fetch_with(self, cache, fetch=None):
+        """A fetch(url) that reuses the body a page was journaled with
+
+        Pages already FETCHED or CONVERTED are read back from their cache
+        object; the rest go through fetch (default cache.fetch_html) and
+        are marked FETCHED with the object they were stored as.
+        """
+        fetch = fetch or cache.fetch_html
+
+        def journaled_fetch(url):
+            entry = self.entry(url)
+            if entry is not None and entry['state'] in (FETCHED, CONVERTED) \
+                    and entry['html_object']:
+                path = cache.object_path(entry['html_object'])
+                if path.exists():
+                    with self._lock:
+                        self.resumed += 1
+                    return cache.decode(path.read_bytes())
+            html = fetch(url)
+            cached = cache.lookup(url)
+            self.mark(url, FETCHED, html_object=cached['sha256'] if cached else None)
+            return html
+        return journaled_fetch
+
+    def counts(self, selection_only=True):
+        """Pages per state (and 'claimed'), of the selection or the whole journal"""
+        query = f"SELECT state, owner IS NOT NULL FROM {self._pages() if selection_only else 'pages'}"
+        counts = Counter()
+        with self._lock:
+            for state, claimed in self._db.execute(query):
+                counts[state] += 1
+                counts['claimed'] += claimed
+        return counts
+
+    def summary(self, selection_only=True):
+        counts = self.counts(selection_only)
+        total = sum(counts[state] for state in STATES)
+        return (f"Journal {self.path}: {total} pages, "
+                + ", ".join(f"{counts[state]} {state}" for state in STATES)
+                + f"; {counts['claimed']} claimed, {self.resumed} resumed from the cache")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or reset the crawl journal")
+    parser.add_argument('command', choices=['status', 'reset'])
+    parser.add_argument('--journal', type=Path, default=DEFAULT_JOURNAL)
+    args = parser.parse_args()
+
+    if not args.journal.exists():
+        print(f"No journal at {args.journal}")
+        return
+    with CrawlJournal(args.journal) as journal:
+        if args.command == 'reset':
+            with journal._transaction() as db:
+                deleted = db.execute("DELETE FROM pages").rowcount
+                db.execute("DELETE FROM workers")
+            print(f"Removed {deleted} pages from {args.journal}")
+            return
+        print(journal.summary(selection_only=False))
+        with journal._lock:
+            rows = journal._db.execute("SELECT url, state, owner, attempts, error FROM pages "
+                                       "WHERE state != ? OR error IS NOT NULL ORDER BY rowid",
+                                       (WRITTEN,)).fetchall()
+        for row in rows:
+            owner = f" claimed by {row['owner']}" if row['owner'] else ""
+            error = f" ({row['error']})" if row['error'] else ""
+            print(f"  {row['state']:<10} {row['url']}{owner}, {row['attempts']} attempts{error}")
+        now = time.time()
+        for worker in journal.workers():
+            if worker['finished_at'] is not None:
+                state = f"finished, {worker['pages']} pages"
+            elif now - worker['heartbeat_at'] > journal.heartbeat_timeout:
+                state = "dead"
+            else:
+                state = f"alive, heartbeat {now - worker['heartbeat_at']:.0f} s ago"
+            print(f"  worker {worker['owner']}: {state}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Spread a scrape over several worker processes sharing one crawl journal
+
+The coordinator puts the selected catalog pages (--book/--page as in
+scrape.py, or --discover) into the crawl journal, starts --workers local
+worker processes and waits for them. Each worker claims pages from the
+journal one at a time, fetches, converts and writes them, and heartbeats
+while it runs; the pages of a worker that dies are released and picked up
+by the others (crawl_journal.py). When the queue is empty every worker
+writes its run report, and the coordinator merges them into one.
+
+Workers on other hosts join by running `work` against the same journal,
+cache, manifest and output tree on a shared filesystem, with --shared on
+every process so the journal uses file locks instead of WAL:
+
+    python __SCRIPTS/crawl_workers.py coordinate --workers 4 --book owen
+    python __SCRIPTS/crawl_workers.py work --shared --journal /mnt/scrape/.crawl_journal.sqlite
+
+--per-host is the coordinator's total: its local workers split it, so the
+site sees no more requests at once than it would from scrape.py.
+"""
+
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import catalog
+import crawl_journal
+import scrape
+import site_crawler
+from build_manifest import BuildManifest
+from build_pipeline import BuildPipeline
+from http_client import configure_client, get_client
+from politeness import PolitenessScheduler
+from run_metrics import RunMetrics, merge_runs
+
+PROGRESS_SECONDS = 2.0
+# Per-worker reports and logs, under --report-dir
+WORKERS_DIR = "workers"
+
+
+def build_parser():
+    parser = scrape.build_parser("Scrape with several worker processes sharing a journal")
+    parser.add_argument('role', choices=['coordinate', 'work'],
+                        help="coordinate: queue the pages, run local workers and merge their "
+                             "reports; work: build queued pages until none are left")
+    parser.add_argument('--workers', type=int, default=2,
+                        help="local worker processes the coordinator starts (0: none)")
+    parser.add_argument('--shared', action='store_true',
+                        help="journal on a filesystem shared between hosts (no WAL)")
+    return parser
+
+
+def worker_command(args, per_host, converters):
+    """argv of a local worker with the coordinator's settings"""
+    command = [sys.executable, str(Path(__file__).resolve()), 'work',
+               '--journal', str(args.journal), '--cache-dir', str(args.cache_dir),
+               '--manifest', str(args.manifest), '--report-dir', str(args.report_dir),
+               '--parser', args.parser, '--jobs', str(converters),
+               '--per-host', str(per_host), '--pool-size', str(args.pool_size),
+               '--retries', str(args.retries)]
+    if args.rate:
+        # Each worker paces itself, so split the rate as well
+        command += ['--rate', str(args.rate / args.workers)]
+    for flag in ('from_cache', 'force', 'ignore_robots', 'shared', 'stream', 'sniff_charset'):
+        if getattr(args, flag):
+            command.append('--' + flag.replace('_', '-'))
+    for rule in args.normalize or ():
+        command += ['--normalize', rule]
+    return command
+
+
+def _with_output_dirs(jobs):
+    for job in jobs:
+        job.output_file.parent.mkdir(parents=True, exist_ok=True)
+        yield job
+
+
+def work(args):
+    """Worker: build claimed pages until the queue is empty; returns pages built"""
+    configure_client(pool_size=args.pool_size, retries=args.retries,
+                     scheduler=PolitenessScheduler(args.per_host, rate=args.rate,
+                                                   robots=not args.ignore_robots))
+    cache = scrape.open_cache(args)
+    manifest = BuildManifest(args.manifest, force=args.force)
+    journal = crawl_journal.CrawlJournal(args.journal, shared=args.shared)
+    on_status, on_error, on_converted = scrape.journal_hooks(journal)
+    pipeline = BuildPipeline(manifest, on_status, workers=args.jobs, backend=args.parser,
+                             on_error=on_error, name="worker", on_converted=on_converted,
+                             normalize=args.normalize or ())
+    fetch = journal.fetch_with(cache, scrape.page_fetch(args, cache))
+    print(f"Worker {journal.owner} started")
+
+    built = 0
+    with journal:
+        while True:
+            built += pipeline.run(_with_output_dirs(journal.claimed_jobs()), fetch=fetch,
+                                  per_host=args.per_host)
+            # Pages still held by other workers come back if those die
+            if not journal.wait_for_work():
+                break
+        report = (Path(args.report_dir) / WORKERS_DIR
+                  / f"{re.sub(r'[^0-9A-Za-z_.-]+', '_', journal.owner)}.json")
+        pipeline.metrics.write_json(report)
+        journal.finish(report)
+
+    print(pipeline.summary())
+    print(cache.summary())
+    if not args.from_cache:
+        print(get_client().summary())
+        print(get_client().scheduler_summary())
+    print(f"Worker {journal.owner} done: {built} pages built, report {report}")
+    return built
+
+
+def coordinate(args):
+    """Queue the selected pages, run local workers and merge their reports"""
+    journal = crawl_journal.CrawlJournal(args.journal, shared=args.shared)
+    if args.discover:
+        configure_client(pool_size=args.pool_size, retries=args.retries,
+                         scheduler=PolitenessScheduler(args.per_host, rate=args.rate,
+                                                       robots=not args.ignore_robots))
+        cache = scrape.open_cache(args)
+        pages, jobs = site_crawler.discover_jobs(cache.fetch_html, args.base_url,
+                                                 max_depth=args.max_depth,
+                                                 max_pages=args.max_pages,
+                                                 per_host=args.per_host)
+        print(f"Discovered {len(jobs)} book pages among {len(pages)} pages")
+    else:
+        try:
+            jobs = catalog.build_jobs(args.book, args.page, args.base_url)
+        except ValueError as e:
+            sys.exit(str(e))
+    fresh = journal.enqueue(jobs)
+    print(("Starting a new pass. " if fresh else "Resuming. ") + journal.summary())
+
+    started = time.time()
+    log_dir = Path(args.report_dir) / WORKERS_DIR
+    log_dir.mkdir(parents=True, exist_ok=True)
+    processes = []
+    if args.workers:
+        per_host = max(1, args.per_host // args.workers)
+        converters = max(1, args.jobs // args.workers)
+        for number in range(args.workers):
+            log_file = open(log_dir / f"worker{number}.log", 'w')
+            processes.append((subprocess.Popen(worker_command(args, per_host, converters),
+                                               stdout=log_file, stderr=subprocess.STDOUT),
+                              log_file))
+        print(f"Started {args.workers} workers, logs in {log_dir}")
+
+    try:
+        while any(process.poll() is None for process, _ in processes):
+            time.sleep(PROGRESS_SECONDS)
+            alive = sum(process.poll() is None for process, _ in processes)
+            print(f"{alive} local workers running. {journal.summary()}")
+    finally:
+        for process, log_file in processes:
+            if process.poll() is None:
+                process.terminate()
+                process.wait()
+            log_file.close()
+    # Workers on other hosts may still be finishing their last pages
+    left = journal.wait_for_work()
+    print(journal.summary())
+    if left:
+        print("Some pages are unclaimed and no worker is left: run more workers or coordinate again")
+    for number, (process, _) in enumerate(processes):
+        if process.returncode:
+            print(f"Worker {number} exited with status {process.returncode}, "
+                  f"see {log_dir / f'worker{number}.log'}")
+
+    runs = []
+    for worker in journal.workers(since=started):
+        if worker['report'] is None or not Path(worker['report']).exists():
+            print(f"  {worker['owner']}: no report (died)")
+            continue
+        run = RunMetrics.read_json(worker['report'])
+        runs.append(run)
+        print(f"  {worker['owner']}: {worker['pages']} pages in {run.duration:.1f} s")
+    journal.close()
+
+    merged = merge_runs("workers", runs)
+    json_file, prom_file = merged.write_reports(args.report_dir)
+    print(f"{len(merged.pages)} pages from {len(runs)} workers in "
+          f"{time.time() - started:.1f} s. {merged.summary()}")
+    print(f"Merged run report: {json_file}, metrics: {prom_file}")
+    return len(merged.pages)
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.role == 'work':
+        work(args)
+    else:
+        coordinate(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Heading statistics and table-of-contents detection for converted text
+
+A table of contents is a run of headings with little or no text between
+them. analyze_headings() finds it in one sweep over lines that have already
+been stripped and classified (line_classifier), instead of scanning forward
+from every heading to the next one.
+"""
+
+from collections import namedtuple
+
+from line_classifier import classify_line, classify_lines, is_heading
+
+# A heading counts as TOC material when fewer than this many characters of
+# text follow it, and a run of TOC_MIN_RUN such headings starts a TOC
+TOC_MAX_CONTENT = 50
+TOC_MIN_RUN = 3
+# Without a clear end, the TOC stops at the first heading followed by more
+# than this much text
+TOC_END_CONTENT = 100
+
+# One heading: its line number and the length of the (stripped, non-empty)
+# text lines between it and the next heading
+HeadingStats = namedtuple("HeadingStats", ["line_index", "content_length"])
+
+
+class HeadingAnalysis(namedtuple("HeadingAnalysis", ["headings", "toc_start", "toc_end"])):
+    """Per-heading stats plus the TOC span [toc_start, toc_end) in lines
+
+    toc_start and toc_end are both None when there is no table of contents.
+    """
+
+    __slots__ = ()
+
+    def in_toc(self, line_index):
+        return (self.toc_start is not None and self.toc_end is not None
+                and self.toc_start <= line_index < self.toc_end)
+
+
+def is_heading_line(line_stripped):
+    """True for Markdown headings and 第○章-style lines"""
+    return is_heading(classify_line(line_stripped))
+
+
+def heading_stats(stripped_lines, kinds):
+    """HeadingStats for every heading, in a single pass over the lines"""
+    headings = []
+    current_index = None
+    content_length = 0
+    for i, line in enumerate(stripped_lines):
+        if is_heading(kinds[i]):
+            if current_index is not None:
+                headings.append(HeadingStats(current_index, content_length))
+            current_index = i
+            content_length = 0
+        elif current_index is not None:
+            content_length += len(line)
+    if current_index is not None:
+        headings.append(HeadingStats(current_index, content_length))
+    return headings
+
+
+def find_toc(headings):
+    """(toc_start, toc_end) line indices of the table of contents, or Nones"""
+    toc_start = None
+    toc_end = None
+    if len(headings) < TOC_MIN_RUN:
+        return toc_start, toc_end
+
+    # The last heading never starts or extends a run
+    consecutive_count = 0
+    for i in range(len(headings) - 1):
+        if headings[i].content_length < TOC_MAX_CONTENT:
+            consecutive_count += 1
+            if consecutive_count >= TOC_MIN_RUN and toc_start is None:
+                toc_start = headings[i - (TOC_MIN_RUN - 1)].line_index
+        else:
+            if consecutive_count >= TOC_MIN_RUN and toc_end is None:
+                toc_end = headings[i].line_index
+            consecutive_count = 0
+
+    # A TOC that runs into the last heading ends at the first heading with
+    # substantial content after it
+    if toc_start is not None and toc_end is None:
+        for heading in headings:
+            if heading.line_index > toc_start and heading.content_length > TOC_END_CONTENT:
+                toc_end = heading.line_index
+                break
+    return toc_start, toc_end
+
+
+def analyze_headings(stripped_lines, kinds=None):
+    """HeadingAnalysis of stripped lines whose kind codes are kinds
+
+    kinds defaults to classify_lines(stripped_lines).
+    """
+    if kinds is None:
+        kinds = classify_lines(stripped_lines)
+    headings = heading_stats(stripped_lines, kinds)
+    toc_start, toc_end = find_toc(headings)
+    return HeadingAnalysis(headings, toc_start, toc_end)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""On-disk raw HTML cache with conditional GET revalidation
+
+Layout under the cache directory (html_cache/ next to the *_volumes/ output):
+
+    index.json                      url -> sha256, ETag, Last-Modified
+    objects/ab/abcdef....html       response bodies, named by their sha256
+
+Bodies are stored as the raw bytes the server sent, so identical pages share
+one object and a 304 answer can be served straight from disk. Processes
+sharing the cache merge their entries into index.json under a file lock.
+open_bytes() hands a download out in chunks as it arrives, writing it to
+its object at the same time, so a streaming consumer never holds a whole
+page.
+"""
+
+import codecs
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from build_manifest import merge_json_file
+from http_client import get_client
+
+DEFAULT_CACHE_DIR = Path("html_cache")
+DEFAULT_ENCODING = 'utf-8'
+CHUNK_SIZE = 64 * 1024
+# Like a browser's prescan, <meta charset> counts only near the start
+SNIFF_BYTES = 1024
+_META_CHARSET = re.compile(rb'<meta[^>]*?charset\s*=\s*["\']?\s*([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode when a URL has never been cached"""
+
+
+def sniff_charset(head):
+    """Codec named by a <meta charset> in the first bytes of a page, or None"""
+    match = _META_CHARSET.search(head[:SNIFF_BYTES])
+    if match is None:
+        return None
+    try:
+        name = codecs.lookup(match.group(1).decode('ascii')).name
+    except LookupError:
+        return None
+    # A page that could be read as ASCII to find this was not UTF-16
+    return DEFAULT_ENCODING if name.startswith('utf-16') else name
+
+
+def decode_html(body, encoding=DEFAULT_ENCODING):
+    """Decode a cached body the way fetch_html decodes a live response
+
+    encoding None sniffs the page's <meta charset>, falling back to UTF-8.
+    """
+    if encoding is None:
+        encoding = sniff_charset(body) or DEFAULT_ENCODING
+    return body.decode(encoding, errors='replace')
+
+
+class HtmlCache:
+    """Content-addressed store of raw HTML plus each URL's validators
+
+    fetch_html(url) revalidates a cached page with If-None-Match /
+    If-Modified-Since and returns the cached bytes on 304. With
+    offline=True it never touches the network and raises CacheMiss for
+    pages it does not have. Bodies are decoded with encoding (None: sniffed
+    per page, see decode_html).
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, offline=False, encoding=DEFAULT_ENCODING):
+        self.root = Path(root)
+        self.offline = offline
+        self.encoding = encoding
+        self.index_file = self.root / "index.json"
+        self.objects_dir = self.root / "objects"
+        self.stats = {'revalidated': 0, 'downloaded': 0, 'offline': 0}
+        self._lock = threading.Lock()
+        if self.index_file.exists():
+            with open(self.index_file, encoding='utf-8') as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def object_path(self, digest):
+        return self.objects_dir / digest[:2] / f"{digest}.html"
+
+    def lookup(self, url):
+        """The index entry for url, or None if it is not cached"""
+        with self._lock:
+            entry = self.index.get(url)
+        if entry and self.object_path(entry['sha256']).exists():
+            return entry
+        return None
+
+    def read(self, url):
+        """Cached body bytes for url, or None"""
+        entry = self.lookup(url)
+        if entry is None:
+            return None
+        return self.object_path(entry['sha256']).read_bytes()
+
+    def _tmp_path(self):
+        return self.objects_dir / f"incoming.tmp{os.getpid()}.{threading.get_ident()}"
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """Save a response body and its validators; returns the body's sha256"""
+        digest = hashlib.sha256(body).hexdigest()
+        if not self.object_path(digest).exists():
+            tmp_path = self._tmp_path()
+            tmp_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(body)
+            self._store_file(url, tmp_path, digest, etag, last_modified)
+        else:
+            self._add(url, digest, etag, last_modified)
+        return digest
+
+    def _store_file(self, url, tmp_path, digest, etag, last_modified):
+        """Move a body written to tmp_path into place as its object"""
+        path = self.object_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, path)
+        self._add(url, digest, etag, last_modified)
+
+    def _add(self, url, digest, etag, last_modified):
+        entry = {
+            'sha256': digest,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }
+        # Write-then-rename, so a crash never leaves a truncated index behind
+        with self._lock:
+            self.index = merge_json_file(self.index_file, {url: entry})
+
+    def _offline_entry(self, url, entry):
+        if entry is None:
+            raise CacheMiss(f"{url} is not in the cache at {self.root}")
+        self._count('offline')
+        return entry
+
+    @staticmethod
+    def _validators(entry):
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def fetch_bytes(self, url):
+        """Raw body for url, revalidating any cached copy with the server"""
+        entry = self.lookup(url)
+        if self.offline:
+            return self.object_path(self._offline_entry(url, entry)['sha256']).read_bytes()
+
+        response = get_client().get(url, headers=self._validators(entry))
+        if response.status_code == 304 and entry is not None:
+            self._count('revalidated')
+            return self.object_path(entry['sha256']).read_bytes()
+        response.raise_for_status()
+        self._count('downloaded')
+        self.store(url, response.content, response.headers.get('ETag'),
+                   response.headers.get('Last-Modified'))
+        return response.content
+
+    def open_bytes(self, url, chunk_size=CHUNK_SIZE):
+        """fetch_bytes() that hands a download out in chunks as it arrives
+
+        Returns (body, None) when there is nothing to download (offline, or
+        a 304 for a cached page), and otherwise (None, chunks) with the
+        response already open. A downloaded body is written to a temporary
+        file as it arrives and becomes the cache object only once it is
+        complete, so a transfer that fails midway leaves the cache as it
+        was.
+        """
+        entry = self.lookup(url)
+        if self.offline:
+            return self.object_path(self._offline_entry(url, entry)['sha256']).read_bytes(), None
+
+        response = get_client().get(url, headers=self._validators(entry), stream=True)
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            self._count('revalidated')
+            return self.object_path(entry['sha256']).read_bytes(), None
+        try:
+            response.raise_for_status()
+        except BaseException:
+            response.close()
+            raise
+        return None, self._download(url, response, chunk_size)
+
+    def _download(self, url, response, chunk_size):
+        with response:
+            tmp_path = self._tmp_path()
+            tmp_path.parent.mkdir(parents=True, exist_ok=True)
+            digest = hashlib.sha256()
+            try:
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        yield chunk
+                self._count('downloaded')
+                self._store_file(url, tmp_path, digest.hexdigest(),
+                                 response.headers.get('ETag'),
+                                 response.headers.get('Last-Modified'))
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+
+    def decode(self, body):
+        """A cached or fetched body as text, in the cache's encoding"""
+        return decode_html(body, self.encoding)
+
+    def fetch_html(self, url):
+        """Cached counterpart of http_client.fetch_html"""
+        return self.decode(self.fetch_bytes(url))
+
+    def read_html(self, url):
+        """Cached copy of url as text, without asking the server; CacheMiss if absent"""
+        body = self.read(url)
+        if body is None:
+            raise CacheMiss(f"{url} is not in the cache at {self.root}")
+        return self.decode(body)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def summary(self):
+        return (f"Cache: {self.stats['downloaded']} downloaded, "
+                f"{self.stats['revalidated']} unchanged (304), "
+                f"{self.stats['offline']} served offline")
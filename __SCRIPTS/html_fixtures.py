@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Build site-like HTML pages from the generated Markdown corpus
+
+The source site is not needed to exercise the converter: each *_volumes/*.md
+file is turned back into a page shaped like the originals (a div#content
+with <br>-separated lines, blue <font> headings, <b>, <center>, comments and
+character references). Pages are deterministic for a given seed.
+site_mirror() lays them out at their catalog URLs, with index pages linking
+them, as a local copy of the site for the link-discovery crawler.
+"""
+
+import html
+import random
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import catalog
+from section_store import corpus_files
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+HEADING_COLORS = ['#0064FF', '#0066ff', '#0000FF']
+
+
+def _inline(text, rng):
+    """Escape a line of text, sprinkling in markup the converter must handle"""
+    escaped = html.escape(text, quote=False)
+    roll = rng.random()
+    if roll < 0.02 and len(escaped) > 4:
+        cut = rng.randrange(1, len(escaped) - 1)
+        return f"{escaped[:cut]}<!-- {cut} -->{escaped[cut:]}"
+    if roll < 0.04:
+        return escaped.replace('　', '&#12288;')
+    if roll < 0.05:
+        return escaped.replace(' ', '&nbsp;', 1)
+    return escaped
+
+
+def markdown_to_html(markdown_text, title="fixture", seed=0):
+    """Render Markdown from the corpus as a page from the source site"""
+    rng = random.Random(seed)
+    parts = [
+        '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN">',
+        '<html><head><meta http-equiv="Content-Type" content="text/html; charset=utf-8">',
+        f'<title>{html.escape(title)}</title>',
+        '<!-- stylesheet --><style type="text/css">body { font-size: 90%; }</style>',
+        '</head><body>',
+        '<div id="header"><a href="../index.html">スピリチュアリズム文書</a></div>',
+        '<div id="content">',
+        '<!-- Start content -->',
+    ]
+    for line in markdown_text.split('\n'):
+        stripped = line.strip()
+        if not stripped:
+            parts.append('<br>' if rng.random() < 0.7 else '<br />')
+        elif stripped.startswith('#'):
+            level = len(stripped) - len(stripped.lstrip('#'))
+            text = html.escape(stripped.lstrip('#').strip(), quote=False)
+            color = rng.choice(HEADING_COLORS)
+            size = rng.choice(['4', '5']) if level == 1 else '2'
+            if rng.random() < 0.3:
+                text = f"<b>{text}</b>"
+            parts.append(f'<font color="{color}" size="{size}">{text}</font><br>')
+        elif stripped.startswith('**') and stripped.endswith('**') and len(stripped) > 4:
+            parts.append(f"<b>{_inline(stripped[2:-2], rng)}</b><br>")
+        elif len(stripped) < 12 and rng.random() < 0.2:
+            parts.append(f"<center>{_inline(stripped, rng)}</center>")
+        else:
+            parts.append(f"{_inline(stripped, rng)}<br>")
+    parts.extend([
+        '</div>',
+        '<div id="footer"><hr><address>lv2k-sgw</address></div>',
+        '</body></html>',
+    ])
+    return '\n'.join(parts)
+
+
+def corpus_pages(root=REPO_ROOT, seed=0):
+    """(name, html) for every Markdown file in the corpus"""
+    for path in corpus_files(root):
+        name = f"{path.parent.name}/{path.stem}"
+        yield name, markdown_to_html(path.read_text(encoding='utf-8'), name, seed)
+
+
+def _link_list(title, links):
+    items = ''.join(f'<li><a href="{href}">{html.escape(text)}</a></li>\n' for href, text in links)
+    return (f'<html><head><meta charset="utf-8"><title>{html.escape(title)}</title></head>'
+            f'<body><h1>{html.escape(title)}</h1><ul>\n{items}</ul></body></html>')
+
+
+def site_mirror(root=REPO_ROOT, seed=0, extra_book="sculthorp_volumes/sculthorp.md"):
+    """URL path -> HTML of a local copy of the site, for StandInServer
+
+    The catalog's book pages are rendered from the corpus at their real
+    paths under catalog.SITE_URL. The site index links to the search page,
+    which links to every book page. Links come spelled several ways
+    (relative, root-relative, with fragments, dot segments and escapes)
+    next to ones a crawler must not follow, and the index also links one
+    title that is not in the catalog, rendered from extra_book.
+    """
+    search = urlsplit(catalog.SITE_URL).path
+    site = search[:search.rstrip('/').rindex('/') + 1]
+    pages = {}
+    search_links = [("../index.html", "トップ"), ("#top", "上へ")]
+    for number, (book, page) in enumerate(catalog.select()):
+        markdown_file = Path(root) / catalog.output_dir(book) / f"{page.output_name}.md"
+        if not markdown_file.exists():
+            continue
+        page_html = markdown_to_html(markdown_file.read_text(encoding='utf-8'), page.title, seed)
+        pages[search + book.path + page.filename] = page_html.replace(
+            'href="../index.html"', f'href="{site}index.html"')
+        href = book.path + page.filename
+        if number % 3 == 1:
+            href = search + href + "#chapter1"
+        elif number % 3 == 2:
+            href = search.replace("~", "%7E") + "./" + href
+        search_links.append((href, page.title))
+    pages[search] = _link_list("検索", search_links)
+
+    extra = Path(root) / extra_book
+    pages[site + "extra/newbook.html"] = markdown_to_html(
+        extra.read_text(encoding='utf-8'), "新しい本", seed).replace(
+        'href="../index.html"', 'href="../index.html#top"')
+    pages[site + "index.html"] = _link_list("スピリチュアリズム文書", [
+        ("search/", "検索"),
+        ("./search/../search/", "検索"),
+        ("extra/newbook.html", "新しい本"),
+        ("extra/cover.jpg", "表紙"),
+        ("../other/index.html", "他のサイト"),
+        ("https://example.com/", "外部リンク"),
+        ("mailto:lv2k-sgw@example.com", "メール"),
+    ])
+    return pages
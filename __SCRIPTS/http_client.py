@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Shared connection-pooled HTTP client with retry and per-request timing"""
+
+import datetime
+import email.utils
+import random
+import threading
+import time
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+DEFAULT_TIMEOUT = 30
+
+# Only these are worth another attempt; anything else is the page's answer
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE'])
+
+# One finished request: final status (None on error), attempts made and
+# total seconds spent including backoff sleeps
+RequestTiming = namedtuple("RequestTiming", ["method", "url", "status", "attempts", "elapsed"])
+
+
+def retry_after_seconds(response):
+    """Seconds asked for by a Retry-After header, in seconds or as an HTTP-date, or None"""
+    value = response.headers.get('Retry-After', '').strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        # "-0000": UTC, with no claim about the sender's local time
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class HttpClient:
+    """requests.Session with a keep-alive pool, retries and timing
+
+    Transient failures (connection errors, timeouts and RETRY_STATUSES) are
+    retried up to `retries` times for idempotent methods, sleeping a random
+    "full jitter" delay between 0 and backoff * 2**attempt seconds. With a
+    politeness.PolitenessScheduler every attempt waits for a slot on its
+    host and reports back how it went.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, timeout=DEFAULT_TIMEOUT, scheduler=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.timings = []
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              pool_block=True, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def backoff_delay(self, attempt, response=None):
+        """Seconds to wait before retry number `attempt` (1-based)"""
+        delay = random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** (attempt - 1)))
+        if response is not None:
+            retry_after = retry_after_seconds(response)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, MAX_BACKOFF))
+        return delay
+
+    def request(self, method, url, **kwargs):
+        """Send a request, retrying transient failures, and record its timing"""
+        kwargs.setdefault('timeout', self.timeout)
+        retryable = method.upper() in IDEMPOTENT_METHODS
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            response = None
+            ticket = self.scheduler.acquire(url) if self.scheduler else None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except TRANSIENT_ERRORS:
+                if ticket:
+                    self.scheduler.release(ticket)
+                if not retryable or attempt > self.retries:
+                    self._record(method, url, None, attempt, start)
+                    raise
+            except BaseException:
+                if ticket:
+                    self.scheduler.release(ticket)
+                raise
+            else:
+                if ticket:
+                    self.scheduler.release(ticket, response.status_code,
+                                           retry_after_seconds(response))
+                if (response.status_code not in RETRY_STATUSES or not retryable
+                        or attempt > self.retries):
+                    self._record(method, url, response.status_code, attempt, start)
+                    return response
+                response.close()
+            time.sleep(self.backoff_delay(attempt, response))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def _record(self, method, url, status, attempts, start):
+        timing = RequestTiming(method, url, status, attempts, time.perf_counter() - start)
+        with self._lock:
+            self.timings.append(timing)
+
+    def summary(self):
+        """One-line summary of the requests made so far"""
+        with self._lock:
+            timings = list(self.timings)
+        if not timings:
+            return "No requests made"
+        total = sum(t.elapsed for t in timings)
+        retried = sum(1 for t in timings if t.attempts > 1)
+        failed = sum(1 for t in timings if t.status is None or t.status >= 400)
+        slowest = max(timings, key=lambda t: t.elapsed)
+        return (f"{len(timings)} requests, avg {total / len(timings) * 1000:.0f} ms, "
+                f"{retried} retried, {failed} failed, "
+                f"slowest {slowest.elapsed * 1000:.0f} ms ({slowest.url})")
+
+    def close(self):
+        self.session.close()
+
+    def scheduler_summary(self):
+        return self.scheduler.summary() if self.scheduler else "Scheduler: none"
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def configure_client(**kwargs):
+    """Replace the shared client, e.g. configure_client(pool_size=8)"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = HttpClient(**kwargs)
+        return _client
+
+
+def get_client():
+    """The process-wide shared client, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def fetch_html(url):
+    """Fetch a page through the shared client and return its HTML as text"""
+    response = get_client().get(url)
+    response.encoding = 'utf-8'
+    response.raise_for_status()
+    return response.text
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Line classification shared by the TOC pass and the formatting pass
+
+Every stripped line of converted text is classified once into a kind code;
+both passes of format_markdown() then branch on the code instead of
+re-running startswith()/re.match() on the line.
+
+    BLANK       empty line
+    BODY        ordinary text
+    CHAPTER     第○部 / 第○章 / 第○巻 line (no 節 anywhere in it)
+    SECTION     第○... line that contains 節
+    MD_HEADING  "#..." line whose text is not numbered
+    MD_CHAPTER  "#..." line whose text starts 第○部/章/巻
+    MD_SECTION  "#..." line whose text starts 第○節
+"""
+
+import re
+
+BLANK, BODY, CHAPTER, SECTION, MD_HEADING, MD_CHAPTER, MD_SECTION = range(7)
+
+KIND_NAMES = ['blank', 'body', 'chapter', 'section', 'md_heading', 'md_chapter', 'md_section']
+
+# Compiled once per process. An optional "#" prefix of Markdown headings is
+# matched but not captured; group 1 is the 部/章/巻/節 suffix of a numbered
+# heading.
+_HEADING_RE = re.compile(r'(?:#+\s*)?第[０-９一二三四五六七八九十]+([部章巻節])')
+
+_MD_KIND = {'部': MD_CHAPTER, '章': MD_CHAPTER, '巻': MD_CHAPTER, '節': MD_SECTION}
+
+
+def is_heading(kind):
+    """Headings for TOC detection: numbered lines and Markdown headings"""
+    return kind >= CHAPTER
+
+
+def classify_line(line_stripped):
+    """Kind code of one stripped line"""
+    if not line_stripped:
+        return BLANK
+    first = line_stripped[0]
+    if first == '#':
+        match = _HEADING_RE.match(line_stripped)
+        return _MD_KIND[match.group(1)] if match else MD_HEADING
+    if first == '第' and _HEADING_RE.match(line_stripped):
+        return SECTION if '節' in line_stripped else CHAPTER
+    return BODY
+
+
+def classify_lines(stripped_lines):
+    """Kind codes of all lines, one byte per line"""
+    return bytearray(map(classify_line, stripped_lines))
+
+
+def heading_text(line_stripped):
+    """A Markdown heading without its leading "#" markers and whitespace"""
+    return line_stripped.lstrip('#').lstrip()
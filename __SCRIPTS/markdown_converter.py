@@ -0,0 +1,774 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Single-pass streaming HTML to Markdown converter
+
+html_to_markdown() feeds the page once through an event-driven
+html.parser.HTMLParser and walks div#content as the events arrive, writing
+Markdown text into one buffer. It produces byte-for-byte the output of the
+original BeautifulSoup converter (reference_converter.py), which parsed the
+page, serialized div#content, stripped comments and <br> with regexes and
+parsed the result a second time. The quirks of that round trip that show up
+in the output are reproduced here on the fly:
+
+- the tree is built the way BeautifulSoup's html.parser builder builds it
+  (stack-based end tags, void elements, its entity handling, whitespace-only
+  strings collapsed to one space or newline);
+- comments vanish and attribute-less <br> become "\n" *inside* the
+  surrounding text, so the text on both sides is merged into one string
+  before it is stripped;
+- <font>, <b>/<strong>, <center> and <h1>-<h6> use the element's full text
+  (get_text()), ignoring markup nested inside them. Their text is gathered
+  as the events pass, in the same traversal, and rendered through the
+  TEXT_RENDERERS dispatch table when the element closes.
+
+Open elements live on an explicit stack, so nesting depth is bounded by
+memory rather than by the recursion limit that the reference converter's
+recursive process_node() runs into.
+
+The regexes only stay inside one piece of markup as long as the serialized
+content has no "<" in a tag or attribute name and no unterminated "<!--" in
+raw text (script, style, CDATA, processing instructions). Pages that break
+this cannot be converted on the fly and go through the reference converter.
+"""
+
+import functools
+import re
+import time
+import unicodedata
+from html.entities import html5
+from html.parser import HTMLParser
+
+from heading_analysis import analyze_headings
+from line_classifier import (BLANK, BODY, MD_CHAPTER, MD_HEADING, MD_SECTION, SECTION,
+                             classify_lines, heading_text)
+
+# Bump whenever a change to html_to_markdown changes its output, so that the
+# build manifest reconverts every page
+CONVERTER_VERSION = "1"
+
+BLUE_FONT_COLORS = frozenset(['#0064ff', '#0066ff', '#0000ff'])
+
+# BeautifulSoup (html.parser builder) behaviour being reproduced
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen',
+    'link', 'menuitem', 'meta', 'param', 'source', 'track', 'wbr', 'basefont',
+    'bgsound', 'command', 'frame', 'image', 'isindex', 'nextid', 'spacer',
+])
+PRESERVE_WHITESPACE_TAGS = frozenset(['pre', 'textarea'])
+STRING_CONTAINER_TAGS = frozenset(['rt', 'rp', 'style', 'script', 'template'])
+CDATA_CONTAINING_TAGS = frozenset(['script', 'style'])
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+_ASCII_SPACE_TABLE = str.maketrans('', '', ASCII_SPACES)
+
+ENTITY_TO_CHARACTER = {}
+for _name, _character in sorted(html5.items()):
+    ENTITY_TO_CHARACTER.setdefault(_name[:-1] if _name.endswith(';') else _name, _character)
+
+COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+BR_RE = re.compile(r'<br\s*/?>')
+_DECIMAL_REFERENCE = re.compile(r'^([0-9]+)(.*)')
+_HEX_REFERENCE = re.compile(r'^([0-9a-f]+)(.*)')
+
+
+def _numeric_reference(name):
+    """Text for a numeric character reference, as BeautifulSoup resolves it"""
+    base, reference_re = 10, _DECIMAL_REFERENCE
+    if name.startswith('x') or name.startswith('X'):
+        name = name[1:]
+        base, reference_re = 16, _HEX_REFERENCE
+    extra = ''
+    try:
+        number = int(name, base)
+    except ValueError:
+        match = reference_re.search(name)
+        if match is None:
+            return name
+        number, extra = int(match.group(1), base), match.group(2)
+    if number == 0 or number > 0x10ffff or 0xd800 <= number <= 0xdfff:
+        return '\ufffd' + extra
+    if 0x80 <= number <= 0x9f:
+        # Windows-1252 bytes written as character references
+        try:
+            return bytes([number]).decode('cp1252') + extra
+        except UnicodeDecodeError:
+            pass
+    return chr(number) + extra
+
+
+def _scrub(text):
+    """What the comment and <br> regexes do to raw (unescaped) text"""
+    if '<' not in text:
+        return text
+    return BR_RE.sub('\n', COMMENT_RE.sub('', text))
+
+
+class _OpenTag:
+    __slots__ = ('name', 'attrs', 'in_content', 'is_br')
+
+    def __init__(self, name, attrs, in_content):
+        self.name = name
+        self.attrs = attrs
+        self.in_content = in_content
+        # Serialized as <br/>, which the <br> regex turns into a newline
+        self.is_br = name == 'br' and not attrs
+
+
+class _ContentStop(Exception):
+    """Raised once div#content is closed; nothing after it matters"""
+
+
+class StreamingConverter(HTMLParser):
+    """Event-driven walker that turns div#content into Markdown text
+
+    Feed it HTML with feed()/close() (in one piece or in chunks) and read the
+    node-walk text from text(). The events go through three stages:
+
+    1. tree building, as BeautifulSoup would build the page;
+    2. the serialize / regex / re-parse round trip, which merges text runs
+       across comments and attribute-less <br>;
+    3. the node walk of the original process_node().
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        # Stage 1: the tree builder
+        self._stack = []
+        self._open_counts = {}
+        self._already_closed = []
+        self._data = []
+        self._preserve_depth = 0
+        self._content = None
+        self.finished = False
+        # False once the content holds markup the round trip cannot stream
+        self.round_trip_safe = True
+        # Stage 2: the current text run of the re-parsed content div
+        self._run = []
+        self._inner_preserve = 0
+        self._inner_containers = 0
+        # Stage 3: output buffer and the element whose text is being gathered
+        self._out = []
+        self._capture = None
+        self._capture_render = None
+        self._capture_parts = None
+
+    # -- stage 1: tree building ---------------------------------------------
+
+    def feed(self, data):
+        if self.finished:
+            return
+        try:
+            super().feed(data)
+        except _ContentStop:
+            self.finished = True
+
+    def close(self):
+        if self.finished:
+            return
+        try:
+            super().close()
+            self._end_data()
+            while self._stack:
+                self._pop()
+        except _ContentStop:
+            pass
+        self.finished = True
+
+    def feed_events(self, events):
+        """Consume a whole page as events from another tokenizer, then close
+
+        events yields (handler name, args) pairs such as
+        ('handle_starttag', (tag, attrs)); see parser_backends.py.
+        """
+        if self.finished:
+            return
+        try:
+            for name, args in events:
+                getattr(self, name)(*args)
+            self._end_data()
+            while self._stack:
+                self._pop()
+        except _ContentStop:
+            pass
+        self.finished = True
+
+    def handle_starttag(self, tag, attrs):
+        self._end_data()
+        attr_dict = {}
+        for key, value in attrs:
+            attr_dict[key] = '' if value is None else value
+        self._push(tag, attr_dict)
+        if tag in VOID_ELEMENTS:
+            self._pop_to(tag)
+            self._already_closed.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._end_data()
+        attr_dict = {}
+        for key, value in attrs:
+            attr_dict[key] = '' if value is None else value
+        self._push(tag, attr_dict)
+        self._pop_to(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._already_closed:
+            self._already_closed.remove(tag)
+            return
+        self._end_data()
+        self._pop_to(tag)
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_charref(self, name):
+        self._data.append(_numeric_reference(name))
+
+    def handle_entityref(self, name):
+        character = ENTITY_TO_CHARACTER.get(name)
+        self._data.append(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data):
+        # Removed by the comment regex; it only ends the current string
+        self._end_data()
+
+    def handle_decl(self, decl):
+        self._end_data()
+        self._special(decl[len("DOCTYPE "):])
+        if self._content is not None:
+            # A doctype is serialized with a trailing newline, which the
+            # re-parse reads as the start of the next text run
+            self._run.append('\n')
+
+    def unknown_decl(self, data):
+        self._end_data()
+        if data.upper().startswith("CDATA["):
+            self._special(data[len("CDATA["):], cdata=True)
+        else:
+            # A declaration is serialized as <?...?> and comes back as a
+            # processing instruction whose text ends in "?"
+            self._special(data + '?')
+
+    def handle_pi(self, data):
+        self._end_data()
+        self._special(data)
+
+    def _end_data(self):
+        if not self._data:
+            return
+        text = ''.join(self._data)
+        self._data = []
+        if not self._preserve_depth and not text.translate(_ASCII_SPACE_TABLE):
+            text = '\n' if '\n' in text else ' '
+        if self._content is not None:
+            if self._stack[-1].name in CDATA_CONTAINING_TAGS:
+                # Not escaped on output, so the regexes can reach inside
+                text = self._scrub_raw(text)
+            self._run.append(text)
+
+    def _push(self, tag, attrs):
+        in_content = self._content is not None
+        entry = _OpenTag(tag, attrs, in_content)
+        if in_content and ('<' in tag or any('<' in key for key in attrs)):
+            # Serialized unescaped, where the regexes could match across it
+            self.round_trip_safe = False
+        if not in_content and tag == 'div' and attrs.get('id') == 'content':
+            entry.in_content = True
+            self._content = entry
+        self._stack.append(entry)
+        self._open_counts[tag] = self._open_counts.get(tag, 0) + 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth += 1
+        if entry.in_content and not entry.is_br:
+            self._start_element(entry)
+
+    def _pop(self):
+        entry = self._stack.pop()
+        self._open_counts[entry.name] -= 1
+        if entry.name in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth -= 1
+        if entry.in_content:
+            if entry.is_br:
+                self._run.append('\n')
+            else:
+                self._end_element(entry)
+            if entry is self._content:
+                raise _ContentStop()
+        return entry
+
+    def _pop_to(self, tag):
+        if not self._open_counts.get(tag):
+            return
+        while self._stack:
+            if self._pop().name == tag:
+                break
+
+    # -- stage 2: text runs of the re-parsed content ----------------------
+
+    def _flush_run(self):
+        if not self._run:
+            return
+        text = ''.join(self._run)
+        self._run = []
+        if not self._inner_preserve and not text.translate(_ASCII_SPACE_TABLE):
+            text = '\n' if '\n' in text else ' '
+        self._string(text, in_text=not self._inner_containers)
+
+    def _special(self, text, cdata=False):
+        """CDATA, processing instructions and declarations inside the content"""
+        if self._content is None:
+            return
+        self._flush_run()
+        self._string(self._scrub_raw(text), in_text=cdata)
+
+    def _scrub_raw(self, text):
+        """_scrub() of raw content text, noting comments it leaves open"""
+        text = _scrub(text)
+        if '<!--' in text:
+            self.round_trip_safe = False
+        return text
+
+    def _start_element(self, entry):
+        self._flush_run()
+        if entry.name in PRESERVE_WHITESPACE_TAGS:
+            self._inner_preserve += 1
+        if entry.name in STRING_CONTAINER_TAGS:
+            self._inner_containers += 1
+        if self._capture is None:
+            render = TEXT_RENDERERS.get(entry.name)
+            if render is not None:
+                self._capture = entry
+                self._capture_render = render
+                self._capture_parts = []
+
+    def _end_element(self, entry):
+        self._flush_run()
+        if entry.name in PRESERVE_WHITESPACE_TAGS:
+            self._inner_preserve -= 1
+        if entry.name in STRING_CONTAINER_TAGS:
+            self._inner_containers -= 1
+        if entry is self._capture:
+            text = ''.join(self._capture_parts).strip()
+            render = self._capture_render
+            self._capture = self._capture_render = self._capture_parts = None
+            if text:
+                self._out.append(render(entry.attrs, text))
+
+    # -- stage 3: the node walk -------------------------------------------
+
+    def _string(self, text, in_text):
+        """A string node; in_text says whether get_text() would include it"""
+        if self._capture is not None:
+            if in_text:
+                self._capture_parts.append(text)
+            return
+        text = text.strip()
+        if text:
+            self._out.append(text)
+
+    def text(self):
+        """The node-walk text of div#content, or None if there was none"""
+        if self._content is None:
+            return None
+        return ''.join(self._out)
+
+
+# Renderers for the elements drawn from their whole text (get_text()):
+# render(attrs, stripped text) -> Markdown
+
+def _render_font(attrs, text):
+    if attrs.get('color', '').lower() in BLUE_FONT_COLORS:
+        # Heading level: 節 (section) -> 2, font size 3-5 -> 1, else 2
+        if '節' in text:
+            return f"\n## {text}\n"
+        elif attrs.get('size', '') in ('3', '4', '5'):
+            return f"\n# {text}\n"
+        else:
+            return f"\n## {text}\n"
+    return text
+
+
+def _render_bold(attrs, text):
+    return f"**{text}**"
+
+
+def _render_center(attrs, text):
+    return f"\n{text}\n"
+
+
+def _heading_renderer(level):
+    marker = '#' * level
+    return lambda attrs, text: f"\n{marker} {text}\n"
+
+
+# Tag dispatch table of the node walk; other elements just pass their
+# strings through
+TEXT_RENDERERS = {
+    'font': _render_font,
+    'b': _render_bold,
+    'strong': _render_bold,
+    'center': _render_center,
+}
+TEXT_RENDERERS.update((f"h{level}", _heading_renderer(level)) for level in range(1, 7))
+
+
+def tokenize_html_parser(converter, html_content):
+    """Feed a page to the converter through its own html.parser tokenizer"""
+    converter.feed(html_content)
+    converter.close()
+
+
+def html_to_markdown(html_content, tokenize=tokenize_html_parser, rules=()):
+    """Convert HTML content to Markdown format
+
+    tokenize(converter, html_content) drives the converter; other
+    tokenizers are in parser_backends.py. rules names LINE_RULES the
+    cleanup also applies to every line (see PostProcessor).
+    """
+    return '\n'.join(html_to_markdown_lines(html_content, tokenize, rules))
+
+
+def html_to_markdown_lines(html_content, tokenize=tokenize_html_parser, rules=()):
+    """html_to_markdown() as an iterator of output lines
+
+    The final cleanups run as the lines are consumed, so a writer can
+    stream them to disk without the output ever being joined into one
+    string. The page's node-walk text and its lines are still held whole:
+    TOC detection looks at all of them.
+    """
+    converter = StreamingConverter()
+    tokenize(converter, html_content)
+    if not converter.round_trip_safe:
+        from reference_converter import html_to_markdown as reference_html_to_markdown
+        markdown = reference_html_to_markdown(html_content)
+        return get_postprocessor(tuple(rules)).normalize(markdown.split('\n') if markdown else ())
+    markdown_text = converter.text()
+    if markdown_text is None:
+        return iter(())
+    return format_markdown_lines(markdown_text, rules)
+
+
+def html_to_markdown_timed(html_content, tokenize=tokenize_html_parser, rules=(), write=None):
+    """html_to_markdown() that also returns the metrics of each phase
+
+    Returns (markdown, metrics). metrics['phases'] maps parse_walk (the
+    single parse / node walk pass), toc (classification and TOC detection)
+    and postprocess (rendering and cleanup) to their seconds, bytes in and
+    bytes out; metrics also holds the output's line and heading counts.
+    Pages handed to the reference converter are timed as one parse_walk.
+    write is as in converted_markdown_timed().
+    """
+    start = time.perf_counter()
+    converter = StreamingConverter()
+    tokenize(converter, html_content)
+    return converted_markdown_timed(converter, time.perf_counter() - start,
+                                    len(html_content.encode('utf-8')), lambda: html_content,
+                                    rules, write)
+
+
+def _joined(lines):
+    markdown = '\n'.join(lines)
+    return markdown, len(markdown.encode('utf-8'))
+
+
+def _counted(lines, counts):
+    """lines, counting them and their headings into counts as they pass"""
+    for line in lines:
+        counts['lines'] += 1
+        if line.startswith('#'):
+            counts['headings'] += 1
+        yield line
+
+
+def converted_markdown_timed(converter, parse_seconds, html_bytes, read_html, rules=(),
+                             write=None):
+    """html_to_markdown_timed() of a page the converter has already been fed
+
+    The converter must be closed; parse_seconds is the time it took to feed
+    it html_bytes bytes of HTML. read_html() returns the whole page, and is
+    only called for pages that go through the reference converter.
+
+    write(lines) consumes the output lines as the cleanups produce them and
+    returns (result, bytes written); result is returned in place of the
+    Markdown, and the write is timed with the phase it ends. By default
+    the lines are joined into the Markdown text.
+    """
+    clock = time.perf_counter
+    write = write or _joined
+    counts = {'lines': 0, 'headings': 0}
+    phases = {}
+    walked = clock()
+    if converter.round_trip_safe:
+        markdown_text = converter.text()
+        if markdown_text is not None:
+            stripped_lines = split_lines(markdown_text)
+            kinds = classify_lines(stripped_lines)
+            analysis = analyze_headings(stripped_lines, kinds)
+            analyzed = clock()
+            output = _counted(postprocess_lines(render_lines(stripped_lines, kinds, analysis),
+                                                rules), counts)
+            markdown, size = write(output)
+            walk_bytes = len(markdown_text.encode('utf-8'))
+            phases['parse_walk'] = (parse_seconds, html_bytes, walk_bytes)
+            phases['toc'] = (analyzed - walked, walk_bytes, walk_bytes)
+            phases['postprocess'] = (clock() - analyzed, walk_bytes, size)
+        else:
+            markdown, size = write(iter(()))
+            phases['parse_walk'] = (parse_seconds, html_bytes, 0)
+    else:
+        from reference_converter import html_to_markdown as reference_html_to_markdown
+        markdown = reference_html_to_markdown(read_html())
+        output = get_postprocessor(tuple(rules)).normalize(markdown.split('\n') if markdown else ())
+        markdown, size = write(_counted(output, counts))
+        phases['parse_walk'] = (parse_seconds + clock() - walked, html_bytes, size)
+    metrics = {
+        'phases': {name: {'seconds': seconds, 'bytes_in': bytes_in, 'bytes_out': bytes_out}
+                   for name, (seconds, bytes_in, bytes_out) in phases.items()},
+        'lines': counts['lines'],
+        'headings': counts['headings'],
+    }
+    return markdown, metrics
+
+
+def format_markdown(markdown_text, rules=()):
+    """Turn node-walk text into the final Markdown (TOC, headings, cleanup)"""
+    return '\n'.join(format_markdown_lines(markdown_text, rules))
+
+
+def format_markdown_lines(markdown_text, rules=()):
+    """format_markdown() as an iterator of output lines"""
+    # Split into lines and clean up
+    stripped_lines = split_lines(markdown_text)
+    
+    # Classify every line once; both passes branch on the kind codes
+    kinds = classify_lines(stripped_lines)
+    
+    # First pass: detect table of contents
+    # A TOC is typically a sequence of headings with little or no content between them
+    analysis = analyze_headings(stripped_lines, kinds)
+    
+    # Second pass: process lines
+    markdown_lines = render_lines(stripped_lines, kinds, analysis)
+    return postprocess_lines(markdown_lines, rules)
+
+
+def split_lines(markdown_text):
+    """Stripped lines of the node-walk text"""
+    return [line.strip() for line in markdown_text.split('\n')]
+
+
+def render_lines(stripped_lines, kinds, analysis):
+    """Output lines: headings placed and leveled, TOC flattened, blanks collapsed"""
+    markdown_lines = []
+    for i, line_stripped in enumerate(stripped_lines):
+        kind = kinds[i]
+        if kind == BLANK:
+            # Empty line - only add if previous line wasn't empty
+            if markdown_lines and markdown_lines[-1]:
+                markdown_lines.append('')
+            continue
+        if kind == BODY:
+            markdown_lines.append(line_stripped)
+            continue
+        
+        # Check if this line is in TOC section
+        is_in_toc = analysis.in_toc(i)
+        
+        # Markdown heading (starts with #)
+        if kind >= MD_HEADING:
+            if is_in_toc:
+                # In TOC: remove heading markers, treat as plain text
+                markdown_lines.append(heading_text(line_stripped))
+            else:
+                # Not in TOC: adjust heading level based on content
+                if kind == MD_CHAPTER:
+                    # Chapter/Part/Volume: level 1
+                    final_heading = f"# {heading_text(line_stripped)}"
+                elif kind == MD_SECTION:
+                    # Section: level 2
+                    final_heading = f"## {heading_text(line_stripped)}"
+                else:
+                    # Keep original heading level
+                    final_heading = line_stripped
+                
+                if markdown_lines and markdown_lines[-1] and not markdown_lines[-1].startswith('#'):
+                    markdown_lines.append('')
+                markdown_lines.append(final_heading)
+                # Ensure blank line after heading
+                if not (markdown_lines and markdown_lines[-1] == ''):
+                    markdown_lines.append('')
+        # Heading patterns (第○部、第○章など) that might not have been detected
+        elif is_in_toc:
+            # In TOC: treat as plain text
+            markdown_lines.append(line_stripped)
+        else:
+            # Not in TOC: format as heading
+            if markdown_lines and markdown_lines[-1] and not markdown_lines[-1].startswith('#'):
+                markdown_lines.append('')
+            # 節 -> level 2, 章/部/巻 -> level 1
+            if kind == SECTION:
+                markdown_lines.append(f"## {line_stripped}")
+            else:
+                markdown_lines.append(f"# {line_stripped}")
+            markdown_lines.append('')
+    return markdown_lines
+
+
+# Character rules a PostProcessor can apply to every output line, by name:
+# a str.translate table or a str -> str function
+FULLWIDTH_DIGITS = str.maketrans('０１２３４５６７８９', '0123456789')
+
+
+def _nfkc(line):
+    # NFKC composes character sequences, which no translate table can do;
+    # most lines are already normalized, and checking that is cheap
+    if line.isascii() or unicodedata.is_normalized('NFKC', line):
+        return line
+    return unicodedata.normalize('NFKC', line)
+
+
+LINE_RULES = {
+    'digits': FULLWIDTH_DIGITS,
+    'nfkc': _nfkc,
+}
+
+START_CONTENT = 'Start content'
+
+
+def _merge_tables(first, second):
+    """One translate table doing first, then second"""
+    merged = {}
+    for code, value in first.items():
+        if value is None:
+            merged[code] = None
+        else:
+            merged[code] = (chr(value) if isinstance(value, int) else value).translate(second)
+    for code, value in second.items():
+        merged.setdefault(code, value)
+    return merged
+
+
+def _translator(table):
+    # translate() looks every character up in the table; finding whether a
+    # line has any of its characters at all is a scan in C
+    keys = re.compile('[%s]' % ''.join(re.escape(chr(code)) for code in table))
+    return lambda line: line.translate(table) if keys.search(line) else line
+
+
+def _compose(rules):
+    """One str -> str function applying rules in order, or None if there are none
+
+    Neighbouring translate tables are merged into a single table.
+    """
+    steps = []
+    for rule in rules:
+        if isinstance(rule, dict) and steps and isinstance(steps[-1], dict):
+            steps[-1] = _merge_tables(steps[-1], rule)
+        else:
+            steps.append(rule)
+    functions = [_translator(step) if isinstance(step, dict) else step for step in steps]
+    if len(functions) <= 1:
+        return functions[0] if functions else None
+
+    def convert(line):
+        for function in functions:
+            line = function(line)
+        return line
+    return convert
+
+
+class PostProcessor:
+    """The final cleanup of the rendered lines, fused into one pass
+
+    Runs of blank lines become one, "Start content" banners go together
+    with the whitespace after them, and the document is stripped, all in a
+    single loop over the line stream. The result is what
+    re.sub(r'\n{3,}', '\n\n', ...), then
+    re.sub(r'^Start content\s*\n?', '', ..., re.MULTILINE), then .strip()
+    would make of the joined text. rules are LINE_RULES names applied, in
+    order, to every line as it leaves the loop; they are composed once
+    here, so a new rule adds no pass over the document.
+    """
+
+    def __init__(self, rules=()):
+        for rule in rules:
+            if rule not in LINE_RULES:
+                raise ValueError(f"Unknown post-processing rule {rule!r}; "
+                                 f"choose from {', '.join(LINE_RULES)}")
+        self.rules = tuple(rules)
+        self._convert = _compose(LINE_RULES[rule] for rule in self.rules)
+
+    def lines(self, markdown_lines):
+        """Final output lines of the rendered lines, one at a time"""
+        convert = self._convert
+        marker_length = len(START_CONTENT)
+        previous_blank = False
+        eating = False
+        held = None
+        pending = []
+        for line in markdown_lines:
+            # Blank-line runs collapse to their first line
+            if not line:
+                if previous_blank:
+                    continue
+                previous_blank = True
+            else:
+                previous_blank = False
+
+            # A "Start content" at a line start goes, and with it the
+            # whitespace after it, running on into the following lines
+            at_line_start = True
+            if eating:
+                rest = line.lstrip()
+                if not rest:
+                    continue
+                eating = False
+                # Joined to where the marker was, so no longer a line start
+                at_line_start = rest == line
+                line = rest
+            if at_line_start and line.startswith(START_CONTENT):
+                line = line[marker_length:].lstrip()
+                if not line:
+                    eating = True
+                    continue
+
+            # Whitespace-only lines are held until a line with text follows,
+            # so the ones at either end of the document are dropped
+            if not line or line.isspace():
+                if held is not None:
+                    pending.append(line)
+                continue
+            if held is None:
+                line = line.lstrip()
+            else:
+                yield held if convert is None else convert(held)
+                for blank in pending:
+                    yield blank if convert is None else convert(blank)
+                pending = []
+            held = line
+        if held is not None:
+            held = held.rstrip()
+            yield held if convert is None else convert(held)
+
+    def normalize(self, lines):
+        """Only the character rules, for lines that are already cleaned up"""
+        if self._convert is None:
+            return iter(lines)
+        return map(self._convert, lines)
+
+    def finish(self, markdown_lines):
+        return '\n'.join(self.lines(markdown_lines))
+
+
+@functools.lru_cache(maxsize=None)
+def get_postprocessor(rules=()):
+    """The PostProcessor for a tuple of rule names, built once per process"""
+    return PostProcessor(rules)
+
+
+def postprocess_lines(markdown_lines, rules=()):
+    """Final output lines, cleaned up one line at a time (see PostProcessor)"""
+    return get_postprocessor(tuple(rules)).lines(markdown_lines)
+
+
+def finish_markdown(markdown_lines, rules=()):
+    """Join the output lines and apply the final cleanups"""
+    return '\n'.join(postprocess_lines(markdown_lines, rules))
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Near-duplicate paragraphs across the corpus with MinHash and LSH
+
+Several books repeat one another (the Silver Birch volumes overlap heavily
+with each other and with 「古代霊は語る」), but comparing every paragraph
+with every other is quadratic. Instead:
+
+1. every paragraph of body text (headings and paragraphs shorter than
+   --min-chars skipped) is NFKC-normalized, its whitespace removed, and
+   cut into character shingles of --shingle characters;
+2. shingles are hashed and MinHash signatures computed for a batch of
+   paragraphs at a time with NumPy: --perms multiply-shift hash functions
+   applied to all of a batch's shingles at once, then a segmented minimum
+   per paragraph;
+3. signatures are split into --bands bands and paragraphs sharing a band
+   land in one LSH bucket; bucket mates are candidate pairs, kept if their
+   estimated Jaccard similarity (the fraction of equal signature values)
+   reaches --threshold;
+4. kept pairs are joined into clusters.
+
+Clusters are printed (those spanning more than one book first) and can be
+written as JSON; --export writes a copy of the corpus keeping only the
+first paragraph of each cluster, in file path order.
+
+    python __SCRIPTS/near_duplicates.py --threshold 0.8 --export dedup_export
+"""
+
+import argparse
+import json
+import time
+import unicodedata
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+from build_manifest import write_lines_atomic
+from corpus_reader import CorpusFile
+from section_store import corpus_files
+
+DEFAULT_SHINGLE = 5
+DEFAULT_PERMS = 128
+DEFAULT_BANDS = 32
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_MIN_CHARS = 40
+BATCH_SHINGLES = 1 << 15
+
+# Largest LSH bucket turned into pairs; bigger buckets are boilerplate
+MAX_BUCKET = 200
+
+Paragraph = namedtuple("Paragraph", ["path", "book", "offset", "length", "text"])
+
+
+def book_of(path):
+    name = Path(path).parent.name
+    return name[:-len("_volumes")] if name.endswith("_volumes") else name
+
+
+def shingle_text(text):
+    """Normalized text the shingles are cut from"""
+    return ''.join(unicodedata.normalize('NFKC', text).split())
+
+
+def load_paragraphs(root=".", min_chars=DEFAULT_MIN_CHARS):
+    """Body paragraphs long enough to compare, with their shingle text"""
+    paragraphs = []
+    for path in corpus_files(root):
+        relative = path.relative_to(root).as_posix()
+        with CorpusFile(path) as corpus_file:
+            for passage in corpus_file.paragraphs():
+                text = passage.text()
+                if text.startswith('#'):
+                    continue
+                normalized = shingle_text(text)
+                if len(normalized) >= min_chars:
+                    paragraphs.append(Paragraph(relative, book_of(relative), passage.offset,
+                                                len(passage), normalized))
+    return paragraphs
+
+
+def _mix(values):
+    """splitmix64 finalizer, so neighbouring shingles get unrelated hashes"""
+    values = values ^ (values >> np.uint64(31))
+    values = values * np.uint64(0x7fb5d329728ea185)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x81dadef4bc2dd44d)
+    return values ^ (values >> np.uint64(33))
+
+
+def shingle_hashes(texts, k):
+    """64-bit hashes of the k-character shingles of texts, concatenated, and
+    the number of shingles of each text"""
+    codes = np.frombuffer(''.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    span = len(codes) - k + 1
+    hashes = np.zeros(span, dtype=np.uint64)
+    for j in range(k):
+        hashes = hashes * np.uint64(0x100000001b3) + codes[j:j + span]
+    # Drop the shingles that run across the end of a text
+    keep = np.ones(span, dtype=bool)
+    ends = np.cumsum(lengths)
+    for back in range(1, k):
+        positions = ends - k + back
+        keep[positions[(positions >= 0) & (positions < span)]] = False
+    return _mix(hashes[keep]), lengths - k + 1
+
+
+def minhash_signatures(texts, k=DEFAULT_SHINGLE, perms=DEFAULT_PERMS, seed=1):
+    """(len(texts), perms) uint32 MinHash signatures, a batch of texts at a time"""
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2**63, size=perms, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    offsets = rng.integers(0, 2**63, size=perms, dtype=np.uint64)
+    signatures = np.empty((len(texts), perms), dtype=np.uint32)
+    start = 0
+    while start < len(texts):
+        # Grow the batch up to BATCH_SHINGLES shingles (at least one text)
+        end = start
+        shingles = 0
+        while end < len(texts) and (end == start or shingles + len(texts[end]) <= BATCH_SHINGLES):
+            shingles += len(texts[end])
+            end += 1
+        hashes, counts = shingle_hashes(texts[start:end], k)
+        # Multiply-shift hashing: the high 32 bits of a * x + b, computed in
+        # place on one (perms, shingles) array so that the per-paragraph
+        # minimum runs along contiguous rows
+        values = np.multiply.outer(multipliers, hashes)
+        values += offsets[:, None]
+        values >>= np.uint64(32)
+        segment_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        signatures[start:end] = np.minimum.reduceat(values, segment_starts, axis=1).T
+        start = end
+    return signatures
+
+
+def candidate_pairs(signatures, bands=DEFAULT_BANDS):
+    """Index pairs (i < j) sharing at least one LSH band"""
+    rows = signatures.shape[1] // bands
+    pairs = set()
+    for band in range(bands):
+        block = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        keys = block.view(np.dtype((np.void, block.dtype.itemsize * rows))).ravel()
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        shared = np.flatnonzero(counts[inverse] > 1)
+        if not len(shared):
+            continue
+        order = shared[np.argsort(inverse[shared], kind='stable')]
+        buckets = np.split(order, np.flatnonzero(np.diff(inverse[order])) + 1)
+        for bucket in buckets:
+            if len(bucket) > MAX_BUCKET:
+                continue
+            members = bucket.tolist()
+            for a in range(len(members)):
+                for b in range(a + 1, len(members)):
+                    pairs.add((members[a], members[b]))
+    return pairs
+
+
+def clusters_of(pairs, count):
+    """Connected components of the pairs, as sorted index lists"""
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+    groups = {}
+    for i in {index for pair in pairs for index in pair}:
+        groups.setdefault(find(i), []).append(i)
+    return [sorted(group) for group in groups.values()]
+
+
+def find_duplicates(paragraphs, k=DEFAULT_SHINGLE, perms=DEFAULT_PERMS, bands=DEFAULT_BANDS,
+                    threshold=DEFAULT_THRESHOLD):
+    """Clusters of near-duplicate paragraphs and the timing of each step"""
+    timings = {}
+    start = time.perf_counter()
+    signatures = minhash_signatures([p.text for p in paragraphs], k, perms)
+    timings['minhash'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidates = candidate_pairs(signatures, bands)
+    timings['lsh'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    kept = [(a, b) for a, b in candidates
+            if np.count_nonzero(signatures[a] == signatures[b]) / perms >= threshold]
+    clusters = clusters_of(kept, len(paragraphs))
+    timings['verify'] = time.perf_counter() - start
+    # Clusters spanning several books first, then by size
+    clusters.sort(key=lambda group: (-len({paragraphs[i].book for i in group}), -len(group),
+                                     group[0]))
+    return clusters, {'candidates': len(candidates), 'pairs': len(kept), 'seconds': timings}
+
+
+def cluster_dict(paragraphs, group):
+    return {
+        'books': sorted({paragraphs[i].book for i in group}),
+        'paragraphs': [{'path': paragraphs[i].path, 'offset': paragraphs[i].offset,
+                        'length': paragraphs[i].length} for i in group],
+        'sample': paragraphs[group[0]].text[:80],
+    }
+
+
+def export_deduplicated(paragraphs, clusters, root, output_dir):
+    """Copy the corpus to output_dir without the repeats in each cluster
+
+    The first paragraph of a cluster in file path order (then by position
+    in the file) is kept. Returns the
+    number of paragraphs dropped.
+    """
+    drop = {}
+    for group in clusters:
+        for i in group[1:]:
+            drop.setdefault(paragraphs[i].path, []).append(paragraphs[i])
+    root = Path(root)
+    output_dir = Path(output_dir)
+    for path in corpus_files(root):
+        relative = path.relative_to(root).as_posix()
+        data = path.read_bytes()
+        pieces = []
+        position = 0
+        for paragraph in sorted(drop.get(relative, []), key=lambda p: p.offset):
+            pieces.append(data[position:paragraph.offset])
+            # Take the paragraph's following blank line with it
+            position = paragraph.offset + paragraph.length
+            while position < len(data) and data[position] == 0x0a:
+                position += 1
+        pieces.append(data[position:])
+        target = output_dir / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        write_lines_atomic(target, (b''.join(pieces).decode('utf-8'),))
+    return sum(len(dropped) for dropped in drop.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate paragraphs across books")
+    parser.add_argument('--root', type=Path, default=Path("."))
+    parser.add_argument('--shingle', type=int, default=DEFAULT_SHINGLE,
+                        help="characters per shingle")
+    parser.add_argument('--perms', type=int, default=DEFAULT_PERMS, help="MinHash functions")
+    parser.add_argument('--bands', type=int, default=DEFAULT_BANDS,
+                        help="LSH bands (must divide --perms)")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="estimated Jaccard similarity to count as a duplicate")
+    parser.add_argument('--min-chars', type=int, default=DEFAULT_MIN_CHARS,
+                        help="shortest paragraph compared")
+    parser.add_argument('--show', type=int, default=10, help="clusters to print")
+    parser.add_argument('--report', type=Path, help="write every cluster as JSON")
+    parser.add_argument('--export', type=Path,
+                        help="directory for a deduplicated copy of the corpus")
+    args = parser.parse_args()
+    if args.perms % args.bands:
+        parser.error("--bands must divide --perms")
+
+    start = time.perf_counter()
+    paragraphs = load_paragraphs(args.root, args.min_chars)
+    load_seconds = time.perf_counter() - start
+    clusters, stats = find_duplicates(paragraphs, args.shingle, args.perms, args.bands,
+                                      args.threshold)
+    seconds = stats['seconds']
+    print(f"{len(paragraphs):,} paragraphs loaded in {load_seconds:.2f} s; "
+          f"MinHash {seconds['minhash']:.2f} s, LSH {seconds['lsh']:.2f} s "
+          f"({stats['candidates']:,} candidate pairs), verify {seconds['verify']:.2f} s")
+    cross_book = [group for group in clusters if len({paragraphs[i].book for i in group}) > 1]
+    duplicates = sum(len(group) - 1 for group in clusters)
+    print(f"{len(clusters):,} clusters ({len(cross_book):,} across books), "
+          f"{duplicates:,} repeated paragraphs")
+
+    for group in clusters[:args.show]:
+        books = sorted({paragraphs[i].book for i in group})
+        print(f"\n{len(group)} paragraphs in {', '.join(books)}: {paragraphs[group[0]].text[:60]}")
+        for i in group[:5]:
+            print(f"    {paragraphs[i].path} @{paragraphs[i].offset}")
+        if len(group) > 5:
+            print(f"    ... {len(group) - 5} more")
+
+    if args.report:
+        args.report.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump([cluster_dict(paragraphs, group) for group in clusters], f,
+                      ensure_ascii=False, indent=1)
+        print(f"\nClusters written to {args.report}")
+    if args.export:
+        dropped = export_deduplicated(paragraphs, clusters, args.root, args.export)
+        print(f"Deduplicated corpus written to {args.export} ({dropped:,} paragraphs dropped)")
+
+
+if __name__ == "__main__":
+    main()
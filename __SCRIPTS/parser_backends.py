@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tokenizer backends for the streaming converter
+
+StreamingConverter builds its tree from html.parser-style events
+(handle_starttag, handle_endtag, handle_data, handle_comment, ...). A backend
+turns a page into those events:
+
+    html.parser  the stdlib tokenizer the converter is built on; always
+                 available and the only backend with exact reference parity
+                 on malformed markup
+    lxml         libxml2's HTML parser, through an lxml parser target
+    lexbor       selectolax's lexbor HTML5 parser; its DOM is walked
+                 iteratively into events
+
+lxml and lexbor repair markup their own way before the converter sees it,
+so on broken pages their Markdown can differ from the reference;
+compare_backends.py reports where. A backend whose module is not installed
+falls back to the next one in FALLBACK_ORDER, ending at html.parser.
+"""
+
+import importlib.util
+from collections import namedtuple
+
+import markdown_converter
+from markdown_converter import CONVERTER_VERSION, tokenize_html_parser
+
+DEFAULT_BACKEND = "html.parser"
+# "fast" picks the first installed backend in this order
+FALLBACK_ORDER = ["lexbor", "lxml", "html.parser"]
+
+# name, module that must be importable (None: stdlib), tokenize(converter, html)
+Backend = namedtuple("Backend", ["name", "module", "tokenize"])
+
+
+def _lxml_events(html_content):
+    from lxml import etree
+
+    events = []
+
+    class Target:
+        def start(self, tag, attrib, nsmap=None):
+            events.append(('handle_starttag', (tag, list(attrib.items()))))
+
+        def end(self, tag):
+            events.append(('handle_endtag', (tag,)))
+
+        def data(self, data):
+            events.append(('handle_data', (data,)))
+
+        def comment(self, text):
+            events.append(('handle_comment', (text,)))
+
+        def pi(self, target, data=None):
+            events.append(('handle_pi', (f"{target} {data}" if data else target,)))
+
+        def doctype(self, name, pubid, system):
+            events.append(('handle_decl', (f"DOCTYPE {name}",)))
+
+        def close(self):
+            return None
+
+    parser = etree.HTMLParser(target=Target())
+    parser.feed(html_content)
+    parser.close()
+    return events
+
+
+def tokenize_lxml(converter, html_content):
+    converter.feed_events(_lxml_events(html_content))
+
+
+def _lexbor_events(html_content):
+    """Events of a depth-first walk over the lexbor DOM, without recursion"""
+    from selectolax.lexbor import LexborHTMLParser
+
+    # Open elements are tracked on a stack rather than through node.parent,
+    # which is None for the children of <template> contents
+    node = LexborHTMLParser(html_content).root
+    open_elements = []
+    while node is not None:
+        if node.is_text_node:
+            yield 'handle_data', (node.text_content,)
+        elif node.is_comment_node:
+            yield 'handle_comment', (node.comment_content,)
+        elif node.is_element_node:
+            yield 'handle_starttag', (node.tag, list(node.attributes.items()))
+            child = node.child
+            if child is not None:
+                open_elements.append(node)
+                node = child
+                continue
+            yield 'handle_endtag', (node.tag,)
+        # Climb out of finished elements to the next sibling
+        while open_elements and node.next is None:
+            node = open_elements.pop()
+            yield 'handle_endtag', (node.tag,)
+        node = node.next if open_elements else None
+
+
+def tokenize_lexbor(converter, html_content):
+    converter.feed_events(_lexbor_events(html_content))
+
+
+BACKENDS = {
+    "html.parser": Backend("html.parser", None, tokenize_html_parser),
+    "lxml": Backend("lxml", "lxml", tokenize_lxml),
+    "lexbor": Backend("lexbor", "selectolax", tokenize_lexbor),
+}
+
+_warned = set()
+
+
+def is_available(name):
+    module = BACKENDS[name].module
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def get_backend(name=DEFAULT_BACKEND):
+    """The named backend, or the next installed one in FALLBACK_ORDER"""
+    if name == "fast":
+        name = FALLBACK_ORDER[0]
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown parser backend {name!r}; choose from {', '.join(BACKENDS)}")
+    for candidate in FALLBACK_ORDER[FALLBACK_ORDER.index(name):]:
+        if is_available(candidate):
+            if candidate != name and name not in _warned:
+                _warned.add(name)
+                print(f"Parser backend {name} is not installed, using {candidate}")
+            return BACKENDS[candidate]
+    return BACKENDS[DEFAULT_BACKEND]
+
+
+def backend_version(name, normalize=()):
+    """Converter version recorded in the build manifest for a backend
+
+    Backends can disagree on broken markup, so switching backend rebuilds
+    every page; so does changing the markdown_converter.LINE_RULES the
+    output is normalized with.
+    """
+    version = CONVERTER_VERSION if name == DEFAULT_BACKEND else f"{CONVERTER_VERSION}+{name}"
+    return ''.join([version] + [f"+{rule}" for rule in normalize])
+
+
+def html_to_markdown(html_content, backend=DEFAULT_BACKEND, normalize=()):
+    """markdown_converter.html_to_markdown() through the given backend"""
+    return markdown_converter.html_to_markdown(html_content,
+                                               tokenize=get_backend(backend).tokenize,
+                                               rules=normalize)
+
+
+def html_to_markdown_timed(html_content, backend=DEFAULT_BACKEND, normalize=(), write=None):
+    """markdown_converter.html_to_markdown_timed() through the given backend"""
+    return markdown_converter.html_to_markdown_timed(html_content,
+                                                     tokenize=get_backend(backend).tokenize,
+                                                     rules=normalize, write=write)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Adaptive per-host request scheduling for the shared HTTP client
+
+Every request attempt asks the scheduler for a slot on its host first. A
+host's slots are limited three ways:
+
+- a token bucket paces requests to the robots.txt Crawl-delay (or
+  Request-rate), or to an explicit rate if that is lower;
+- a Retry-After on a 429/503 pauses the whole host, not just the request
+  that got it;
+- a robots.txt that cannot be read (5xx or no answer) pauses the host
+  until it is asked for again, and disallows everything after
+  ROBOTS_ATTEMPTS tries; one answering 401/403 disallows everything, as
+  urllib.robotparser reads it;
+- the number of requests in flight follows AIMD, as TCP's window does:
+  each good response adds 1/limit (about one slot per round of requests),
+  while a throttled or failed response, or a smoothed latency well above
+  the fastest one seen, halves it, at most once per round. Past the limit
+  that was last throttled, growth slows to 1/limit**2 per response, so
+  the host is re-probed now and then rather than every few rounds. The
+  limit only grows while it is actually reached, so a host paced by its
+  crawl-delay never builds up a window it has not tried.
+
+So concurrency climbs to what the host sustains, up to max_concurrency,
+and backs off by itself when the host slows down or starts refusing.
+Install it with http_client.configure_client(scheduler=...).
+"""
+
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+DEFAULT_MAX_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+INITIAL_CONCURRENCY = 2
+DECREASE_FACTOR = 0.5
+# Smoothed latency this many times the fastest response, and at least
+# LATENCY_SLACK seconds slower, counts as the host queueing requests
+LATENCY_FACTOR = 2.0
+LATENCY_SLACK = 0.05
+LATENCY_ALPHA = 0.2
+MAX_PAUSE = 300.0
+ROBOTS_TIMEOUT = 10
+ROBOTS_AGENT = '*'
+ROBOTS_ATTEMPTS = 3
+ROBOTS_RETRY = 30.0
+DISALLOW_ALL = "User-agent: *\nDisallow: /\n"
+
+# Statuses that mean "slow down" rather than "this page is broken"
+THROTTLE_STATUSES = frozenset([429, 503])
+
+# A granted slot: the host it belongs to and when the request started
+Ticket = namedtuple("Ticket", ["host", "start"])
+
+
+class RobotsDisallowed(Exception):
+    """Raised for URLs the host's robots.txt does not allow us to fetch"""
+
+
+class RobotsUnavailable(Exception):
+    """robots.txt could not be read: a 5xx answer or a network error"""
+
+
+class TokenBucket:
+    """rate tokens per second, holding at most burst; rate None never waits"""
+
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait_time(self, now):
+        """Seconds until a token is available (0 if one is now)"""
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate:
+            self.tokens -= 1
+
+
+class HostState:
+    """Scheduling state and counters of one host"""
+
+    def __init__(self, limit, bucket, robots):
+        self.limit = float(limit)
+        self.bucket = bucket
+        self.robots = robots
+        # While robots.txt cannot be read: when to ask again, and why not
+        self.robots_retry_at = None
+        self.robots_failures = 0
+        self.robots_error = None
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.fastest = None
+        self.latency = None
+        self.last_decrease = 0.0
+        self.throttled_at = None
+        self.peak_limit = self.limit
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.decreases = 0
+        self.paused = 0.0
+
+
+def robots_url(url):
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, '/robots.txt', '', ''))
+
+
+def parse_crawl_delay(text):
+    """Crawl-delay of the robots.txt group for every agent, in seconds
+
+    RobotFileParser only accepts whole seconds and drops "Crawl-delay: 0.5".
+    """
+    applies = False
+    agent_lines = False
+    for line in text.splitlines():
+        key, _, value = line.split('#', 1)[0].partition(':')
+        key = key.strip().lower()
+        value = value.strip()
+        if key == 'user-agent':
+            # Consecutive User-agent lines share one group
+            applies = (applies and agent_lines) or value == ROBOTS_AGENT
+            agent_lines = True
+            continue
+        agent_lines = False
+        if key == 'crawl-delay' and applies:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+def fetch_robots(url):
+    """robots.txt text of url's host, or None if it has none
+
+    401 and 403 stand for a robots.txt disallowing everything; any other
+    4xx means there is none. Raises RobotsUnavailable on a 5xx or a
+    network error.
+    """
+    try:
+        response = requests.get(robots_url(url), timeout=ROBOTS_TIMEOUT)
+    except requests.RequestException as e:
+        raise RobotsUnavailable(str(e)) from e
+    if response.status_code in (401, 403):
+        return DISALLOW_ALL
+    if response.status_code >= 500:
+        raise RobotsUnavailable(f"HTTP {response.status_code}")
+    if response.status_code != 200:
+        return None
+    response.encoding = response.encoding or 'utf-8'
+    return response.text
+
+
+class PolitenessScheduler:
+    """Per-host token bucket, Retry-After pauses and AIMD concurrency
+
+    max_concurrency caps each host's requests in flight; rate (requests per
+    second) caps its pace on top of robots.txt. robots=False skips
+    robots.txt entirely.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, rate=None, robots=True,
+                 initial_concurrency=INITIAL_CONCURRENCY):
+        self.max_concurrency = max(MIN_CONCURRENCY, max_concurrency)
+        self.initial = min(self.max_concurrency, max(MIN_CONCURRENCY, initial_concurrency))
+        self.rate = rate
+        self.robots = robots
+        self.hosts = {}
+        self._condition = threading.Condition()
+        self._robots_lock = threading.Lock()
+
+    def _state(self, url):
+        """The host's state, once its robots.txt has been read
+
+        Reads robots.txt the first time the host is seen. While it cannot
+        be read, every request to the host waits until it is asked for
+        again.
+        """
+        host = urlsplit(url).netloc
+        with self._condition:
+            state = self.hosts.get(host)
+        while state is None or state.robots_retry_at is not None:
+            if state is not None:
+                wait = state.robots_retry_at - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            with self._robots_lock:
+                with self._condition:
+                    state = self.hosts.get(host)
+                if state is None or (state.robots_retry_at is not None
+                                     and time.monotonic() >= state.robots_retry_at):
+                    state = self._read_robots(url, host, state)
+        return host, state
+
+    def _read_robots(self, url, host, state):
+        """Read host's robots.txt into its state, new if state is None"""
+        if state is None:
+            state = HostState(self.initial, TokenBucket(self.rate), None)
+        text = None
+        state.robots_retry_at = None
+        if self.robots:
+            try:
+                text = fetch_robots(url)
+                state.robots_error = None
+            except RobotsUnavailable as e:
+                state.robots_failures += 1
+                state.robots_error = f"{robots_url(url)} could not be read ({e})"
+                if state.robots_failures < ROBOTS_ATTEMPTS:
+                    state.robots_retry_at = time.monotonic() + ROBOTS_RETRY
+                else:
+                    text = DISALLOW_ALL
+        rate = self.rate
+        if text is not None:
+            state.robots = RobotFileParser()
+            state.robots.parse(text.splitlines())
+            delay = parse_crawl_delay(text)
+            request_rate = state.robots.request_rate(ROBOTS_AGENT)
+            for allowed in (1 / float(delay) if delay else None,
+                            request_rate.requests / request_rate.seconds
+                            if request_rate else None):
+                if allowed and (rate is None or allowed < rate):
+                    rate = allowed
+        state.bucket.rate = rate
+        with self._condition:
+            self.hosts[host] = state
+        return state
+
+    def acquire(self, url):
+        """Block until url's host has a free slot; returns a Ticket for release()"""
+        host, state = self._state(url)
+        if state.robots is not None and not state.robots.can_fetch(ROBOTS_AGENT, url):
+            if state.robots_error:
+                raise RobotsDisallowed(f"{url} is disallowed: {state.robots_error}")
+            raise RobotsDisallowed(f"{url} is disallowed by {robots_url(url)}")
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = state.paused_until - now
+                if wait <= 0 and state.in_flight < int(state.limit):
+                    wait = state.bucket.wait_time(now)
+                    if wait <= 0:
+                        state.bucket.take()
+                        state.in_flight += 1
+                        return Ticket(host, now)
+                # A release wakes everyone; otherwise wake when the pause
+                # or the token is due
+                self._condition.wait(wait if wait > 0 else None)
+
+    def release(self, ticket, status=None, retry_after=None):
+        """Record how the request went: its status (None if it raised)"""
+        now = time.monotonic()
+        elapsed = now - ticket.start
+        with self._condition:
+            state = self.hosts[ticket.host]
+            # Only a full window says anything about whether it could grow
+            window_full = state.in_flight >= int(state.limit)
+            state.in_flight -= 1
+            state.requests += 1
+            if retry_after is not None and status in THROTTLE_STATUSES:
+                until = now + min(retry_after, MAX_PAUSE)
+                if until > state.paused_until:
+                    state.paused += until - max(now, state.paused_until)
+                    state.paused_until = until
+
+            if status in THROTTLE_STATUSES:
+                state.throttled += 1
+                state.throttled_at = state.limit
+                self._decrease(state, ticket.start, now)
+            elif status is None or status >= 500:
+                state.errors += 1
+                self._decrease(state, ticket.start, now)
+            else:
+                if state.fastest is None or elapsed < state.fastest:
+                    state.fastest = elapsed
+                state.latency = (elapsed if state.latency is None
+                                 else state.latency + LATENCY_ALPHA * (elapsed - state.latency))
+                if (state.latency > LATENCY_FACTOR * state.fastest
+                        and state.latency - state.fastest > LATENCY_SLACK):
+                    self._decrease(state, ticket.start, now)
+                elif window_full:
+                    step = 1 / state.limit
+                    if state.throttled_at is not None and state.limit + 1 >= state.throttled_at:
+                        step /= state.limit
+                    state.limit = min(self.max_concurrency, state.limit + step)
+                    state.peak_limit = max(state.peak_limit, state.limit)
+            self._condition.notify_all()
+
+    def _decrease(self, state, started, now):
+        # Requests already in flight at the last decrease saw the old
+        # limit; halving again for each of them would collapse the window
+        if started < state.last_decrease:
+            return
+        state.limit = max(MIN_CONCURRENCY, state.limit * DECREASE_FACTOR)
+        state.last_decrease = now
+        state.decreases += 1
+
+    def summary(self):
+        """One line per host"""
+        with self._condition:
+            hosts = sorted(self.hosts.items())
+        if not hosts:
+            return "Scheduler: no hosts contacted"
+        lines = []
+        for host, state in hosts:
+            rate = f"{state.bucket.rate:.2f}/s" if state.bucket.rate else "unpaced"
+            lines.append(f"Scheduler {host}: {state.requests} requests, {rate}, "
+                         f"concurrency {state.limit:.1f} (peak {state.peak_limit:.1f}, "
+                         f"max {self.max_concurrency}), {state.throttled} throttled, "
+                         f"{state.errors} errors, {state.decreases} backoffs, "
+                         f"paused {state.paused:.1f} s")
+        return '\n'.join(lines)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Per-page metrics of a scrape run, exported as JSON and Prometheus text
+
+Every page gets a record of the stages it went through (fetch, parse_walk,
+toc, postprocess, write): wall time, bytes in and bytes out, plus the line
+and heading counts of its Markdown, its build status and, if it failed, the
+stage and class of the error. write_json() keeps the whole run for later
+comparison; write_prometheus() writes run totals and per-page gauges in the
+text format read by node_exporter's textfile collector. merge_runs() joins
+the reports of several worker processes into one run.
+"""
+
+import calendar
+import json
+import os
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+DEFAULT_REPORT_DIR = Path("run_reports")
+
+STAGES = ('fetch', 'parse_walk', 'toc', 'postprocess', 'write')
+
+
+class PageMetrics:
+    """Stages, counts and outcome of one page"""
+
+    def __init__(self, job):
+        self.url = job.url
+        self.title = job.title
+        self.output_file = Path(job.output_file).as_posix()
+        self.stages = {}
+        self.lines = 0
+        self.headings = 0
+        self.status = None
+        self.error = None
+        self.error_stage = None
+
+    def add_stage(self, stage, seconds, bytes_in=0, bytes_out=0):
+        self.stages[stage] = {'seconds': seconds, 'bytes_in': bytes_in, 'bytes_out': bytes_out}
+
+    @property
+    def seconds(self):
+        return sum(stage['seconds'] for stage in self.stages.values())
+
+    @classmethod
+    def from_dict(cls, data):
+        """A page read back from as_dict() output"""
+        page = cls.__new__(cls)
+        for key in ('url', 'title', 'output_file', 'status', 'error', 'error_stage',
+                    'lines', 'headings', 'stages'):
+            setattr(page, key, data[key])
+        return page
+
+    def as_dict(self):
+        return {
+            'url': self.url,
+            'title': self.title,
+            'output_file': self.output_file,
+            'status': self.status,
+            'error': self.error,
+            'error_stage': self.error_stage,
+            'seconds': self.seconds,
+            'lines': self.lines,
+            'headings': self.headings,
+            'stages': self.stages,
+        }
+
+
+def _label(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _write_atomic(path, text):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(f"{path.name}.tmp{os.getpid()}")
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_file, path)
+
+
+class RunMetrics:
+    """PageMetrics of every page in one run, keyed by URL"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.finished = None
+        self.pages = {}
+        self._lock = threading.Lock()
+
+    def page(self, job):
+        with self._lock:
+            page = self.pages.get(job.url)
+            if page is None:
+                page = self.pages[job.url] = PageMetrics(job)
+            return page
+
+    def record_error(self, job, stage, error):
+        page = self.page(job)
+        page.status = 'error'
+        page.error = type(error).__name__
+        page.error_stage = stage
+
+    def finish(self):
+        self.finished = time.time()
+
+    @property
+    def duration(self):
+        return (self.finished or time.time()) - self.started
+
+    def stage_totals(self):
+        """stage -> summed seconds, bytes in and bytes out over all pages"""
+        totals = {stage: {'seconds': 0.0, 'bytes_in': 0, 'bytes_out': 0} for stage in STAGES}
+        for page in self.pages.values():
+            for stage, values in page.stages.items():
+                for key, value in values.items():
+                    totals[stage][key] += value
+        return totals
+
+    def slowest(self):
+        return max(self.pages.values(), key=lambda page: page.seconds, default=None)
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started)),
+            'duration_seconds': self.duration,
+            'statuses': dict(Counter(page.status for page in self.pages.values())),
+            'errors': dict(Counter(page.error for page in self.pages.values() if page.error)),
+            'stages': self.stage_totals(),
+            'pages': [page.as_dict() for page in self.pages.values()],
+        }
+
+    @classmethod
+    def read_json(cls, path):
+        """A run read back from a write_json() report"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        run = cls(data['name'])
+        run.started = calendar.timegm(time.strptime(data['started'], '%Y-%m-%dT%H:%M:%SZ'))
+        run.finished = run.started + data['duration_seconds']
+        for page_data in data['pages']:
+            page = PageMetrics.from_dict(page_data)
+            run.pages[page.url] = page
+        return run
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.as_dict(), ensure_ascii=False, indent=1) + '\n')
+
+    def prometheus_text(self):
+        """The run in Prometheus text exposition format"""
+        run = f'run="{_label(self.name)}"'
+        lines = [
+            "# HELP scrape_run_timestamp_seconds Start time of the last scrape run.",
+            "# TYPE scrape_run_timestamp_seconds gauge",
+            f"scrape_run_timestamp_seconds{{{run}}} {self.started:.3f}",
+            "# HELP scrape_run_duration_seconds Wall time of the last scrape run.",
+            "# TYPE scrape_run_duration_seconds gauge",
+            f"scrape_run_duration_seconds{{{run}}} {self.duration:.6f}",
+            "# HELP scrape_pages Pages in the last run by build status.",
+            "# TYPE scrape_pages gauge",
+        ]
+        for status, count in sorted(Counter(str(page.status) for page in self.pages.values()).items()):
+            lines.append(f'scrape_pages{{{run},status="{_label(status)}"}} {count}')
+        lines += [
+            "# HELP scrape_errors Failed pages in the last run by stage and error class.",
+            "# TYPE scrape_errors gauge",
+        ]
+        errors = Counter((page.error_stage, page.error) for page in self.pages.values() if page.error)
+        for (stage, error), count in sorted(errors.items()):
+            lines.append(f'scrape_errors{{{run},stage="{_label(stage)}",error="{_label(error)}"}} {count}')
+        totals = self.stage_totals()
+        for metric, key, help_text in (
+                ('scrape_stage_seconds', 'seconds', "Summed wall time of each stage."),
+                ('scrape_stage_bytes_in', 'bytes_in', "Bytes read by each stage."),
+                ('scrape_stage_bytes_out', 'bytes_out', "Bytes produced by each stage.")):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            for stage, values in totals.items():
+                lines.append(f'{metric}{{{run},stage="{stage}"}} {values[key]}')
+        for metric, attribute, help_text in (
+                ('scrape_page_seconds', 'seconds', "Wall time of each page over all stages."),
+                ('scrape_page_lines', 'lines', "Lines in each page's Markdown."),
+                ('scrape_page_headings', 'headings', "Headings in each page's Markdown.")):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            for page in self.pages.values():
+                lines.append(f'{metric}{{{run},page="{_label(page.output_file)}"}} '
+                             f'{getattr(page, attribute)}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        _write_atomic(path, self.prometheus_text())
+
+    def write_reports(self, report_dir=DEFAULT_REPORT_DIR):
+        """JSON report per run and a Prometheus textfile overwritten each run
+
+        Returns the two paths.
+        """
+        report_dir = Path(report_dir)
+        stamp = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(self.started))
+        json_file = report_dir / f"{self.name}-{stamp}.json"
+        prom_file = report_dir / f"{self.name}.prom"
+        self.write_json(json_file)
+        self.write_prometheus(prom_file)
+        return json_file, prom_file
+
+    def summary(self):
+        """Slowest page and error classes of the run"""
+        slowest = self.slowest()
+        if slowest is None:
+            return "No pages recorded"
+        stages = ", ".join(f"{stage} {values['seconds']:.2f} s"
+                           for stage, values in slowest.stages.items())
+        errors = Counter(page.error for page in self.pages.values() if page.error)
+        error_text = (", ".join(f"{error} x{count}" for error, count in errors.most_common())
+                      if errors else "none")
+        return (f"Slowest page: {slowest.title} ({slowest.seconds:.2f} s: {stages}); "
+                f"errors: {error_text}")
+
+
+def merge_runs(name, runs):
+    """One RunMetrics spanning several runs, such as the workers of a crawl
+
+    A page built by more than one run (taken over after its first worker
+    died) keeps the record of the run that finished last.
+    """
+    merged = RunMetrics(name)
+    runs = sorted(runs, key=lambda run: run.started + run.duration)
+    if runs:
+        merged.started = min(run.started for run in runs)
+        merged.finished = max(run.started + run.duration for run in runs)
+    for run in runs:
+        merged.pages.update(run.pages)
+    return merged
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Scrape any part of the catalog in one run
+
+Pages are picked from catalog.py with --book and --page (both repeatable;
+by default everything), fetched through the HTML cache and converted by
+one shared BuildPipeline, so a single title can be refreshed without
+touching the rest. --dry-run prints what a run would do to each page
+without fetching or writing anything. --discover builds whatever book pages
+site_crawler.py finds by following links from the site index instead.
+
+Progress is journaled page by page in .crawl_journal.sqlite
+(crawl_journal.py): a run that dies is resumed by the next one with the
+same selection, and runs started side by side split the pages between
+them instead of each doing all of them. --stream converts each page while
+it downloads (streaming_fetch.py), for slow links.
+
+    python __SCRIPTS/scrape.py --book owen --page owen_volume03
+    python __SCRIPTS/scrape.py --book silver_birch --jobs 4 --dry-run
+    python __SCRIPTS/scrape.py --from-cache --force
+    python __SCRIPTS/scrape.py --book owen --stream --sniff-charset
+    python __SCRIPTS/scrape.py --from-cache --force --normalize digits
+    python __SCRIPTS/scrape.py --discover --max-depth 2 --dry-run
+"""
+
+import argparse
+import sys
+from collections import Counter
+from pathlib import Path
+
+import catalog
+import crawl_journal
+import site_crawler
+from build_manifest import DEFAULT_MANIFEST, EMPTY, WRITTEN, BuildManifest, sha256_text
+from build_pipeline import DEFAULT_WORKERS, BuildPipeline
+from crawl_engine import DEFAULT_PER_HOST, print_error
+from html_cache import DEFAULT_CACHE_DIR, DEFAULT_ENCODING, HtmlCache
+from http_client import DEFAULT_POOL_SIZE, DEFAULT_RETRIES, configure_client, get_client
+from markdown_converter import LINE_RULES
+from parser_backends import BACKENDS, DEFAULT_BACKEND, backend_version, get_backend
+from politeness import PolitenessScheduler
+from run_metrics import DEFAULT_REPORT_DIR
+from streaming_fetch import streamed_fetch
+
+# plan() actions
+FETCH = "fetch"            # not cached: download and convert
+REVALIDATE = "revalidate"  # cached, output current: conditional GET, convert only if changed
+CONVERT = "convert"        # cached copy (or its output) is out of date: convert it
+SKIP = "skip"              # offline and output current: nothing to do
+MISSING = "missing"        # offline and not cached: cannot be built
+
+
+def report_status(job, status):
+    """Print the build_manifest status of a page; False if it had no content"""
+    if status == EMPTY:
+        print(f"Failed to scrape {job.title}: No content found")
+        return False
+    if status == WRITTEN:
+        print(f"Saved {job.title} to {job.output_file}")
+    else:
+        print(f"{job.title} is up to date ({status}), {job.output_file} not rewritten")
+    return True
+
+
+def plan(jobs, cache, manifest, converter_version):
+    """(job, action) for every job, from the cache and manifest alone"""
+    planned = []
+    for job in jobs:
+        body = cache.read(job.url)
+        current = (body is not None
+                   and manifest.is_current(job.output_file, sha256_text(cache.decode(body)),
+                                           converter_version))
+        if cache.offline:
+            action = MISSING if body is None else SKIP if current else CONVERT
+        else:
+            action = FETCH if body is None else REVALIDATE if current else CONVERT
+        planned.append((job, action))
+    return planned
+
+
+def print_plan(planned):
+    for job, action in planned:
+        print(f"{action:<10} {job.output_file}  {job.url}")
+    counts = Counter(action for _, action in planned)
+    print(f"\n{len(planned)} pages: " + ", ".join(f"{counts[action]} {action}"
+                                                 for action in (FETCH, REVALIDATE, CONVERT,
+                                                                SKIP, MISSING)
+                                                 if counts[action]))
+
+
+def build_parser(description="Scrape books from the catalog"):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--book', action='append', choices=list(catalog.BOOKS),
+                        help="book to scrape (repeatable; default: every book)")
+    parser.add_argument('--page', action='append',
+                        help="page output name or filename, e.g. volume03 (repeatable)")
+    parser.add_argument('--jobs', type=int, default=DEFAULT_WORKERS,
+                        help="converter processes shared by every page of the run")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="print the planned work per page and exit")
+    parser.add_argument('--list', action='store_true', help="print the catalog and exit")
+    parser.add_argument('--discover', action='store_true',
+                        help="build the book pages found by following links from the site "
+                             "index instead of the catalog (--dry-run still crawls)")
+    parser.add_argument('--max-depth', type=int, default=site_crawler.DEFAULT_MAX_DEPTH,
+                        help="with --discover: links followed from the site index")
+    parser.add_argument('--max-pages', type=int, default=site_crawler.DEFAULT_MAX_PAGES,
+                        help="with --discover: pages fetched at most while crawling")
+    parser.add_argument('--base-url', default=catalog.SITE_URL,
+                        help="site root to fetch from, e.g. a local mirror")
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST,
+                        help="maximum concurrent requests per host; the scheduler "
+                             "adapts below it to what the host sustains")
+    parser.add_argument('--rate', type=float,
+                        help="maximum requests per second per host (robots.txt "
+                             "Crawl-delay applies too)")
+    parser.add_argument('--ignore-robots', action='store_true',
+                        help="do not read robots.txt")
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help="keep-alive connections kept per host")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help="retries for transient HTTP failures")
+    parser.add_argument('--cache-dir', type=Path, default=DEFAULT_CACHE_DIR,
+                        help="raw HTML cache directory")
+    parser.add_argument('--stream', action='store_true',
+                        help="convert pages with html.parser while they download instead "
+                             "of after (pages that are not downloaded again, like a 304 or "
+                             "those found by --discover, are converted after as usual)")
+    parser.add_argument('--sniff-charset', action='store_true',
+                        help="decode pages in their <meta charset> instead of always UTF-8")
+    parser.add_argument('--from-cache', action='store_true',
+                        help="rebuild from cached HTML only, without network access")
+    parser.add_argument('--manifest', type=Path, default=DEFAULT_MANIFEST,
+                        help="incremental build manifest file")
+    parser.add_argument('--force', action='store_true',
+                        help="reconvert every page even if its inputs are unchanged")
+    parser.add_argument('--normalize', action='append', choices=sorted(LINE_RULES),
+                        help="also normalize the output text: digits turns full-width "
+                             "digits into ASCII, nfkc applies Unicode NFKC (repeatable, "
+                             "applied in order)")
+    parser.add_argument('--parser', choices=sorted(BACKENDS) + ['fast'], default=DEFAULT_BACKEND,
+                        help="HTML parser backend; falls back to html.parser if not installed")
+    parser.add_argument('--report-dir', type=Path, default=DEFAULT_REPORT_DIR,
+                        help="directory for the JSON run report and Prometheus textfile")
+    parser.add_argument('--journal', type=Path, default=crawl_journal.DEFAULT_JOURNAL,
+                        help="SQLite journal that lets an interrupted run resume")
+    parser.add_argument('--no-journal', action='store_true',
+                        help="build every selected page without journaling progress")
+    return parser
+
+
+def journal_hooks(journal):
+    """on_status, on_error and on_converted that keep the journal up to date"""
+    def on_status(job, status):
+        journal.mark(job.url, crawl_journal.WRITTEN, status=status)
+        return report_status(job, status)
+
+    def on_error(job, error):
+        journal.fail(job.url, error)
+        print_error(job, error)
+
+    def on_converted(job, markdown_sha256):
+        journal.mark(job.url, crawl_journal.CONVERTED, markdown_sha256=markdown_sha256)
+
+    return on_status, on_error, on_converted
+
+
+def open_cache(args):
+    """The HTML cache the parsed arguments ask for"""
+    return HtmlCache(args.cache_dir, offline=args.from_cache,
+                     encoding=None if args.sniff_charset else DEFAULT_ENCODING)
+
+
+def page_fetch(args, cache):
+    """cache.fetch_html, or with --stream a fetch that converts as it downloads"""
+    if not args.stream:
+        return cache.fetch_html
+    if get_backend(args.parser).name != DEFAULT_BACKEND:
+        sys.exit(f"--stream converts with {DEFAULT_BACKEND}; it cannot be combined with "
+                 f"--parser {args.parser}")
+    return streamed_fetch(cache, rules=args.normalize or ())
+
+
+def print_catalog():
+    for book in catalog.CATALOG:
+        print(f"{book.name:<16} {book.title}")
+        for page in book.pages:
+            print(f"    {page.output_name:<18} {page.filename:<20} {page.title}")
+
+
+def run(args, name=None):
+    """Scrape the pages selected by parsed arguments; returns the pages built"""
+    if args.list:
+        print_catalog()
+        return 0
+    if args.discover and (args.book or args.page):
+        sys.exit("--discover crawls the whole site; it cannot be combined with --book or --page")
+    if name is None:
+        name = (args.book[0] if args.book and len(args.book) == 1
+                else "discovered" if args.discover else "catalog")
+
+    configure_client(pool_size=args.pool_size, retries=args.retries,
+                     scheduler=PolitenessScheduler(args.per_host, rate=args.rate,
+                                                   robots=not args.ignore_robots))
+    cache = open_cache(args)
+    fetch = page_fetch(args, cache)
+    if args.discover:
+        pages, jobs = site_crawler.discover_jobs(cache.fetch_html, args.base_url,
+                                                 max_depth=args.max_depth,
+                                                 max_pages=args.max_pages, per_host=args.per_host)
+        print(f"Discovered {len(jobs)} book pages among {len(pages)} pages")
+        # Every discovered page was just fetched into the cache
+        fetch = cache.read_html
+    else:
+        try:
+            jobs = catalog.build_jobs(args.book, args.page, args.base_url)
+        except ValueError as e:
+            sys.exit(str(e))
+
+    manifest = BuildManifest(args.manifest, force=args.force)
+    if args.dry_run:
+        print_plan(plan(jobs, cache, manifest, backend_version(get_backend(args.parser).name,
+                                                               args.normalize or ())))
+        return 0
+
+    on_status, on_error, on_converted = report_status, print_error, None
+    journal = None
+    if not args.no_journal:
+        journal = crawl_journal.CrawlJournal(args.journal)
+        fresh = journal.enqueue(jobs)
+        print(("Starting a new pass. " if fresh else "Resuming. ") + journal.summary())
+        on_status, on_error, on_converted = journal_hooks(journal)
+        fetch = journal.fetch_with(cache, fetch)
+
+    pipeline = BuildPipeline(manifest, on_status, workers=args.jobs, backend=args.parser,
+                             on_error=on_error, name=name, on_converted=on_converted,
+                             normalize=args.normalize or ())
+    for output_dir in sorted({job.output_file.parent for job in jobs}):
+        output_dir.mkdir(exist_ok=True)
+
+    print("=" * 60)
+    source = "discovered pages" if args.discover else ', '.join(args.book or ['every book'])
+    print(f"Scraping {len(jobs)} pages of {source}...")
+    print("=" * 60)
+    if journal is None:
+        built = pipeline.run(jobs, fetch=fetch, per_host=args.per_host)
+    else:
+        # Pages are claimed as fetch slots free up, so a concurrent run
+        # sharing the journal gets the ones this run has not reached
+        with journal:
+            built = pipeline.run(journal.claimed_jobs(), fetch=fetch, per_host=args.per_host)
+            print(journal.summary())
+
+    print(pipeline.summary())
+    json_file, prom_file = pipeline.metrics.write_reports(args.report_dir)
+    print(f"Run report: {json_file}, metrics: {prom_file}")
+    print(cache.summary())
+    if not args.from_cache:
+        print(get_client().summary())
+        print(get_client().scheduler_summary())
+    print("\nScraping completed!")
+    return built
+
+
+def main(books=(), name=None, description="Scrape books from the catalog"):
+    """Command line entry point
+
+    books are the default --book selection of a wrapper script: --page
+    narrows them, and a --book (or --discover) of the user's replaces them.
+    """
+    args = build_parser(description).parse_args()
+    if books and not args.book and not args.discover:
+        args.book = list(books)
+    run(args, name)
+
+
+if __name__ == "__main__":
+    main()
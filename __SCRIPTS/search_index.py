@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Full-text search over the generated Markdown corpus
+
+Every non-empty line of every *_volumes/*.md file is a document. Text is
+NFKC-normalized and case-folded, then cut into overlapping character bigrams
+(single characters and the last character of every run are indexed as
+unigrams too), which suits Japanese without a word segmenter. Each term's
+postings list records, per document, the character offsets it occurs at,
+delta- and varint-encoded.
+
+The index is one file, read through mmap:
+
+    header    magic, counts and section offsets
+    postings  per term: (doc delta, tf, position bytes, position deltas)*
+    terms     sorted fixed-size entries: code points, df, last doc,
+              postings offset and length (binary searched in place)
+    docs      fixed-size entries: file, line, heading, byte offset, length
+    meta      JSON: books, files and heading paths
+
+Books are indexed in parallel, one shard per book in the same format, and
+the shards are merged by concatenating each term's postings.
+
+    python __SCRIPTS/search_index.py build --jobs 4
+    python __SCRIPTS/search_index.py query 霊界の生活
+    python __SCRIPTS/search_index.py query '"地縛霊"' --limit 5
+"""
+
+import argparse
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import unicodedata
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from corpus_reader import CorpusFile
+
+DEFAULT_INDEX = Path("search_index.bin")
+DEFAULT_JOBS = os.cpu_count() or 1
+
+MAGIC = b"MDSRCH01"
+# n_terms, n_docs, total_length, postings_offset, terms_offset, docs_offset,
+# meta_offset, meta_size
+HEADER = struct.Struct("<8s8Q")
+# first code point, second code point (0 for a unigram), df, last doc id,
+# postings offset, postings length
+TERM = struct.Struct("<IIIIQI")
+# file id, line number (1-based), heading id, byte offset of the line,
+# length in terms
+DOC = struct.Struct("<IIIQI")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Runs of word characters; punctuation and spaces break bigrams
+_RUN_RE = re.compile(r"[^\W_]+")
+
+SearchHit = namedtuple("SearchHit", ["score", "book", "path", "line", "byte_offset",
+                                     "heading_path", "text"])
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def tokenize(text, run_ends=False):
+    """(term, offset) pairs of normalized text; term is a code point pair
+
+    With run_ends (used when indexing) the last character of every run is
+    also emitted as a unigram, so each character starts some term and a
+    one-character query can be answered from a prefix scan of the terms.
+    """
+    terms = []
+    for match in _RUN_RE.finditer(text):
+        run = match.group()
+        start = match.start()
+        if len(run) == 1:
+            terms.append(((ord(run), 0), start))
+            continue
+        codes = [ord(c) for c in run]
+        for i in range(len(codes) - 1):
+            terms.append(((codes[i], codes[i + 1]), start + i))
+        if run_ends:
+            terms.append(((codes[-1], 0), start + len(codes) - 1))
+    return terms
+
+
+def _encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(buf, pos):
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _encode_doc(out, doc_delta, positions):
+    """Append one document's postings entry"""
+    _encode_varint(doc_delta, out)
+    _encode_varint(len(positions), out)
+    deltas = bytearray()
+    previous = 0
+    for position in positions:
+        _encode_varint(position - previous, deltas)
+        previous = position
+    _encode_varint(len(deltas), out)
+    out += deltas
+
+
+def book_name(book_dir):
+    name = Path(book_dir).name
+    return name[:-len("_volumes")] if name.endswith("_volumes") else name
+
+
+def book_dirs(root):
+    return sorted(path for path in Path(root).glob("*_volumes") if path.is_dir())
+
+
+# -- building ---------------------------------------------------------------
+
+def _book_documents(book_dir, root):
+    """(relative path, line, heading path, byte offset, text) per document"""
+    for path in sorted(Path(book_dir).glob("*.md")):
+        relative = path.relative_to(root).as_posix()
+        headings = []
+        with CorpusFile(path) as corpus_file:
+            for line_number, line in corpus_file.lines():
+                text = line.text().strip()
+                if not text:
+                    continue
+                if text.startswith('#'):
+                    level = len(text) - len(text.lstrip('#'))
+                    headings = headings[:level - 1] + [text.lstrip('#').strip()]
+                yield relative, line_number, " > ".join(headings), line.offset, text
+
+
+def write_index(path, terms, docs, meta, total_length):
+    """Write an index file
+
+    terms yields (term, df, last_doc, postings bytes) in term order; docs is
+    a list of DOC tuples.
+    """
+    path = Path(path)
+    tmp_file = path.with_name(f"{path.name}.tmp{os.getpid()}")
+    term_table = bytearray()
+    n_terms = 0
+    with open(tmp_file, 'wb') as f:
+        f.write(b'\0' * HEADER.size)
+        postings_offset = f.tell()
+        for (first, second), df, last_doc, postings in terms:
+            term_table += TERM.pack(first, second, df, last_doc, f.tell() - postings_offset,
+                                    len(postings))
+            f.write(postings)
+            n_terms += 1
+        terms_offset = f.tell()
+        f.write(term_table)
+        docs_offset = f.tell()
+        for doc in docs:
+            f.write(DOC.pack(*doc))
+        meta_offset = f.tell()
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        f.write(meta_bytes)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, n_terms, len(docs), total_length, postings_offset,
+                            terms_offset, docs_offset, meta_offset, len(meta_bytes)))
+    os.replace(tmp_file, path)
+
+
+def build_shard(book_dir, root, shard_path):
+    """Index one book into shard_path; returns shard_path"""
+    root = Path(root)
+    files = []
+    file_ids = {}
+    headings = []
+    heading_ids = {}
+    docs = []
+    postings = {}
+    total_length = 0
+    for relative, line_number, heading_path, byte_offset, text in _book_documents(book_dir, root):
+        if relative not in file_ids:
+            file_ids[relative] = len(files)
+            files.append(relative)
+        if heading_path not in heading_ids:
+            heading_ids[heading_path] = len(headings)
+            headings.append(heading_path)
+        doc_id = len(docs)
+        doc_terms = {}
+        tokens = tokenize(normalize(text), run_ends=True)
+        for term, position in tokens:
+            doc_terms.setdefault(term, []).append(position)
+        for term, positions in doc_terms.items():
+            entry = postings.get(term)
+            if entry is None:
+                postings[term] = entry = [bytearray(), 0, -1]
+            encoded, df, last_doc = entry
+            _encode_doc(encoded, doc_id - last_doc if last_doc >= 0 else doc_id, positions)
+            entry[1] = df + 1
+            entry[2] = doc_id
+        docs.append((file_ids[relative], line_number, heading_ids[heading_path], byte_offset,
+                     len(tokens)))
+        total_length += len(tokens)
+
+    meta = {
+        'root': str(root.resolve()),
+        'books': [book_name(book_dir)],
+        'files': [{'path': path, 'book': 0} for path in files],
+        'headings': headings,
+    }
+    terms = ((term, df, last_doc, bytes(encoded))
+             for term, (encoded, df, last_doc) in sorted(postings.items()))
+    write_index(shard_path, terms, docs, meta, total_length)
+    return shard_path
+
+
+def _rebase_postings(postings, doc_base, previous_last):
+    """Shard postings with doc ids moved up by doc_base, following a list
+    whose last doc id is previous_last (-1: none)"""
+    first, pos = _decode_varint(postings, 0)
+    absolute = first + doc_base
+    out = bytearray()
+    _encode_varint(absolute - previous_last if previous_last >= 0 else absolute, out)
+    out += postings[pos:]
+    return out
+
+
+def merge_shards(shard_paths, output):
+    """Merge shard indexes (in order) into one index at output"""
+    shards = [SearchIndex(path) for path in shard_paths]
+    try:
+        meta = {'root': shards[0].meta['root'] if shards else None,
+                'books': [], 'files': [], 'headings': []}
+        docs = []
+        doc_bases = []
+        total_length = 0
+        for shard in shards:
+            book_base = len(meta['books'])
+            file_base = len(meta['files'])
+            heading_base = len(meta['headings'])
+            meta['books'].extend(shard.meta['books'])
+            meta['files'].extend({'path': f['path'], 'book': f['book'] + book_base}
+                                 for f in shard.meta['files'])
+            meta['headings'].extend(shard.meta['headings'])
+            doc_bases.append(len(docs))
+            for doc_id in range(shard.n_docs):
+                file_id, line, heading_id, byte_offset, length = shard.doc_entry(doc_id)
+                docs.append((file_id + file_base, line, heading_id + heading_base, byte_offset,
+                             length))
+            total_length += shard.total_length
+
+        def merged_terms():
+            streams = [shard.iter_terms(tag=index) for index, shard in enumerate(shards)]
+            current = None
+            for term, index, (df, last_doc, offset, length) in heapq.merge(*streams):
+                if current is not None and current[0] != term:
+                    yield current[0], current[1], current[2], bytes(current[3])
+                    current = None
+                if current is None:
+                    current = [term, 0, -1, bytearray()]
+                postings = shards[index].postings_bytes(offset, length)
+                current[3] += _rebase_postings(postings, doc_bases[index], current[2])
+                current[1] += df
+                current[2] = last_doc + doc_bases[index]
+            if current is not None:
+                yield current[0], current[1], current[2], bytes(current[3])
+
+        write_index(output, merged_terms(), docs, meta, total_length)
+    finally:
+        for shard in shards:
+            shard.close()
+
+
+def build_index(root=".", output=DEFAULT_INDEX, jobs=DEFAULT_JOBS):
+    """Index every *_volumes directory under root, one book per worker"""
+    books = book_dirs(root)
+    if not books:
+        raise SystemExit(f"No *_volumes directories under {root}")
+    with tempfile.TemporaryDirectory() as tmp:
+        shard_paths = [Path(tmp) / f"{book_name(book)}.shard" for book in books]
+        with ProcessPoolExecutor(max_workers=max(1, jobs)) as executor:
+            list(executor.map(build_shard, books, [root] * len(books), shard_paths))
+        merge_shards(shard_paths, output)
+    return output
+
+
+# -- querying ---------------------------------------------------------------
+
+class SearchIndex:
+    """Read-only view of an index file through mmap"""
+
+    def __init__(self, path=DEFAULT_INDEX, root=None):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.n_terms, self.n_docs, self.total_length, self._postings_offset,
+         self._terms_offset, self._docs_offset, meta_offset, meta_size) = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a search index")
+        self.meta = json.loads(self._map[meta_offset:meta_offset + meta_size].decode('utf-8'))
+        self.root = Path(root) if root is not None else Path(self.meta['root'] or ".")
+        self.average_length = self.total_length / self.n_docs if self.n_docs else 0.0
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Terms and postings
+
+    def _term_at(self, i):
+        return TERM.unpack_from(self._map, self._terms_offset + i * TERM.size)
+
+    def iter_terms(self, tag=None):
+        """((first, second), tag, (df, last_doc, offset, length)) in term order"""
+        for i in range(self.n_terms):
+            first, second, df, last_doc, offset, length = self._term_at(i)
+            yield (first, second), tag, (df, last_doc, offset, length)
+
+    def _lower_bound(self, key):
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid)[:2] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find_terms(self, term):
+        """Term entries for a bigram, or for every bigram starting with a
+        unigram's character"""
+        first, second = term
+        i = self._lower_bound(term)
+        entries = []
+        while i < self.n_terms:
+            entry = self._term_at(i)
+            if entry[0] != first or (second and entry[1] != second):
+                break
+            entries.append(entry)
+            if second:
+                break
+            i += 1
+        return entries
+
+    def postings_bytes(self, offset, length):
+        start = self._postings_offset + offset
+        return self._map[start:start + length]
+
+    def postings(self, term, positions=False):
+        """doc id -> tf, or -> list of positions with positions=True"""
+        result = {}
+        for _, _, _, _, offset, length in self.find_terms(term):
+            buf = self.postings_bytes(offset, length)
+            pos = 0
+            doc_id = 0
+            while pos < len(buf):
+                delta, pos = _decode_varint(buf, pos)
+                doc_id += delta
+                tf, pos = _decode_varint(buf, pos)
+                size, pos = _decode_varint(buf, pos)
+                if positions:
+                    found = result.setdefault(doc_id, [])
+                    end = pos + size
+                    previous = 0
+                    while pos < end:
+                        gap, pos = _decode_varint(buf, pos)
+                        previous += gap
+                        found.append(previous)
+                else:
+                    result[doc_id] = result.get(doc_id, 0) + tf
+                    pos += size
+        if positions:
+            for found in result.values():
+                found.sort()
+        return result
+
+    # Documents
+
+    def doc_entry(self, doc_id):
+        return DOC.unpack_from(self._map, self._docs_offset + doc_id * DOC.size)
+
+    def hit(self, doc_id, score):
+        file_id, line, heading_id, byte_offset, _ = self.doc_entry(doc_id)
+        file_meta = self.meta['files'][file_id]
+        return SearchHit(score, self.meta['books'][file_meta['book']], file_meta['path'], line,
+                         byte_offset, self.meta['headings'][heading_id],
+                         self._line_text(file_meta['path'], byte_offset))
+
+    def _line_text(self, path, byte_offset):
+        try:
+            with open(self.root / path, 'rb') as f:
+                f.seek(byte_offset)
+                return f.readline().decode('utf-8', errors='replace').strip()
+        except OSError:
+            return None
+
+    # Ranking
+
+    def _bm25(self, df, tf, doc_id):
+        idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+        length = self.doc_entry(doc_id)[4]
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self.average_length or 1))
+        return idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+    def _top(self, scores, limit):
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [self.hit(doc_id, score) for doc_id, score in best]
+
+    def search(self, query, limit=10):
+        """BM25-ranked documents sharing bigrams with the query"""
+        scores = {}
+        for term in {term for term, _ in tokenize(normalize(query))}:
+            postings = self.postings(term)
+            df = len(postings)
+            for doc_id, tf in postings.items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + self._bm25(df, tf, doc_id)
+        return self._top(scores, limit)
+
+    def phrase(self, query, limit=10):
+        """Documents containing the query as a phrase, BM25-ranked by the
+        phrase's own frequency"""
+        tokens = tokenize(normalize(query))
+        if not tokens:
+            return []
+        lists = [(self.postings(term, positions=True), offset) for term, offset in tokens]
+        lists.sort(key=lambda item: len(item[0]))
+        rarest, rarest_offset = lists[0]
+        matches = {}
+        for doc_id, starts in rarest.items():
+            others = [(postings.get(doc_id), offset) for postings, offset in lists[1:]]
+            if any(found is None for found, _ in others):
+                continue
+            others = [(set(found), offset) for found, offset in others]
+            count = sum(1 for start in starts
+                        if all(start - rarest_offset + offset in found for found, offset in others))
+            if count:
+                matches[doc_id] = count
+        df = len(matches)
+        return self._top({doc_id: self._bm25(df, tf, doc_id) for doc_id, tf in matches.items()},
+                         limit)
+
+
+def print_hits(hits):
+    if not hits:
+        print("No matches")
+    for hit in hits:
+        print(f"{hit.score:6.2f}  {hit.book}  {hit.path}:{hit.line}  [{hit.heading_path}]")
+        if hit.text is not None:
+            print(f"        {hit.text[:120]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the corpus search index")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help="index every *_volumes directory")
+    build_parser.add_argument('--root', type=Path, default=Path("."),
+                              help="directory holding the *_volumes directories")
+    build_parser.add_argument('--index', type=Path, default=DEFAULT_INDEX)
+    build_parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS,
+                              help="books indexed in parallel")
+    query_parser = subparsers.add_parser('query', help="search the index")
+    query_parser.add_argument('text', help='query; wrap it in double quotes for a phrase')
+    query_parser.add_argument('--index', type=Path, default=DEFAULT_INDEX)
+    query_parser.add_argument('--phrase', action='store_true', help="match the text as a phrase")
+    query_parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        output = build_index(args.root, args.index, args.jobs)
+        with SearchIndex(output) as index:
+            print(f"Indexed {len(index.meta['books'])} books, {len(index.meta['files'])} files, "
+                  f"{index.n_docs:,} lines, {index.n_terms:,} terms into {output} "
+                  f"({output.stat().st_size / 2**20:.1f} MB)")
+        return
+
+    if not args.index.exists():
+        sys.exit(f"No index at {args.index}; run the build command first")
+    text = args.text
+    phrase = args.phrase
+    if len(text) > 1 and text.startswith('"') and text.endswith('"'):
+        text, phrase = text[1:-1], True
+    with SearchIndex(args.index) as index:
+        print_hits(index.phrase(text, args.limit) if phrase else index.search(text, args.limit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Section offset index stored next to each generated Markdown file
+
+For volume01.md the index is volume01.md.idx: a header followed by one
+fixed-size record per "#" heading, in file order:
+
+    level   number of "#" markers
+    unit    部/章/巻/節 of a numbered heading (0 when not numbered)
+    number  the heading's number, from full-width or kanji numerals
+    offset  byte offset of the heading line
+    length  bytes up to the next heading of the same or a higher level
+
+so reading one chapter is a seek and a read of exactly its bytes. The header
+keeps the size and mtime of the Markdown it was built from; a stale or
+missing index is rebuilt when a SectionStore is opened.
+
+    python __SCRIPTS/section_store.py index
+    python __SCRIPTS/section_store.py toc stainton_moses_volumes/stainton_upper.md
+    python __SCRIPTS/section_store.py show stainton_moses_volumes/stainton_upper.md 第三節
+"""
+
+import argparse
+import os
+import re
+import struct
+from collections import namedtuple
+from pathlib import Path
+
+INDEX_SUFFIX = ".idx"
+
+MAGIC = b"MDSECT01"
+# magic, record count, Markdown size, Markdown mtime (ns)
+HEADER = struct.Struct("<8sIQq")
+# level, unit, number, byte offset, byte length
+RECORD = struct.Struct("<BBIQI")
+
+UNITS = ['', '部', '章', '巻', '節']
+
+_NUMBERED_RE = re.compile(r'第([０-９0-9〇一二三四五六七八九十百千]+)([部章巻節])')
+
+_KANJI_DIGITS = {c: i for i, c in enumerate('〇一二三四五六七八九')}
+_KANJI_UNITS = {'十': 10, '百': 100, '千': 1000}
+
+Section = namedtuple("Section", ["index", "level", "unit", "number", "offset", "length"])
+
+
+def parse_number(numeral):
+    """Integer value of a full-width, ASCII or kanji numeral ("１２", "十二")"""
+    if numeral.isdigit():
+        return int(numeral)  # int() accepts full-width digits
+    value = 0
+    digit = None
+    for c in numeral:
+        if c in _KANJI_DIGITS:
+            # 一九四九 style: positional digits
+            digit = _KANJI_DIGITS[c] if digit is None else digit * 10 + _KANJI_DIGITS[c]
+        else:
+            value += (digit if digit is not None else 1) * _KANJI_UNITS[c]
+            digit = None
+    return value + (digit or 0)
+
+
+def parse_label(label):
+    """(unit code, number) of a heading label such as "第三章" or "第１２節"
+
+    Returns None if the label is not numbered.
+    """
+    match = _NUMBERED_RE.search(label)
+    if not match:
+        return None
+    return UNITS.index(match.group(2)), parse_number(match.group(1))
+
+
+def index_path(md_path):
+    md_path = Path(md_path)
+    return md_path.with_name(md_path.name + INDEX_SUFFIX)
+
+
+def scan_headings(data):
+    """Section records of Markdown bytes, as (level, unit, number, offset, length)"""
+    headings = []
+    offset = 0
+    for line in data.split(b'\n'):
+        if line.startswith(b'#'):
+            text = line.decode('utf-8', errors='replace')
+            level = len(text) - len(text.lstrip('#'))
+            unit, number = parse_label(text.lstrip('#').lstrip()[:16]) or (0, 0)
+            headings.append([level, unit, number, offset, 0])
+        offset += len(line) + 1
+    end = len(data)
+    # A section runs to the next heading at its own level or above
+    open_sections = []
+    for record in headings:
+        while open_sections and open_sections[-1][0] >= record[0]:
+            closed = open_sections.pop()
+            closed[4] = record[3] - closed[3]
+        open_sections.append(record)
+    for record in open_sections:
+        record[4] = end - record[3]
+    return [tuple(record) for record in headings]
+
+
+def write_index(md_path, data=None):
+    """Write the section index of md_path (data: its bytes, if already in hand)"""
+    md_path = Path(md_path)
+    if data is None:
+        data = md_path.read_bytes()
+    records = scan_headings(data)
+    stat = md_path.stat()
+    path = index_path(md_path)
+    tmp_file = path.with_name(f"{path.name}.tmp{os.getpid()}")
+    with open(tmp_file, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(records), stat.st_size, stat.st_mtime_ns))
+        for record in records:
+            f.write(RECORD.pack(*record))
+    os.replace(tmp_file, path)
+    return path
+
+
+def _read_index(md_path):
+    """Records of an up-to-date index for md_path, or None"""
+    try:
+        data = index_path(md_path).read_bytes()
+        stat = Path(md_path).stat()
+    except FileNotFoundError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, count, size, mtime_ns = HEADER.unpack_from(data)
+    if (magic != MAGIC or size != stat.st_size or mtime_ns != stat.st_mtime_ns
+            or len(data) != HEADER.size + count * RECORD.size):
+        return None
+    return list(RECORD.iter_unpack(data[HEADER.size:]))
+
+
+class SectionStore:
+    """Sections of one Markdown file, read through its offset index"""
+
+    def __init__(self, md_path):
+        self.md_path = Path(md_path)
+        records = _read_index(self.md_path)
+        if records is None:
+            write_index(self.md_path)
+            records = _read_index(self.md_path)
+        self.sections = [Section(i, *record) for i, record in enumerate(records)]
+        self._file = open(self.md_path, 'rb')
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.sections)
+
+    def _pread(self, offset, length):
+        return os.pread(self._file.fileno(), length, offset)
+
+    def read(self, section):
+        """Text of a section, its heading line included"""
+        return self._pread(section.offset, section.length).decode('utf-8')
+
+    def title(self, section):
+        """Heading text of a section, without the "#" markers"""
+        line = self._pread(section.offset, min(section.length, 1024)).split(b'\n', 1)[0]
+        return line.decode('utf-8', errors='replace').lstrip('#').strip()
+
+    def find(self, label, unit=None):
+        """First section numbered like label ("第三章", "第３節"), or with the
+        given unit ("章") and integer label; None if there is none"""
+        if unit is None:
+            parsed = parse_label(label)
+            if parsed is None:
+                return None
+            unit, number = parsed
+        else:
+            unit, number = UNITS.index(unit), label
+        for section in self.sections:
+            if section.unit == unit and section.number == number:
+                return section
+        return None
+
+    def iter_sections(self, level=None):
+        """(section, text) for every section, or those at one level, read
+        one at a time"""
+        for section in self.sections:
+            if level is None or section.level == level:
+                yield section, self.read(section)
+
+    def chapter_tree(self):
+        """Nested (section, title, children) lists following heading levels"""
+        root = []
+        stack = []
+        for section in self.sections:
+            node = (section, self.title(section), [])
+            while stack and stack[-1][0].level >= section.level:
+                stack.pop()
+            (stack[-1][2] if stack else root).append(node)
+            stack.append(node)
+        return root
+
+
+def print_tree(nodes, depth=0):
+    for section, title, children in nodes:
+        print(f"{'  ' * depth}{title[:60]}  [{section.offset}+{section.length}]")
+        print_tree(children, depth + 1)
+
+
+def corpus_files(root="."):
+    """Every generated Markdown file under root, sorted by path"""
+    return sorted(Path(root).glob("*_volumes/*.md"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and read Markdown section indexes")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    index_parser = subparsers.add_parser('index', help="(re)build section indexes")
+    index_parser.add_argument('files', nargs='*', type=Path,
+                              help="Markdown files (default: every *_volumes/*.md)")
+    toc_parser = subparsers.add_parser('toc', help="print a file's chapter tree")
+    toc_parser.add_argument('file', type=Path)
+    show_parser = subparsers.add_parser('show', help="print one section")
+    show_parser.add_argument('file', type=Path)
+    show_parser.add_argument('label', help='numbered heading, e.g. 第三章')
+    args = parser.parse_args()
+
+    if args.command == 'index':
+        files = args.files or corpus_files()
+        sections = 0
+        for md_path in files:
+            write_index(md_path)
+            with SectionStore(md_path) as store:
+                sections += len(store)
+        print(f"Indexed {sections} sections in {len(files)} files")
+    elif args.command == 'toc':
+        with SectionStore(args.file) as store:
+            print_tree(store.chapter_tree())
+    else:
+        with SectionStore(args.file) as store:
+            section = store.find(args.label)
+            if section is None:
+                raise SystemExit(f"No section {args.label} in {args.file}")
+            print(store.read(section))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Discover book pages by following links from the site's index pages
+
+Starting from seed pages (by default the site index, spir/index.html, and
+the search page the catalog lives under), every fetched page's same-site
+links are added to a breadth-first frontier. URLs are normalized before
+they are admitted (scheme and host case, default ports, dot segments,
+percent-escapes, query order, fragments), so each page is fetched once no
+matter how it is spelled. Pages containing a div#content are book pages;
+known ones keep their catalog.py output file, new ones go to
+discovered_volumes/. --max-depth and --max-pages bound the crawl.
+
+Each level of the frontier is fetched concurrently through the crawl
+engine, so a level is only as slow as its slowest page. Point --base-url
+at a local mirror of the site to crawl that instead:
+
+    python __SCRIPTS/site_crawler.py --max-depth 2
+    python __SCRIPTS/site_crawler.py --base-url http://127.0.0.1:8000/spir/search/
+
+scrape.py --discover builds the pages found this way.
+"""
+
+import argparse
+import hashlib
+import posixpath
+import re
+import string
+from collections import deque, namedtuple
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import parse_qsl, quote, urlencode, urljoin, urlsplit, urlunsplit
+
+import catalog
+from crawl_engine import DEFAULT_PER_HOST, CrawlJob, run_crawl
+from html_cache import DEFAULT_CACHE_DIR, HtmlCache
+from http_client import configure_client, get_client
+from politeness import PolitenessScheduler
+
+# Relative to the catalog's SITE_URL (spir/search/): the site index one
+# level up, which links to the search page and the titles not listed there
+DEFAULT_SEEDS = ("../index.html", "")
+DEFAULT_MAX_DEPTH = 3
+DEFAULT_MAX_PAGES = 500
+DISCOVERED_DIR = Path("discovered_volumes")
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# Links to anything else (images, PDFs, archives) are never fetched
+PAGE_EXTENSIONS = frozenset(['', '.html', '.htm', '.shtml'])
+_PERCENT_ESCAPE = re.compile(r'%[0-9a-fA-F]{2}')
+_UNRESERVED = frozenset(string.ascii_letters + string.digits + '-._~')
+
+# One fetched page: how deep it was found, its <title>, whether it holds a
+# div#content, and the normalized links it contains
+DiscoveredPage = namedtuple("DiscoveredPage", ["url", "depth", "title", "has_content", "links"])
+
+
+def _normalize_escape(match):
+    """%7E -> ~, %e3 -> %E3: unreserved characters are never escaped"""
+    char = chr(int(match.group()[1:], 16))
+    return char if char in _UNRESERVED else match.group().upper()
+
+
+def normalize_url(url, base=None):
+    """Canonical form of url (resolved against base), or None if not http(s)"""
+    if base is not None:
+        url = urljoin(base, url.strip())
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+    try:
+        port = parts.port
+    except ValueError:
+        return None
+    netloc = parts.hostname
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        netloc += f":{port}"
+    # Joining an absolute path onto the root removes its dot segments
+    path = urlsplit(urljoin("http://host/", parts.path or "/")).path
+    path = _PERCENT_ESCAPE.sub(_normalize_escape, quote(path, safe="/%~:@!$&'()*+,;="))
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def is_page_url(url):
+    """True for URLs that look like HTML pages rather than other files"""
+    return posixpath.splitext(urlsplit(url).path)[1].lower() in PAGE_EXTENSIONS
+
+
+def crawl_scope(seeds):
+    """The longest directory URL every seed lies under"""
+    directories = [seed[:seed.rindex('/') + 1] for seed in seeds]
+    prefix = posixpath.commonprefix(directories)
+    return prefix[:prefix.rindex('/') + 1]
+
+
+class LinkExtractor(HTMLParser):
+    """Collect a page's links and title, and notice its div#content"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+        self.has_content = False
+        self.base = None
+        self.title_parts = []
+        self._in_title = False
+        self._title_seen = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('a', 'area', 'base'):
+            for name, value in attrs:
+                if name == 'href' and value:
+                    if tag == 'base':
+                        self.base = value
+                    else:
+                        self.links.append(value)
+        elif tag in ('frame', 'iframe'):
+            self.links.extend(value for name, value in attrs if name == 'src' and value)
+        elif tag == 'div':
+            if ('id', 'content') in attrs:
+                self.has_content = True
+        elif tag == 'title' and not self._title_seen:
+            self._in_title = self._title_seen = True
+
+    def handle_endtag(self, tag):
+        if tag == 'title':
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title_parts.append(data)
+
+    @property
+    def title(self):
+        return ' '.join(''.join(self.title_parts).split())
+
+
+def extract_links(url, html):
+    """(title, has_content, normalized links) of the page at url"""
+    extractor = LinkExtractor()
+    extractor.feed(html)
+    extractor.close()
+    base = urljoin(url, extractor.base) if extractor.base else url
+    links = []
+    for href in extractor.links:
+        link = normalize_url(href, base)
+        if link is not None:
+            links.append(link)
+    return extractor.title, extractor.has_content, links
+
+
+class Frontier:
+    """Breadth-first queue of URLs under a scope, each admitted only once
+
+    The seen set holds normalized URLs; for the few thousand pages of one
+    personal site an exact set is small enough that a Bloom filter would
+    save nothing worth its false positives.
+    """
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.seen = set()
+        self.queue = deque()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def in_scope(self, url):
+        return url.startswith(self.scope) and is_page_url(url)
+
+    def add(self, url, depth):
+        """Queue url at depth unless it is out of scope or already seen"""
+        if url in self.seen or not self.in_scope(url):
+            return False
+        self.seen.add(url)
+        self.queue.append((url, depth))
+        return True
+
+    def pop_level(self, limit=None):
+        """URLs of the shallowest depth still queued, at most limit of them"""
+        level = []
+        depth = self.queue[0][1]
+        while self.queue and self.queue[0][1] == depth and (limit is None or len(level) < limit):
+            level.append(self.queue.popleft()[0])
+        return depth, level
+
+
+def _print_discovery_error(job, error):
+    print(f"Could not fetch {job.url}: {error}")
+
+
+def discover(seeds, fetch, max_depth=DEFAULT_MAX_DEPTH, max_pages=DEFAULT_MAX_PAGES,
+             scope=None, per_host=DEFAULT_PER_HOST):
+    """Breadth-first crawl from seeds; returns the DiscoveredPages fetched
+
+    Seeds are depth 0. Links are followed from every page, book pages
+    included, until max_depth; at most max_pages pages are requested,
+    failed ones included. Pages come back level by level, each level in
+    the order it was queued.
+    """
+    seeds = [normalize_url(seed) for seed in seeds]
+    frontier = Frontier(scope or crawl_scope(seeds))
+    for seed in seeds:
+        frontier.add(seed, 0)
+
+    pages = []
+    requested = 0
+    while frontier and requested < max_pages:
+        depth, urls = frontier.pop_level(max_pages - requested)
+        requested += len(urls)
+        found = {}
+
+        def on_page(job, html):
+            found[job.url] = DiscoveredPage(job.url, depth, *extract_links(job.url, html))
+            return True
+
+        run_crawl([CrawlJob(url, url, None) for url in urls], on_page, per_host=per_host,
+                  fetch=fetch, on_error=_print_discovery_error)
+        for url in urls:
+            page = found.get(url)
+            if page is None:
+                continue
+            pages.append(page)
+            if depth < max_depth:
+                for link in page.links:
+                    frontier.add(link, depth + 1)
+    return pages
+
+
+def _discovered_output(url, scope, taken=()):
+    """discovered_volumes/ file for a page outside the catalog
+
+    The name comes from the page's path, which can map distinct URLs
+    (a/b.html and a_b.html, x.html and x.htm) to one file; a name already
+    in taken (compared case-insensitively, as some filesystems do) gets a
+    short hash of the URL added.
+    """
+    relative = url[len(scope):].split('?')[0]
+    stem = re.sub(r'[^0-9A-Za-z_.-]+', '_', posixpath.splitext(relative.strip('/'))[0]) or "index"
+    output_file = DISCOVERED_DIR / f"{stem}.md"
+    if output_file.as_posix().casefold() in taken:
+        output_file = DISCOVERED_DIR / f"{stem}_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}.md"
+    return output_file
+
+
+def discovered_jobs(pages, base_url=catalog.SITE_URL, scope=None):
+    """CrawlJobs of the pages that hold a div#content, in discovery order
+
+    Pages in the catalog keep its title and output file.
+    """
+    known = {normalize_url(job.url): job for job in catalog.build_jobs(base_url=base_url)}
+    if scope is None:
+        scope = crawl_scope([page.url for page in pages]) if pages else ""
+    jobs = []
+    taken = set()
+    for page in pages:
+        if not page.has_content:
+            continue
+        job = known.get(page.url)
+        if job is None:
+            job = CrawlJob(page.url, page.title or page.url,
+                           _discovered_output(page.url, scope, taken))
+        taken.add(job.output_file.as_posix().casefold())
+        jobs.append(job._replace(url=page.url))
+    return jobs
+
+
+def default_seeds(base_url=catalog.SITE_URL):
+    return [urljoin(base_url, seed) for seed in DEFAULT_SEEDS]
+
+
+def discover_jobs(fetch, base_url=catalog.SITE_URL, seeds=None, max_depth=DEFAULT_MAX_DEPTH,
+                  max_pages=DEFAULT_MAX_PAGES, per_host=DEFAULT_PER_HOST):
+    """Crawl from seeds (default: the site index) and return (pages, jobs)"""
+    seeds = [normalize_url(seed) for seed in seeds or default_seeds(base_url)]
+    scope = crawl_scope(seeds)
+    pages = discover(seeds, fetch, max_depth, max_pages, scope, per_host)
+    return pages, discovered_jobs(pages, base_url, scope)
+
+
+def print_discovery(pages, jobs):
+    for page in pages:
+        marker = "content" if page.has_content else ""
+        print(f"{page.depth} {marker:<8} {len(page.links):>4} links  {page.url}  {page.title}")
+    print(f"\n{len(pages)} pages fetched, {len(jobs)} book pages")
+    for job in jobs:
+        print(f"    {job.output_file}  {job.title}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Discover book pages by following site links")
+    parser.add_argument('--base-url', default=catalog.SITE_URL,
+                        help="catalog root to crawl from, e.g. a local mirror")
+    parser.add_argument('--seed', action='append',
+                        help="page to start from (repeatable; default: the site index)")
+    parser.add_argument('--max-depth', type=int, default=DEFAULT_MAX_DEPTH,
+                        help="links followed from the seeds")
+    parser.add_argument('--max-pages', type=int, default=DEFAULT_MAX_PAGES,
+                        help="pages fetched at most")
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST,
+                        help="maximum concurrent requests per host")
+    parser.add_argument('--cache-dir', type=Path, default=DEFAULT_CACHE_DIR,
+                        help="raw HTML cache directory")
+    parser.add_argument('--from-cache', action='store_true',
+                        help="crawl cached HTML only, without network access")
+    args = parser.parse_args()
+
+    configure_client(scheduler=PolitenessScheduler(args.per_host))
+    cache = HtmlCache(args.cache_dir, offline=args.from_cache)
+    pages, jobs = discover_jobs(cache.fetch_html, args.base_url, args.seed, args.max_depth,
+                                args.max_pages, args.per_host)
+    print_discovery(pages, jobs)
+    print(cache.summary())
+    if not args.from_cache:
+        print(get_client().scheduler_summary())
+
+
+if __name__ == "__main__":
+    main()
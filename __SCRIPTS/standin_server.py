@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Local stand-in for the source site, used by the benchmarks"""
+
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LAST_MODIFIED = "Sat, 01 Jan 2022 00:00:00 GMT"
+
+
+class StandInServer:
+    """Serve canned pages from a background thread with injected latency
+
+    pages maps a URL path to the HTML body (str or bytes); any other path gets
+    default_page, or a 404 when there is none. Each path first answers
+    fail_first requests with 503 before serving its page. Pages carry an ETag
+    and If-None-Match is answered with 304. request_count, connection_count
+    and not_modified_count show how many requests arrived over how many TCP
+    connections and how many were revalidated.
+
+    To act like a throttling host, a request arriving while max_concurrent
+    others are in flight gets 429 with Retry-After: retry_after, counted in
+    throttled_count; peak_in_flight is the most requests seen at once.
+    load_latency adds that many seconds per other request in flight, like a
+    host whose responses slow down as its queue grows. bandwidth, in bytes
+    per second, trickles each body out in small writes like a slow link.
+    robots_txt, if given, is served at /robots.txt. Use as a context manager:
+
+        with StandInServer({}, default_page=html, latency=0.2) as server:
+            fetch(server.base_url + "/volume01.html")
+    """
+
+    def __init__(self, pages, default_page=None, latency=0.0, fail_first=0, port=0,
+                 max_concurrent=None, retry_after=1, robots_txt=None, load_latency=0.0,
+                 bandwidth=None):
+        self.pages = pages
+        self.default_page = default_page
+        self.latency = latency
+        self.fail_first = fail_first
+        self.port = port
+        self.max_concurrent = max_concurrent
+        self.retry_after = retry_after
+        self.robots_txt = robots_txt
+        self.load_latency = load_latency
+        self.bandwidth = bandwidth
+        self.request_count = 0
+        self.connection_count = 0
+        self.not_modified_count = 0
+        self.throttled_count = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    def reset_failures(self):
+        """Make every path fail fail_first times again"""
+        with self._lock:
+            self._failures.clear()
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connection_count += 1
+
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path == '/robots.txt':
+                    self._robots()
+                    return
+                with server._lock:
+                    server.request_count += 1
+                    throttled = (server.max_concurrent is not None
+                                 and server.in_flight >= server.max_concurrent)
+                    if throttled:
+                        server.throttled_count += 1
+                    else:
+                        server.in_flight += 1
+                        server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+                if throttled:
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(server.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                try:
+                    self._serve(path)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _robots(self):
+                if server.robots_txt is None:
+                    self.send_error(404)
+                    return
+                body = server.robots_txt.encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _serve(self, path):
+                with server._lock:
+                    failures = server._failures.get(path, 0)
+                    server._failures[path] = failures + 1
+                    latency = server.latency + server.load_latency * (server.in_flight - 1)
+                if latency:
+                    time.sleep(latency)
+                if failures < server.fail_first:
+                    self.send_response(503)
+                    self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = server.pages.get(path, server.default_page)
+                if body is None:
+                    self.send_error(404)
+                    return
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    with server._lock:
+                        server.not_modified_count += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", LAST_MODIFIED)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if not server.bandwidth:
+                    self.wfile.write(body)
+                    return
+                # Twenty writes a second
+                step = max(1, int(server.bandwidth / 20))
+                for start in range(0, len(body), step):
+                    self.wfile.write(body[start:start + step])
+                    time.sleep(step / server.bandwidth)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
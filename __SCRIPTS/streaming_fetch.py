@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Convert pages while they download
+
+The default pipeline fetches a whole body, decodes it and only then hands
+it to a converter process, so on every page the network and the CPU take
+turns. streamed_fetch(cache) is a fetch(url) for BuildPipeline that reads
+the body in chunks instead (HtmlCache.open_bytes), decodes them
+incrementally and feeds each one to a StreamingConverter as it arrives.
+What it returns is a StreamedPage holding the finished Markdown, which the
+pipeline writes without converting again. Conversion then overlaps the
+download of the same page and of the pages in the other fetch threads, and
+no page is ever held whole in memory: the body goes to its cache object as
+it arrives and only the converter's output is kept. The few pages that
+convert differently in chunks (see ChunkedConverter) or need the reference
+converter are read back from the cache and converted whole. Pages with
+nothing to download (a 304, or --from-cache) leave no transfer to overlap
+with: they are returned as text, so an unchanged one is skipped by the
+pipeline's manifest check before anything converts it.
+
+Text is decoded as the cache decodes it: forced UTF-8, or the page's
+<meta charset> when the cache sniffs (html_cache.decode_html).
+"""
+
+import codecs
+import hashlib
+import time
+from collections import namedtuple
+
+from html_cache import CHUNK_SIZE, DEFAULT_ENCODING, SNIFF_BYTES, sniff_charset
+from markdown_converter import StreamingConverter, converted_markdown_timed, html_to_markdown_timed
+
+# A page converted as it downloaded: the sha256 and UTF-8 size of its
+# decoded HTML (as build_manifest.sha256_text would hash it) and the
+# (markdown, metrics) of markdown_converter.html_to_markdown_timed()
+StreamedPage = namedtuple("StreamedPage", ["html_sha256", "html_bytes", "markdown", "metrics"])
+
+
+class IncrementalHtmlDecoder:
+    """Decode a body chunk by chunk, in encoding or (None) its <meta charset>
+
+    Multi-byte characters split between chunks are held back until the
+    rest arrives. When sniffing, nothing is decoded before SNIFF_BYTES have
+    been seen or the body ends.
+    """
+
+    def __init__(self, encoding=DEFAULT_ENCODING):
+        self.encoding = encoding
+        self._head = b''
+        self._decoder = None
+        if encoding is not None:
+            self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+
+    def decode(self, chunk, final=False):
+        if self._decoder is None:
+            self._head += chunk
+            if len(self._head) < SNIFF_BYTES and not final:
+                return ''
+            self.encoding = sniff_charset(self._head) or DEFAULT_ENCODING
+            self._decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+            chunk, self._head = self._head, b''
+        return self._decoder.decode(chunk, final)
+
+
+class ChunkedConverter(StreamingConverter):
+    """StreamingConverter that notices pages it cannot be fed in chunks
+
+    html.parser ends its pass over the buffer after a "&#" that is not a
+    character reference. Fed the whole page, that leaves the rest to
+    close(), where a second such "&#" turns everything after it into text;
+    fed in chunks, every feed() starts a new pass and carries on parsing.
+    The "&#" is handed over as data of its own, which is what is watched for.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunk_safe = True
+
+    def handle_data(self, data):
+        if data == '&#':
+            self.chunk_safe = False
+        super().handle_data(data)
+
+
+def _decoded(chunks, encoding):
+    decoder = IncrementalHtmlDecoder(encoding)
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def convert_chunks(chunks, read_html, encoding=DEFAULT_ENCODING, rules=()):
+    """StreamedPage of a page arriving as byte chunks
+
+    Every chunk is decoded and fed to the converter before the next one is
+    read. read_html() returns the whole page as text; it is only called for
+    pages that have to be converted in one piece. rules are the
+    markdown_converter.LINE_RULES the output lines are normalized with.
+    """
+    clock = time.perf_counter
+    converter = ChunkedConverter()
+    digest = hashlib.sha256()
+    html_bytes = 0
+    parse_seconds = 0.0
+    # The converter stops listening once div#content closes, but the rest
+    # of the body is still read: it belongs to the cached page and its hash
+    for text in _decoded(chunks, encoding):
+        encoded = text.encode('utf-8')
+        digest.update(encoded)
+        html_bytes += len(encoded)
+        if converter.chunk_safe:
+            start = clock()
+            converter.feed(text)
+            parse_seconds += clock() - start
+    if converter.chunk_safe:
+        start = clock()
+        converter.close()
+        parse_seconds += clock() - start
+        markdown, metrics = converted_markdown_timed(converter, parse_seconds, html_bytes,
+                                                     read_html, rules)
+    else:
+        markdown, metrics = html_to_markdown_timed(read_html(), rules=rules)
+    return StreamedPage(digest.hexdigest(), html_bytes, markdown, metrics)
+
+
+def streamed_fetch(cache, chunk_size=CHUNK_SIZE, rules=()):
+    """fetch(url) that downloads through cache and converts while it does
+
+    A page with nothing to download (a 304, or offline) is returned as
+    text, like cache.fetch_html() would: the pipeline then checks the
+    manifest and converts it only if its output is out of date.
+    """
+    def fetch(url):
+        body, chunks = cache.open_bytes(url, chunk_size)
+        if chunks is None:
+            return cache.decode(body)
+        return convert_chunks(chunks, lambda: cache.read_html(url), cache.encoding, rules)
+    return fetch